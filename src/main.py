@@ -1,13 +1,24 @@
 import os
 import sys
+import time
+import click
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))  # DON'T CHANGE THIS !!!
+boot_started = time.perf_counter()
 
-from flask import Flask, render_template, send_from_directory, jsonify, session
+from flask import Blueprint, Flask, current_app, render_template, send_from_directory, jsonify, session
 from flask_login import LoginManager, current_user, login_user
 from flask_cors import CORS
+from sqlalchemy.orm import configure_mappers
 from werkzeug.middleware.proxy_fix import ProxyFix
 from src.models import db
+from src.models.schema import migrate, pending_migrations, query_plans, plan_report
 from src.models.user import User
+from src.models.rollup import ReportRollup, rebuild_rollups
+from src.models.changes import prune_changes, RETENTION_DAYS
+from src.services.cache import response_cache
+from src.services.identity import identity_cache
+from src.services.unit_of_work import unit_of_work
+from src.services.events import change_events
 from src.routes.user import user_bp
 from src.routes.client import client_bp
 from src.routes.quote import quote_bp
@@ -15,62 +26,125 @@ from src.routes.job import job_bp
 from src.routes.staff import staff_bp
 from src.routes.payment import payment_bp
 from src.routes.report import report_bp
+from src.routes.change import change_bp
 
-app = Flask(__name__, 
-             static_folder='static',
-             static_url_path='/static')
-
-# Apply ProxyFix to handle proxy headers from Railway
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
-             
-# Enable CORS with credentials support
-CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}})
-
-# Enable debug mode
-app.debug = True
-
-# Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-testing')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///cabinetry_scheduler.db')
-if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
-    app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Session configuration
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = None  # Changed from 'Lax' to None for cross-domain cookies
-app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 hours in seconds
-app.config['SESSION_TYPE'] = 'filesystem'  # Use filesystem session for better persistence
-app.config['SESSION_COOKIE_NAME'] = 'cabinetry_session'  # Custom session name
-app.config['SESSION_COOKIE_DOMAIN'] = None  # Allow the browser to set this automatically
-
-# Initialize extensions
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = None  # Disable automatic redirects
 login_manager.session_protection = None  # Disable session protection temporarily for debugging
 
+# App-level routes, error handlers and CLI commands
+main_bp = Blueprint('main', __name__, cli_group=None)
+
+# Optional work done once per process at boot instead of on the first request,
+# selected with WARMUP (comma separated names). None of it runs by default.
+WARMUP_HOOKS = {}
+
+def warmup_hook(name):
+    def decorator(hook):
+        WARMUP_HOOKS[name] = hook
+        return hook
+    return decorator
+
+@warmup_hook('mappers')
+def warm_mappers(app):
+    """Configure the ORM mappers"""
+    configure_mappers()
+
+@warmup_hook('db')
+def warm_db_pool(app):
+    """Open a pooled database connection"""
+    with app.app_context():
+        db.engine.connect().close()
+
+def create_app(config=None):
+    """Build the application. Touches no database unless a 'db' warmup is asked for."""
+    started = time.perf_counter()
+    app = Flask(__name__, 
+                 static_folder='static',
+                 static_url_path='/static')
+    
+    # Apply ProxyFix to handle proxy headers from Railway
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+                 
+    # Enable CORS with credentials support
+    CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}},
+         expose_headers=['X-Next-Cursor', 'ETag'])
+    
+    # Enable debug mode
+    app.debug = True
+    
+    # Configuration
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///cabinetry_scheduler.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Report response cache: 'memory' (per worker), 'file' (shared by all workers) or 'none'
+    app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+    app.config['RESPONSE_CACHE_DIR'] = os.environ.get('RESPONSE_CACHE_DIR')
+    app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+    
+    # Seconds a worker trusts its copy of a logged in user (0 reloads it on every request)
+    app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    
+    # Change event stream broker: 'memory' (per worker), 'file' (shared by all workers) or 'none'
+    app.config['CHANGE_EVENTS_BROKER'] = os.environ.get('CHANGE_EVENTS_BROKER', 'memory')
+    app.config['CHANGE_EVENTS_DIR'] = os.environ.get('CHANGE_EVENTS_DIR')
+    app.config['CHANGE_EVENTS_MAX_STREAMS'] = int(os.environ.get('CHANGE_EVENTS_MAX_STREAMS', 8))
+    
+    # Boot-time warmups, e.g. WARMUP=mappers,db
+    app.config['WARMUP'] = os.environ.get('WARMUP', '')
+    
+    # Session configuration
+    app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = None  # Changed from 'Lax' to None for cross-domain cookies
+    app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 hours in seconds
+    app.config['SESSION_TYPE'] = 'filesystem'  # Use filesystem session for better persistence
+    app.config['SESSION_COOKIE_NAME'] = 'cabinetry_session'  # Custom session name
+    app.config['SESSION_COOKIE_DOMAIN'] = None  # Allow the browser to set this automatically
+    
+    if config:
+        app.config.update(config)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://')
+    
+    # Initialize extensions
+    db.init_app(app)
+    response_cache.init_app(app)
+    identity_cache.init_app(app)
+    unit_of_work.init_app(app)
+    change_events.init_app(app)
+    login_manager.init_app(app)
+    
+    # Register blueprints
+    app.register_blueprint(main_bp)
+    app.register_blueprint(user_bp, url_prefix='/api/users')
+    app.register_blueprint(client_bp, url_prefix='/api/clients')
+    app.register_blueprint(quote_bp, url_prefix='/api/quotes')
+    app.register_blueprint(job_bp, url_prefix='/api/jobs')
+    app.register_blueprint(staff_bp, url_prefix='/api/staff')
+    app.register_blueprint(payment_bp, url_prefix='/api/payments')
+    app.register_blueprint(report_bp, url_prefix='/api/reports')
+    app.register_blueprint(change_bp)
+    
+    for name in filter(None, (name.strip() for name in app.config['WARMUP'].split(','))):
+        if name not in WARMUP_HOOKS:
+            raise ValueError(f'Unknown WARMUP hook: {name}')
+        WARMUP_HOOKS[name](app)
+    
+    app.config['BOOT_SECONDS'] = round(time.perf_counter() - started, 4)
+    return app
+
 @login_manager.unauthorized_handler
 def unauthorized():
     return jsonify({"error": "Unauthorized access", "login_required": True}), 401
 
-# Register blueprints
-app.register_blueprint(user_bp, url_prefix='/api/users')
-app.register_blueprint(client_bp, url_prefix='/api/clients')
-app.register_blueprint(quote_bp, url_prefix='/api/quotes')
-app.register_blueprint(job_bp, url_prefix='/api/jobs')
-app.register_blueprint(staff_bp, url_prefix='/api/staff')
-app.register_blueprint(payment_bp, url_prefix='/api/payments')
-app.register_blueprint(report_bp, url_prefix='/api/reports')
-
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity_cache.load(int(user_id))
 
 # Modified login route in user_bp to set session cookie flags
-@app.route('/api/users/login-test', methods=['POST'])
+@main_bp.route('/api/users/login-test', methods=['POST'])
 def login_test():
     """Test login endpoint with explicit session handling"""
     from flask import request
@@ -98,28 +172,33 @@ def login_test():
     
     return jsonify({'error': 'Invalid username or password'}), 401
 
-@app.route('/login')
+@main_bp.route('/login')
 def login():
     # This route should not require authentication
     return send_from_directory('static', 'index.html')
 
-@app.route('/test')
+@main_bp.route('/test')
 def test():
     return jsonify({"status": "ok", "message": "Test route is working"})
 
-@app.route('/')
+@main_bp.route('/')
 def index():
     return send_from_directory('static', 'index.html')
 
-@app.route('/<path:path>')
+@main_bp.route('/<path:path>')
 def static_files(path):
     return send_from_directory('static', path)
 
-@app.route('/api/health')
+@main_bp.route('/api/health')
 def health_check():
-    return jsonify({'status': 'ok'})
+    # Answered without touching the database, so it is cheap to poll
+    return jsonify({
+        'status': 'ok',
+        'boot_seconds': current_app.config['BOOT_SECONDS'],
+        'import_seconds': current_app.config.get('IMPORT_SECONDS')
+    })
 
-@app.route('/api/session-debug')
+@main_bp.route('/api/session-debug')
 def session_debug():
     """Debug endpoint to check session state"""
     return jsonify({
@@ -127,28 +206,60 @@ def session_debug():
         'user_id': current_user.id if current_user.is_authenticated else None,
         'session_vars': {key: session[key] for key in session if key != '_flashes'},
         'session_cookie_config': {
-            'secure': app.config['SESSION_COOKIE_SECURE'],
-            'httponly': app.config['SESSION_COOKIE_HTTPONLY'],
-            'samesite': app.config['SESSION_COOKIE_SAMESITE'],
-            'domain': app.config['SESSION_COOKIE_DOMAIN'],
-            'name': app.config['SESSION_COOKIE_NAME']
+            'secure': current_app.config['SESSION_COOKIE_SECURE'],
+            'httponly': current_app.config['SESSION_COOKIE_HTTPONLY'],
+            'samesite': current_app.config['SESSION_COOKIE_SAMESITE'],
+            'domain': current_app.config['SESSION_COOKIE_DOMAIN'],
+            'name': current_app.config['SESSION_COOKIE_NAME']
         }
     })
 
-@app.errorhandler(404)
+@main_bp.app_errorhandler(404)
 def not_found(e):
     return jsonify({'error': 'Not found'}), 404
 
-@app.errorhandler(500)
+@main_bp.app_errorhandler(500)
 def server_error(e):
-    app.logger.error(f"500 error: {str(e)}")
+    current_app.logger.error(f"500 error: {str(e)}")
     return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-# Create database tables
-with app.app_context():
+@main_bp.cli.command('migrate')
+@click.option('--report', is_flag=True, help='Print query plans before and after the migrations')
+@click.option('--target', type=int, help='Stop at this schema version')
+def migrate_command(report, target):
+    """Apply pending schema migrations"""
     db.create_all()
-    
-    # Create admin user if not exists
+    pending = pending_migrations(target)
+    if not pending:
+        print('Schema is up to date')
+        return
+    before = query_plans() if report else None
+    for version, description, _ in pending:
+        print(f'Applying {version}: {description}')
+    migrate(target)
+    if report:
+        print(plan_report(before, query_plans()))
+
+@main_bp.cli.command('query-plans')
+def query_plans_command():
+    """Print the database's plans for the hot-path queries"""
+    for name, plan in query_plans().items():
+        print(f'{name}: {plan}')
+
+@main_bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the dashboard reporting rollups from scratch"""
+    rows = rebuild_rollups()
+    print(f'Rebuilt {rows} rollup rows')
+
+@main_bp.cli.command('prune-changes')
+@click.option('--days', type=int, default=RETENTION_DAYS, help='Keep this many days of changes')
+def prune_changes_command(days):
+    """Delete old entries from the change log behind /api/changes"""
+    print(f'Deleted {prune_changes(days)} change log rows')
+
+def seed_users():
+    """Create the admin and starting staff accounts on an empty users table"""
     if not User.query.filter_by(username='admin').first():
         admin = User(
             username='admin',
@@ -190,6 +301,39 @@ with app.app_context():
         
         db.session.add_all([staff1, staff2, staff3])
         db.session.commit()
+        return True
+    return False
+
+def init_database(seed=True):
+    """Create tables, apply migrations, fill empty rollups and seed users"""
+    db.create_all()
+    applied = migrate()
+    
+    # Fill the reporting rollups on first start
+    rebuilt = None
+    if not ReportRollup.query.first():
+        rebuilt = rebuild_rollups()
+    
+    seeded = seed_users() if seed else False
+    return applied, rebuilt, seeded
+
+@main_bp.cli.command('init-db')
+@click.option('--no-seed', is_flag=True, help='Do not create the default users')
+def init_db_command(no_seed):
+    """Create the database, apply migrations and seed the default users"""
+    applied, rebuilt, seeded = init_database(seed=not no_seed)
+    print(f'Applied migrations: {", ".join(map(str, applied)) or "none"}')
+    if rebuilt is not None:
+        print(f'Rebuilt {rebuilt} rollup rows')
+    if seeded:
+        print('Created the admin and staff users')
+
+app = create_app()
+app.config['IMPORT_SECONDS'] = round(time.perf_counter() - boot_started, 4)
+app.logger.info(f"Booted in {app.config['IMPORT_SECONDS']}s")
 
 if __name__ == '__main__':
+    # The development server prepares its own database
+    with app.app_context():
+        init_database()
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
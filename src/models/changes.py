@@ -0,0 +1,190 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from src.models import db
+from src.models.client import Client
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.payment import Payment
+from src.models.quote import Quote
+from src.models.staff_absence import StaffAbsence
+
+# Change log behind the /api/changes delta feed: one row per insert, update or
+# delete of a tracked row, numbered in commit order. The id is the cursor a
+# client polls from. ORM writes are recorded after every flush; bulk
+# statements skip the flush and must call record_changes() with the ids they
+# touch. Rows older than RETENTION_DAYS are pruned by 'flask prune-changes';
+# a cursor from before the oldest remaining row gets a reset. The entries a
+# transaction wrote are kept in session.info['recorded_changes'] as
+# (change id, table, row id, op) for the change event stream to publish once
+# it commits.
+
+TRACKED_MODELS = {
+    model.__tablename__: model
+    for model in [WorkshopJob, Payment, JobAssignment, StaffAbsence, Quote, Client]
+}
+UPSERT = 'upsert'
+DELETE = 'delete'
+RETENTION_DAYS = 30
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+# Key of the PostgreSQL advisory lock that keeps change ids in commit order
+ORDER_LOCK_KEY = 7260
+
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(30), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # Never reuse the ids of pruned rows: clients hold them as cursors
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+def payload_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def row_payload(obj):
+    """Compact payload of a row: its column values, dates as ISO strings"""
+    return {attr.key: payload_value(getattr(obj, attr.key)) for attr in inspect(type(obj)).column_attrs}
+
+
+def _order_writers(session, connection):
+    """Serialize writing transactions on PostgreSQL until they commit.
+
+    Sequence values are handed out before commit, so without this a reader
+    could see id 11 committed while id 10 is still pending and skip it for
+    good. Taken before the first write to a tracked table, so a writer never
+    waits for the lock while holding row locks another writer needs. SQLite
+    only ever has one writer.
+    """
+    if connection.dialect.name == 'postgresql' and not session.info.get('change_log_locked'):
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': ORDER_LOCK_KEY})
+        session.info['change_log_locked'] = True
+
+
+def record_changes(table_name, row_ids, op=UPSERT, session=None):
+    """Add change log rows; bulk statements call this with the ids they wrote"""
+    session = session or db.session()
+    row_ids = list(row_ids)
+    if not row_ids:
+        return
+    connection = session.connection()
+    _order_writers(session, connection)
+    now = datetime.utcnow()
+    # RETURNING the row id too, as asking for rows in parameter order inserts one row at a time on SQLite
+    entries = connection.execute(ChangeLog.__table__.insert().returning(ChangeLog.id, ChangeLog.row_id), [
+        {'table_name': table_name, 'row_id': row_id, 'op': op, 'changed_at': now} for row_id in row_ids
+    ])
+    session.info.setdefault('recorded_changes', []).extend(
+        (change_id, table_name, row_id, op) for change_id, row_id in entries
+    )
+
+
+@event.listens_for(Session, 'before_flush')
+def order_flushing_writers(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if getattr(obj, '__tablename__', None) in TRACKED_MODELS:
+            _order_writers(session, session.connection())
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def order_bulk_writers(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.local_table.name in TRACKED_MODELS:
+            session = orm_execute_state.session
+            _order_writers(session, session.connection())
+
+
+@event.listens_for(Session, 'after_flush')
+def record_flushed_changes(session, flush_context):
+    changes = {}
+    for obj in list(session.new) + [obj for obj in session.dirty if session.is_modified(obj)]:
+        table_name = getattr(obj, '__tablename__', None)
+        if table_name in TRACKED_MODELS:
+            changes.setdefault((table_name, UPSERT), []).append(obj.id)
+    for obj in session.deleted:
+        table_name = getattr(obj, '__tablename__', None)
+        if table_name in TRACKED_MODELS:
+            changes.setdefault((table_name, DELETE), []).append(obj.id)
+    for (table_name, op), row_ids in changes.items():
+        record_changes(table_name, row_ids, op, session=session)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def release_order_lock(session):
+    # pg_advisory_xact_lock is released with the transaction
+    session.info.pop('change_log_locked', None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_rolled_back_changes(session):
+    session.info.pop('recorded_changes', None)
+
+
+def latest_cursor():
+    return db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+
+
+def changes_since(cursor, limit=DEFAULT_LIMIT):
+    """Changes after the cursor, oldest first, one per row.
+
+    Returns (changes, next_cursor, more), or None when the log no longer
+    reaches back to the cursor and the client has to reload everything.
+    Each change is {'table', 'id', 'op', 'row'}; row is the current compact
+    payload for upserts. A row updated several times is reported once, and
+    an upserted row that has since disappeared is reported as a delete.
+    """
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    if oldest is not None and cursor < oldest - 1:
+        return None
+
+    entries = ChangeLog.query.filter(ChangeLog.id > cursor).order_by(ChangeLog.id).limit(limit + 1).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    if not entries:
+        return [], cursor, False
+
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.table_name, entry.row_id), None)
+        latest[(entry.table_name, entry.row_id)] = entry.op
+
+    rows = {}
+    for table_name, model in TRACKED_MODELS.items():
+        ids = [row_id for (name, row_id), op in latest.items() if name == table_name and op == UPSERT]
+        if ids:
+            for obj in model.query.filter(model.id.in_(ids)):
+                rows[(table_name, obj.id)] = row_payload(obj)
+
+    changes = []
+    for (table_name, row_id), op in latest.items():
+        row = rows.get((table_name, row_id)) if op == UPSERT else None
+        changes.append({
+            'table': table_name,
+            'id': row_id,
+            'op': UPSERT if row is not None else DELETE,
+            'row': row
+        })
+    return changes, entries[-1].id, more
+
+
+def prune_changes(days=RETENTION_DAYS):
+    """Delete change log rows older than the given number of days.
+
+    The newest row is always kept, so the log still shows how far it reaches.
+    """
+    deleted = ChangeLog.query.filter(
+        ChangeLog.changed_at < datetime.utcnow() - timedelta(days=days),
+        ChangeLog.id < latest_cursor()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
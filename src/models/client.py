@@ -1,6 +1,8 @@
 from src.models.user import db
 from datetime import datetime
 
+EMPTY_AGGREGATES = {'job_count': 0, 'lifetime_spend': 0}
+
 class Client(db.Model):
     __tablename__ = 'clients'
     
@@ -18,7 +20,10 @@ class Client(db.Model):
     quotes = db.relationship('Quote', back_populates='client', lazy='dynamic')
     jobs = db.relationship('WorkshopJob', back_populates='client', lazy='dynamic')
     
-    def to_dict(self):
+    def to_dict(self, aggregates=None):
+        """Serialize the client; pass precomputed job aggregates to avoid a query"""
+        if aggregates is None:
+            aggregates = Client.job_aggregates([self.id]).get(self.id, EMPTY_AGGREGATES)
         return {
             'id': self.id,
             'name': self.name,
@@ -29,13 +34,28 @@ class Client(db.Model):
             'xero_client_id': self.xero_client_id,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'lifetime_spend': self.calculate_lifetime_spend(),
-            'job_count': self.jobs.count()
+            'lifetime_spend': aggregates['lifetime_spend'],
+            'job_count': aggregates['job_count']
         }
     
     def calculate_lifetime_spend(self):
-        total = 0
-        for job in self.jobs:
-            if job.job_price:
-                total += job.job_price
-        return total
+        return Client.job_aggregates([self.id]).get(self.id, EMPTY_AGGREGATES)['lifetime_spend']
+    
+    @staticmethod
+    def job_aggregates(client_ids):
+        """Job count and lifetime spend for many clients in one grouped query"""
+        from src.models.job import WorkshopJob
+        
+        if not client_ids:
+            return {}
+        rows = db.session.query(
+            WorkshopJob.client_id,
+            db.func.count(WorkshopJob.id),
+            db.func.coalesce(db.func.sum(WorkshopJob.job_price), 0)
+        ).filter(
+            WorkshopJob.client_id.in_(client_ids)
+        ).group_by(WorkshopJob.client_id).all()
+        return {
+            client_id: {'job_count': job_count, 'lifetime_spend': lifetime_spend}
+            for client_id, job_count, lifetime_spend in rows
+        }
@@ -0,0 +1,98 @@
+import hashlib
+from datetime import datetime
+from flask import request, make_response
+from src.models import db
+from src.models.user import User
+from src.models.client import Client
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.payment import Payment
+from src.models.quote import Quote, QuoteExtra
+
+
+def scope_state(*queries):
+    """Row count and latest updated_at of each query's rows, from a single SELECT.
+
+    Inserts and deletes change the count; updates (ORM or bulk) move
+    updated_at forward through its onupdate default.
+    """
+    columns = []
+    for query in queries:
+        model = query.column_descriptions[0]['entity']
+        query = query.order_by(None)
+        columns.append(query.with_entities(db.func.count(model.id)).scalar_subquery())
+        columns.append(query.with_entities(db.func.max(model.updated_at)).scalar_subquery())
+    return tuple(db.session.execute(db.select(*columns)).one())
+
+
+def etag_for(*queries):
+    """ETag for the current request path over the state of the queries.
+
+    Today's date is included because some payloads (job status) depend on it.
+    """
+    key = repr((request.full_path, datetime.now().date().isoformat(), scope_state(*queries)))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+# Scope builders: everything a payload shape reads, given the query for its main rows
+
+def job_scopes(jobs):
+    """Jobs with their assignments and payments, plus client and staff names"""
+    job_ids = jobs.with_entities(WorkshopJob.id)
+    return [
+        jobs,
+        JobAssignment.query.filter(JobAssignment.job_id.in_(job_ids)),
+        Payment.query.filter(Payment.job_id.in_(job_ids)),
+        Client.query,
+        User.query
+    ]
+
+
+def calendar_scopes(start_date, end_date):
+    """Jobs with a stage in the range and their teams, plus client and staff names"""
+    jobs = WorkshopJob.query.filter(WorkshopJob.overlaps_window(start_date, end_date))
+    return [
+        jobs,
+        JobAssignment.query.filter(JobAssignment.job_id.in_(jobs.with_entities(WorkshopJob.id))),
+        Client.query,
+        User.query
+    ]
+
+
+def quote_scopes(quotes):
+    """Quotes with their extras and converted jobs, plus client names"""
+    quote_ids = quotes.with_entities(Quote.id)
+    return [
+        quotes,
+        QuoteExtra.query.filter(QuoteExtra.quote_id.in_(quote_ids)),
+        WorkshopJob.query.filter(WorkshopJob.quote_id.in_(quote_ids)),
+        Client.query
+    ]
+
+
+def client_scopes(clients):
+    """Clients with the jobs behind their job count and lifetime spend"""
+    return [clients, WorkshopJob.query.filter(WorkshopJob.client_id.in_(clients.with_entities(Client.id)))]
+
+
+def payment_scopes(payments):
+    """Payments plus job and client names"""
+    return [payments, WorkshopJob.query, Client.query]
+
+
+def conditional_response(queries, build):
+    """Answer If-None-Match with an empty 304 when nothing in scope changed.
+
+    Otherwise calls build() for the response and tags successful ones with
+    the ETag. Clients are told to revalidate on every use (no-cache).
+    """
+    etag = etag_for(*queries)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
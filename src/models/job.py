@@ -1,30 +1,59 @@
 from src.models.user import db
-from datetime import datetime
+from sqlalchemy.ext.hybrid import hybrid_property
+from datetime import datetime, timedelta
+
+# Scheduling defaults used when a job has no explicit durations
+DEFAULT_BUILD_DAYS = 7
+DEFAULT_FITTING_DAYS = 3
+SPRAY_DAYS = 5
+SNAG_DAYS = 2
+
+# Payment types whose due date follows a job date when the job is rescheduled
+RESCHEDULED_PAYMENTS = {
+    'Build Installment': 'build_start_date',
+    'Fitting Installment': 'fitting_date',
+    'Completion': 'fitting_date'
+}
+
+def builders_for(estimated_build_days):
+    """Number of builders to assign: 2 for long builds, otherwise 1"""
+    return 2 if (estimated_build_days or 0) > 10 else 1
 
 class WorkshopJob(db.Model):
     __tablename__ = 'workshop_jobs'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
     quote_id = db.Column(db.Integer, db.ForeignKey('quotes.id'))
     cabinetry_type = db.Column(db.String(50), nullable=False)  # Kitchen, Wardrobe, Media Wall, etc.
     build_start_date = db.Column(db.Date)
     build_duration_days = db.Column(db.Integer)
-    stage = db.Column(db.String(20), default='Not Started')  # Not Started, Planned, Build, Spray, Fit, Snag, Finished
+    stage = db.Column(db.String(20), default='Not Started', index=True)  # Not Started, Planned, Build, Spray, Fit, Snag, Finished
     actual_build_days = db.Column(db.Integer)
     actual_fitting_days = db.Column(db.Integer)
     booking_date = db.Column(db.Date)
     fitting_date = db.Column(db.Date)
     job_price = db.Column(db.Float)
     fitting_date_status = db.Column(db.String(20), default='Planned')  # Planned, Provisional, Confirmed
-    client_needs_update = db.Column(db.Boolean, default=False)
+    client_needs_update = db.Column(db.Boolean, default=False, index=True)
     client_contacted = db.Column(db.Boolean, default=False)
     estimated_build_days = db.Column(db.Integer)
     estimated_fitting_days = db.Column(db.Integer)
+    # Stage windows derived from the dates and durations above (see update_stage_windows)
+    build_end_date = db.Column(db.Date)
+    spray_start_date = db.Column(db.Date)
+    spray_end_date = db.Column(db.Date)
+    fit_start_date = db.Column(db.Date)
+    fit_end_date = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_workshop_jobs_build_window', 'build_start_date', 'spray_end_date'),
+        db.Index('ix_workshop_jobs_fit_window', 'fit_start_date', 'fit_end_date'),
+    )
+    
     # Relationships
     client = db.relationship('Client', back_populates='jobs')
     quote = db.relationship('Quote', back_populates='job')
@@ -32,11 +61,12 @@ class WorkshopJob(db.Model):
     payments = db.relationship('Payment', back_populates='job', cascade='all, delete-orphan')
     
     def to_dict(self):
+        client_name = self.client.name if self.client else None
         return {
             'id': self.id,
             'name': self.name,
             'client_id': self.client_id,
-            'client_name': self.client.name if self.client else None,
+            'client_name': client_name,
             'quote_id': self.quote_id,
             'cabinetry_type': self.cabinetry_type,
             'build_start_date': self.build_start_date.isoformat() if self.build_start_date else None,
@@ -56,10 +86,108 @@ class WorkshopJob(db.Model):
             'updated_at': self.updated_at.isoformat(),
             'build_team': [assignment.user.full_name for assignment in self.get_build_team()],
             'fit_team': [assignment.user.full_name for assignment in self.get_fit_team()],
-            'payments': [payment.to_dict() for payment in self.payments],
+            # Payments reuse this job's already-loaded name and client
+            'payments': [payment.to_dict(job_name=self.name, client_name=client_name) for payment in self.payments],
             'status': self.calculate_status()
         }
     
+    def build_window(self):
+        """(start, end) dates of the build stage, or None if not scheduled"""
+        if not self.build_start_date:
+            return None
+        build_days = self.build_duration_days or self.estimated_build_days or DEFAULT_BUILD_DAYS
+        return (self.build_start_date, self.build_start_date + timedelta(days=build_days))
+    
+    def fit_window(self):
+        """(start, end) dates of the booked fit, or None if no fitting date is set"""
+        if not self.fitting_date:
+            return None
+        fitting_days = self.estimated_fitting_days or DEFAULT_FITTING_DAYS
+        return (self.fitting_date, self.fitting_date + timedelta(days=fitting_days))
+    
+    def schedule_windows(self):
+        """Return the (start, end) dates of each stage, keyed by stage name.
+        
+        Spray starts on the last day of build and lasts SPRAY_DAYS; fit starts on the
+        booked fitting date, or the day after spray. Snag is only included while the
+        job is in snag. Returns an empty dict for jobs without a build start date.
+        """
+        if not self.build_start_date:
+            return {}
+        
+        build_start, build_end = self.build_window()
+        spray_start = build_end - timedelta(days=1)
+        spray_end = spray_start + timedelta(days=SPRAY_DAYS)
+        fit_start, fit_end = self.fit_window() or (
+            spray_end + timedelta(days=1),
+            spray_end + timedelta(days=1 + (self.estimated_fitting_days or DEFAULT_FITTING_DAYS))
+        )
+        
+        windows = {
+            'Build': (build_start, build_end),
+            'Spray': (spray_start, spray_end),
+            'Fit': (fit_start, fit_end)
+        }
+        if self.stage == 'Snag':
+            windows['Snag'] = (fit_end, fit_end + timedelta(days=SNAG_DAYS))
+        return windows
+    
+    def update_stage_windows(self):
+        """Recompute the stored stage window columns from the job's dates and durations.
+        
+        Called automatically before every insert and update. Jobs without a build
+        start date only get fit columns, from the booked fitting date.
+        """
+        windows = self.schedule_windows()
+        build = windows.get('Build', (self.build_start_date, None))
+        spray = windows.get('Spray', (None, None))
+        fit = windows.get('Fit') or self.fit_window() or (None, None)
+        self.build_end_date = build[1]
+        self.spray_start_date, self.spray_end_date = spray
+        self.fit_start_date, self.fit_end_date = fit
+    
+    @classmethod
+    def build_overlaps(cls, start_date, end_date):
+        """SQL criterion: build_window() overlaps [start_date, end_date]"""
+        return db.and_(
+            cls.build_start_date <= end_date,
+            cls.build_end_date >= start_date
+        )
+    
+    @classmethod
+    def fit_overlaps(cls, start_date, end_date):
+        """SQL criterion: fit_window() overlaps [start_date, end_date]"""
+        return db.and_(
+            cls.fitting_date.isnot(None),
+            cls.fit_start_date <= end_date,
+            cls.fit_end_date >= start_date
+        )
+    
+    @classmethod
+    def overlaps_window(cls, start_date, end_date):
+        """SQL criterion: any stage window of the job overlaps [start_date, end_date].
+        
+        Mirrors schedule_windows(); build and spray form one contiguous span, and
+        jobs in snag extend SNAG_DAYS past the end of the fit.
+        """
+        return db.and_(
+            cls.build_start_date.isnot(None),
+            db.or_(
+                db.and_(cls.build_start_date <= end_date, cls.spray_end_date >= start_date),
+                db.and_(
+                    cls.fit_start_date <= end_date,
+                    db.or_(
+                        cls.fit_end_date >= start_date,
+                        db.and_(cls.stage == 'Snag', cls.fit_end_date >= start_date - timedelta(days=SNAG_DAYS))
+                    )
+                )
+            )
+        )
+    
+    def required_builders(self):
+        """Number of builders to assign: 2 for long builds, otherwise 1"""
+        return builders_for(self.estimated_build_days)
+    
     def get_build_team(self):
         return [a for a in self.assignments if a.role == 'Build Team']
         
@@ -84,7 +212,7 @@ class WorkshopJob(db.Model):
             
         # Check if we're behind schedule
         if self.stage == 'Build' and self.build_start_date and self.build_duration_days:
-            expected_end = self.build_start_date + datetime.timedelta(days=self.build_duration_days)
+            expected_end = self.build_start_date + timedelta(days=self.build_duration_days)
             if today > expected_end:
                 return 'Delayed'
                 
@@ -93,79 +221,62 @@ class WorkshopJob(db.Model):
             
         return 'On Track'
     
-    def generate_payment_schedule(self):
-        """Generate payment schedule based on job type and price"""
-        if not self.job_price:
-            return
+    @hybrid_property
+    def status(self):
+        return self.calculate_status()
+    
+    @status.expression
+    def status(cls):
+        """SQL CASE mirroring calculate_status(), evaluated against today's date"""
+        today = datetime.now().date()
+        return db.case(
+            (cls.stage == 'Finished', 'Completed'),
+            (cls.stage == 'Snag', 'Issue'),
+            (cls.build_start_date.is_(None), 'Not Scheduled'),
+            (cls.build_start_date > today, 'Scheduled'),
+            # With an explicit duration, build_end_date is build start + duration
+            (db.and_(
+                cls.stage == 'Build',
+                cls.build_duration_days.isnot(None),
+                cls.build_end_date < today
+            ), 'Delayed'),
+            (db.and_(cls.stage == 'Fit', cls.fitting_date < today), 'Delayed'),
+            else_='On Track'
+        )
+    
+    def reschedule(self, build_start_date=None, fitting_date=None):
+        """Move the job's dates and realign the matching payment due dates.
+        
+        A changed fitting date flags the client for an update. Does not commit.
+        """
+        if build_start_date:
+            self.build_start_date = build_start_date
+        
+        if fitting_date:
+            old_fitting_date = self.fitting_date
+            self.fitting_date = fitting_date
             
-        from src.models.payment import Payment
+            # Flag client for update if fitting date changed
+            if old_fitting_date != self.fitting_date:
+                self.client_needs_update = True
+                self.client_contacted = False
         
-        # Delete existing payments
+        # Update payment due dates
         for payment in self.payments:
-            db.session.delete(payment)
-            
-        # Create new payment schedule
-        if self.cabinetry_type.lower() == 'kitchen':
-            # Kitchens: 10% deposit, 40% build, 40% fit, 10% completion
-            deposit = Payment(
-                job_id=self.id,
-                type='Deposit',
-                amount=self.job_price * 0.1,
-                due_date=self.booking_date,
-                status='Due'
-            )
-            
-            build = Payment(
-                job_id=self.id,
-                type='Build Installment',
-                amount=self.job_price * 0.4,
-                due_date=self.build_start_date,
-                status='Due'
-            )
-            
-            fit = Payment(
-                job_id=self.id,
-                type='Fitting Installment',
-                amount=self.job_price * 0.4,
-                due_date=self.fitting_date,
-                status='Due'
-            )
-            
-            completion = Payment(
-                job_id=self.id,
-                type='Completion',
-                amount=self.job_price * 0.1,
-                due_date=self.fitting_date,  # Will be updated when job is completed
-                status='Due'
-            )
-            
-            db.session.add_all([deposit, build, fit, completion])
-        else:
-            # Cabinetry: 50% deposit, 40% fit, 10% completion
-            deposit = Payment(
-                job_id=self.id,
-                type='Deposit',
-                amount=self.job_price * 0.5,
-                due_date=self.booking_date,
-                status='Due'
-            )
-            
-            fit = Payment(
-                job_id=self.id,
-                type='Fitting Installment',
-                amount=self.job_price * 0.4,
-                due_date=self.fitting_date,
-                status='Due'
-            )
-            
-            completion = Payment(
-                job_id=self.id,
-                type='Completion',
-                amount=self.job_price * 0.1,
-                due_date=self.fitting_date,  # Will be updated when job is completed
-                status='Due'
-            )
-            
-            db.session.add_all([deposit, fit, completion])
-            
-        db.session.commit()
+            if payment.type in RESCHEDULED_PAYMENTS:
+                payment.due_date = getattr(self, RESCHEDULED_PAYMENTS[payment.type])
+    
+    def generate_payment_schedule(self):
+        """Generate payment schedule from the payment rules for the job's cabinetry type.
+        
+        Leaves the payments alone when they already match the price and dates.
+        """
+        from src.services.payment_schedule import regenerate_job_schedule
+        
+        return regenerate_job_schedule(self)
+
+
+@db.event.listens_for(WorkshopJob, 'before_insert')
+@db.event.listens_for(WorkshopJob, 'before_update')
+def sync_stage_windows(mapper, connection, target):
+    target.update_stage_windows()
@@ -5,8 +5,8 @@ class JobAssignment(db.Model):
     __tablename__ = 'job_assignments'
     
     id = db.Column(db.Integer, primary_key=True)
-    job_id = db.Column(db.Integer, db.ForeignKey('workshop_jobs.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('workshop_jobs.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     role = db.Column(db.String(20), nullable=False)  # Build Team, Fit Team
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -15,6 +15,20 @@ class JobAssignment(db.Model):
     job = db.relationship('WorkshopJob', back_populates='assignments')
     user = db.relationship('User', back_populates='job_assignments')
     
+    def window(self):
+        """(start, end) dates this assignment occupies the staff member, or None.
+        
+        Build Team covers the build stage; Fit Team covers the fit stage once a
+        fitting date has been booked.
+        """
+        if not self.job:
+            return None
+        if self.role == 'Build Team':
+            return self.job.build_window()
+        if self.role == 'Fit Team':
+            return self.job.fit_window()
+        return None
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,44 @@
+from sqlalchemy.orm import joinedload, selectinload
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.payment import Payment
+from src.models.quote import Quote
+
+# Loader strategy profiles, one per endpoint shape.
+# Many-to-one relationships are joined into the main query, collections are
+# fetched with one extra SELECT ... IN per relationship, so the number of
+# queries stays fixed no matter how many rows are returned.
+LOADER_PROFILES = {
+    # Full job payload: client, build/fit teams and payment schedule
+    'job_detail': (
+        joinedload(WorkshopJob.client),
+        selectinload(WorkshopJob.assignments).joinedload(JobAssignment.user),
+        selectinload(WorkshopJob.payments),
+    ),
+    # Gantt schedule only needs the client name
+    'job_schedule': (
+        joinedload(WorkshopJob.client),
+    ),
+    # Calendar needs the client name and the assigned teams
+    'job_calendar': (
+        joinedload(WorkshopJob.client),
+        selectinload(WorkshopJob.assignments).joinedload(JobAssignment.user),
+    ),
+    # Payment list shows job and client names
+    'payment_list': (
+        joinedload(Payment.job).joinedload(WorkshopJob.client),
+    ),
+    # Quote list: client name, extras and the job a quote was converted to
+    'quote_list': (
+        joinedload(Quote.client),
+        selectinload(Quote.extras),
+        selectinload(Quote.job),
+    ),
+}
+
+LOADER_PROFILES['job_list'] = LOADER_PROFILES['job_detail']
+
+
+def with_profile(query, profile):
+    """Apply the named loader profile to a query"""
+    return query.options(*LOADER_PROFILES[profile])
@@ -0,0 +1,136 @@
+from datetime import datetime
+from flask import jsonify
+from sqlalchemy import and_, or_
+from src.models import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_bool(value):
+    return value.lower() in ['1', 'true', 'yes']
+
+
+# Filter builders: each takes a column and returns a function that turns the
+# raw query string value into a SQL criterion.
+
+def eq_filter(column, convert=str):
+    return lambda value: column == convert(value)
+
+
+def in_filter(column, convert=str):
+    """Comma separated list, e.g. ?stage=Build,Spray"""
+    return lambda value: column.in_([convert(v) for v in value.split(',') if v])
+
+
+def from_filter(column):
+    """Inclusive lower date bound"""
+    return lambda value: column >= parse_date(value)
+
+
+def to_filter(column):
+    """Inclusive upper date bound"""
+    return lambda value: column <= parse_date(value)
+
+
+def bool_filter(column):
+    return lambda value: column.is_(parse_bool(value))
+
+
+def apply_filters(query, args, filters):
+    """Apply every filter whose argument is present in the query string"""
+    for name, build in filters.items():
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            query = query.filter(build(value))
+        except ValueError:
+            raise ValueError(f'Invalid value for {name}: {value}')
+    return query
+
+
+def paginate(query, model, args, sort_keys, filters=None, default_sort='id'):
+    """Filter, sort and keyset-paginate a query from request arguments.
+
+    Supports ?after=<id>&limit=<n>&sort=<key> (prefix the key with '-' to sort
+    descending). Rows are always ordered by (sort key, id) so the order is
+    stable; NULL sort values come last in both directions. The cursor is the
+    id of the last row on the previous page.
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for invalid arguments.
+    """
+    if filters:
+        query = apply_filters(query, args, filters)
+
+    sort = args.get('sort', default_sort)
+    descending = sort.startswith('-')
+    sort_name = sort.lstrip('-')
+    if sort_name != 'id' and sort_name not in sort_keys:
+        raise ValueError(f'Invalid sort key: {sort_name}')
+    sort_column = sort_keys.get(sort_name, model.id)
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    after = args.get('after')
+    if after:
+        try:
+            after = int(after)
+        except ValueError:
+            raise ValueError('after must be an integer id')
+        query = query.filter(_after_criterion(model, sort_column, after, descending))
+
+    if sort_column is model.id:
+        order = [model.id.desc() if descending else model.id.asc()]
+    elif descending:
+        order = [sort_column.is_(None), sort_column.desc(), model.id.desc()]
+    else:
+        order = [sort_column.is_(None), sort_column.asc(), model.id.asc()]
+
+    # Fetch one extra row to know whether there is another page
+    items = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].id
+    return items, next_cursor
+
+
+def _after_criterion(model, sort_column, after, descending):
+    """Keyset predicate for rows that come after the cursor row"""
+    if sort_column is model.id:
+        return model.id < after if descending else model.id > after
+
+    cursor_row = db.session.query(sort_column).filter(model.id == after).first()
+    if cursor_row is None:
+        raise ValueError(f'Unknown cursor: {after}')
+    cursor_value = cursor_row[0]
+    id_after = model.id < after if descending else model.id > after
+    if cursor_value is None:
+        # Cursor row sits in the trailing NULL block
+        return and_(sort_column.is_(None), id_after)
+
+    value_after = sort_column < cursor_value if descending else sort_column > cursor_value
+    return or_(
+        sort_column.is_(None),
+        value_after,
+        and_(sort_column == cursor_value, id_after)
+    )
+
+
+def paginated_response(items, next_cursor, serialize=None):
+    """JSON array response with the next page cursor in the X-Next-Cursor header"""
+    serialize = serialize or (lambda item: item.to_dict())
+    response = jsonify([serialize(item) for item in items])
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
@@ -5,12 +5,12 @@ class Payment(db.Model):
     __tablename__ = 'payments'
     
     id = db.Column(db.Integer, primary_key=True)
-    job_id = db.Column(db.Integer, db.ForeignKey('workshop_jobs.id'), nullable=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('workshop_jobs.id'), nullable=False, index=True)
     type = db.Column(db.String(30), nullable=False)  # Deposit, Build Installment, Fitting Installment, Completion
     amount = db.Column(db.Float, nullable=False)
-    due_date = db.Column(db.Date)
-    paid_date = db.Column(db.Date)
-    status = db.Column(db.String(10), default='Due')  # Due, Paid
+    due_date = db.Column(db.Date, index=True)
+    paid_date = db.Column(db.Date, index=True)
+    status = db.Column(db.String(10), default='Due', index=True)  # Due, Paid
     xero_invoice_id = db.Column(db.String(100))  # For Xero integration
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -18,11 +18,15 @@ class Payment(db.Model):
     # Relationships
     job = db.relationship('WorkshopJob', back_populates='payments')
     
-    def to_dict(self):
+    def to_dict(self, job_name=None, client_name=None):
+        """Serialize the payment, optionally with names the caller already has loaded"""
+        if job_name is None and self.job:
+            job_name = self.job.name
+            client_name = self.job.client.name if self.job.client else None
         return {
             'id': self.id,
             'job_id': self.job_id,
-            'job_name': self.job.name if self.job else None,
+            'job_name': job_name,
             'type': self.type,
             'amount': self.amount,
             'due_date': self.due_date.isoformat() if self.due_date else None,
@@ -31,16 +35,57 @@ class Payment(db.Model):
             'xero_invoice_id': self.xero_invoice_id,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'client_name': self.job.client.name if self.job and self.job.client else None
+            'client_name': client_name
         }
     
     def mark_as_paid(self, paid_date=None):
         """Mark this payment as paid"""
         self.status = 'Paid'
         self.paid_date = paid_date or datetime.now().date()
-        db.session.commit()
         
     def create_in_xero(self):
         """Create an invoice in Xero for this payment"""
         # This would be implemented when Xero integration is added
         pass
+
+
+# Cabinetry type whose rules apply to every type without rules of its own
+ANY_TYPE = '*'
+# Job dates a scheduled payment can fall due on
+DUE_FIELDS = ['booking_date', 'build_start_date', 'fitting_date']
+
+# The splits used before payment_rules existed, and the rules a new database starts with
+DEFAULT_PAYMENT_RULES = {
+    # Kitchens: 10% deposit, 40% build, 40% fit, 10% completion
+    'kitchen': [
+        ('Deposit', 0.1, 'booking_date'),
+        ('Build Installment', 0.4, 'build_start_date'),
+        ('Fitting Installment', 0.4, 'fitting_date'),
+        ('Completion', 0.1, 'fitting_date')  # Moved to the finish date when the job completes
+    ],
+    # Cabinetry: 50% deposit, 40% fit, 10% completion
+    ANY_TYPE: [
+        ('Deposit', 0.5, 'booking_date'),
+        ('Fitting Installment', 0.4, 'fitting_date'),
+        ('Completion', 0.1, 'fitting_date')
+    ]
+}
+
+
+class PaymentRule(db.Model):
+    """One payment of the schedule for a cabinetry type"""
+    __tablename__ = 'payment_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cabinetry_type = db.Column(db.String(50), nullable=False, index=True)  # Lower case, or '*' for any other type
+    position = db.Column(db.Integer, nullable=False, default=0)
+    type = db.Column(db.String(30), nullable=False)
+    share = db.Column(db.Float, nullable=False)  # Fraction of the job price
+    due = db.Column(db.String(20), nullable=False)  # One of DUE_FIELDS
+    
+    def to_dict(self):
+        return {
+            'type': self.type,
+            'share': self.share,
+            'due': self.due
+        }
@@ -1,6 +1,9 @@
 from src.models.user import db
 from datetime import datetime
 
+ACCEPTED_STATUSES = ['Accepted', 'Accepted-Negotiated']
+PENDING_STATUSES = ['Not Sent', 'Sent', 'Negotiating']
+
 class Quote(db.Model):
     __tablename__ = 'quotes'
     
@@ -11,7 +14,7 @@ class Quote(db.Model):
     initial_quote_amount = db.Column(db.Float, nullable=False)
     final_quote_amount = db.Column(db.Float)
     material_costs = db.Column(db.Float)
-    status = db.Column(db.String(20), default='Not Sent')  # Not Sent, Sent, Negotiating, Accepted, Accepted-Negotiated, Rejected
+    status = db.Column(db.String(20), default='Not Sent', index=True)  # Not Sent, Sent, Negotiating, Accepted, Accepted-Negotiated, Rejected
     negotiation_details = db.Column(db.Text)
     deposit_paid_date = db.Column(db.Date)
     estimated_build_days = db.Column(db.Integer)
@@ -69,8 +72,6 @@ class Quote(db.Model):
         )
         
         db.session.add(job)
-        db.session.commit()
-        
         return job
 
 
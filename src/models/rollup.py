@@ -0,0 +1,227 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.models.job import WorkshopJob
+from src.models.quote import Quote
+from datetime import datetime
+
+# Reporting rollups: one row per (metric, key, period) holding a count and a
+# sum. period is '' for all-time totals or 'YYYY-MM' for monthly ones. Rows are
+# adjusted after every flush that touches a job or quote, so dashboard reads
+# never scan the jobs or quotes tables. Bulk query.update()/delete() calls
+# bypass the flush and must report their changes through apply_bulk_changes()
+# or be followed by rebuild_rollups().
+#
+#   job_stage          key=stage           count, sum of job_price
+#   job_type           key=cabinetry_type  count
+#   job_type_priced    key=cabinetry_type  count and sum of job_price, priced jobs only
+#   job_needs_update   key=''              jobs with client_needs_update set
+#   job_build_variance key=''              finished jobs: sum of build overrun %
+#   job_fit_variance   key=''              finished jobs: sum of fitting overrun %
+#   quote_status       key=status          count, sum of initial_quote_amount (all-time and per created month)
+#   quote_discount     key=''              negotiated quotes: sum of discount %
+
+JOB_COLUMNS = [
+    'stage', 'cabinetry_type', 'job_price', 'client_needs_update',
+    'estimated_build_days', 'actual_build_days', 'estimated_fitting_days', 'actual_fitting_days'
+]
+QUOTE_COLUMNS = ['status', 'initial_quote_amount', 'final_quote_amount', 'created_at']
+
+
+class ReportRollup(db.Model):
+    __tablename__ = 'report_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(30), nullable=False)
+    key = db.Column(db.String(50), nullable=False, default='')
+    period = db.Column(db.String(7), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'key', 'period', name='uq_report_rollups_metric_key_period'),
+    )
+
+
+def job_contributions(job):
+    """(metric, key, period, count, total) rows a job with these column values adds"""
+    price = job['job_price'] or 0
+    rows = [
+        ('job_stage', job['stage'] or '', '', 1, price),
+        ('job_type', job['cabinetry_type'] or '', '', 1, 0)
+    ]
+    if job['job_price']:
+        rows.append(('job_type_priced', job['cabinetry_type'] or '', '', 1, price))
+    if job['client_needs_update']:
+        rows.append(('job_needs_update', '', '', 1, 0))
+    if job['stage'] == 'Finished':
+        if job['estimated_build_days'] and job['actual_build_days']:
+            variance = (job['actual_build_days'] - job['estimated_build_days']) / job['estimated_build_days'] * 100
+            rows.append(('job_build_variance', '', '', 1, variance))
+        if job['estimated_fitting_days'] and job['actual_fitting_days']:
+            variance = (job['actual_fitting_days'] - job['estimated_fitting_days']) / job['estimated_fitting_days'] * 100
+            rows.append(('job_fit_variance', '', '', 1, variance))
+    return rows
+
+
+def quote_contributions(quote):
+    """(metric, key, period, count, total) rows a quote with these column values adds"""
+    amount = quote['initial_quote_amount'] or 0
+    status = quote['status'] or ''
+    created_at = quote['created_at'] or datetime.utcnow()
+    rows = [
+        ('quote_status', status, '', 1, amount),
+        ('quote_status', status, created_at.strftime('%Y-%m'), 1, amount)
+    ]
+    if status == 'Accepted-Negotiated' and quote['final_quote_amount'] and quote['initial_quote_amount']:
+        discount = (quote['initial_quote_amount'] - quote['final_quote_amount']) / quote['initial_quote_amount'] * 100
+        rows.append(('quote_discount', '', '', 1, discount))
+    return rows
+
+
+ROLLUP_SOURCES = [
+    (WorkshopJob, JOB_COLUMNS, job_contributions),
+    (Quote, QUOTE_COLUMNS, quote_contributions)
+]
+
+
+def _values(obj, columns, previous=False):
+    """Current column values of obj, or the values before its pending changes"""
+    state = inspect(obj)
+    values = {}
+    for column in columns:
+        history = state.attrs[column].history
+        if previous and history.deleted:
+            values[column] = history.deleted[0]
+        elif previous and history.added:
+            # Set for the first time in this flush (e.g. a default)
+            values[column] = None
+        else:
+            values[column] = getattr(obj, column)
+    return values
+
+
+def _add(deltas, rows, sign):
+    for metric, key, period, count, total in rows:
+        current = deltas.get((metric, key, period), (0, 0))
+        deltas[(metric, key, period)] = (current[0] + sign * count, current[1] + sign * total)
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Make the ORM load the old value of an expired column before it is
+# overwritten, so the rollup can subtract what the row used to contribute
+for model, columns, _ in ROLLUP_SOURCES:
+    for column in columns:
+        event.listen(getattr(model, column), 'set', _keep_previous_value, active_history=True)
+
+
+@event.listens_for(Session, 'before_flush')
+def load_deleted_values(session, flush_context, instances):
+    """Load rolled up columns of rows about to be deleted while they still exist"""
+    for model, columns, _ in ROLLUP_SOURCES:
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                _values(obj, columns)
+
+
+@event.listens_for(Session, 'after_flush')
+def update_rollups(session, flush_context):
+    """Apply the rollup changes for the jobs and quotes written by this flush.
+
+    Runs while new/dirty/deleted and attribute history still describe the flush.
+    """
+    deltas = {}
+    for model, columns, contributions in ROLLUP_SOURCES:
+        for obj in session.new:
+            if isinstance(obj, model):
+                _add(deltas, contributions(_values(obj, columns)), 1)
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                _add(deltas, contributions(_values(obj, columns, previous=True)), -1)
+        for obj in session.dirty:
+            if isinstance(obj, model) and session.is_modified(obj):
+                _add(deltas, contributions(_values(obj, columns, previous=True)), -1)
+                _add(deltas, contributions(_values(obj, columns)), 1)
+
+    _apply(session.connection(), deltas)
+
+
+def apply_bulk_changes(model, changes):
+    """Adjust the rollups for rows changed by a bulk UPDATE, which skips the flush.
+
+    changes holds a (values before, values after) pair of dicts of the
+    model's rolled up columns for each changed row.
+    """
+    for source, _, contributions in ROLLUP_SOURCES:
+        if source is model:
+            deltas = {}
+            for before, after in changes:
+                _add(deltas, contributions(before), -1)
+                _add(deltas, contributions(after), 1)
+            _apply(db.session.connection(), deltas)
+
+
+def _apply(connection, deltas):
+    table = ReportRollup.__table__
+    for (metric, key, period), (count, total) in deltas.items():
+        if not count and not total:
+            continue
+        result = connection.execute(table.update().where(
+            table.c.metric == metric, table.c.key == key, table.c.period == period
+        ).values(count=table.c.count + count, total=table.c.total + total))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                metric=metric, key=key, period=period, count=count, total=total
+            ))
+
+
+def rebuild_rollups():
+    """Recompute every rollup row from the jobs and quotes tables"""
+    deltas = {}
+    for model, columns, contributions in ROLLUP_SOURCES:
+        query = db.session.query(*[getattr(model, column) for column in columns])
+        for row in query.yield_per(1000):
+            _add(deltas, contributions(dict(zip(columns, row))), 1)
+
+    ReportRollup.query.delete()
+    db.session.add_all([
+        ReportRollup(metric=metric, key=key, period=period, count=count, total=total)
+        for (metric, key, period), (count, total) in deltas.items()
+    ])
+    db.session.commit()
+    return len(deltas)
+
+
+def load_rollups(*metrics, period=''):
+    """{metric: {key: (count, total)}} for the metrics, from one query"""
+    rollups = {metric: {} for metric in metrics}
+    rows = ReportRollup.query.filter(ReportRollup.metric.in_(metrics), ReportRollup.period == period)
+    for row in rows:
+        if row.count:
+            rollups[row.metric][row.key] = (row.count, row.total)
+    return rollups
+
+
+def monthly_rollups(metric):
+    """{period: {key: (count, total)}} for the monthly rows of a metric, oldest first"""
+    months = {}
+    rows = ReportRollup.query.filter(
+        ReportRollup.metric == metric, ReportRollup.period != ''
+    ).order_by(ReportRollup.period, ReportRollup.key)
+    for row in rows:
+        if row.count:
+            months.setdefault(row.period, {})[row.key] = (row.count, row.total)
+    return months
+
+
+def rollup_sum(rows, keys=None):
+    """(count, total) summed over the given keys of a load_rollups() metric, or all of them"""
+    count = total = 0
+    for key, (row_count, row_total) in rows.items():
+        if keys is None or key in keys:
+            count += row_count
+            total += row_total
+    return count, total
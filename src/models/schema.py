@@ -0,0 +1,211 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, Integer, bindparam, column, inspect, table, text
+from sqlalchemy.exc import DBAPIError
+from src.models import db
+from src.models.changes import ChangeLog
+from src.models.job import WorkshopJob, DEFAULT_BUILD_DAYS, DEFAULT_FITTING_DAYS, SPRAY_DAYS
+from src.models.job_assignment import JobAssignment
+from src.models.payment import Payment, PaymentRule, DEFAULT_PAYMENT_RULES
+from src.models.quote import Quote, PENDING_STATUSES
+from src.models.staff_absence import StaffAbsence
+
+# Versioned schema migrations.
+#
+# db.create_all() creates missing tables with every column and index the
+# models declare, but never changes a table that already exists. Each
+# migration below brings an existing database up to the models, on SQLite
+# and PostgreSQL alike. Steps are idempotent, so they are also safe to run on
+# a database create_all() has just built. Applied versions are recorded in
+# schema_migrations. To change the schema: change the model, then append a
+# migration with the next version number; never edit a released one.
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def add_column(connection, table, column, column_type):
+    """ALTER TABLE ... ADD COLUMN unless the column exists"""
+    if column not in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'))
+
+
+def create_index(connection, name, table, *columns):
+    connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+
+
+def stage_windows_v1(build_start_date, build_duration_days, estimated_build_days, fitting_date, estimated_fitting_days):
+    """(build_end, spray_start, spray_end, fit_start, fit_end) as WorkshopJob computed them at version 1"""
+    fitting_days = timedelta(days=estimated_fitting_days or DEFAULT_FITTING_DAYS)
+    fit_start = fitting_date
+    if not build_start_date:
+        return None, None, None, fit_start, fit_start + fitting_days if fit_start else None
+
+    build_end = build_start_date + timedelta(days=build_duration_days or estimated_build_days or DEFAULT_BUILD_DAYS)
+    spray_start = build_end - timedelta(days=1)
+    spray_end = spray_start + timedelta(days=SPRAY_DAYS)
+    fit_start = fitting_date or spray_end + timedelta(days=1)
+    return build_end, spray_start, spray_end, fit_start, fit_start + fitting_days
+
+
+def add_stage_windows(connection):
+    window_columns = ['build_end_date', 'spray_start_date', 'spray_end_date', 'fit_start_date', 'fit_end_date']
+    for name in window_columns:
+        add_column(connection, 'workshop_jobs', name, 'DATE')
+    create_index(connection, 'ix_workshop_jobs_build_window', 'workshop_jobs', 'build_start_date', 'spray_end_date')
+    create_index(connection, 'ix_workshop_jobs_fit_window', 'workshop_jobs', 'fit_start_date', 'fit_end_date')
+
+    # Backfill jobs saved before the columns existed. The table is spelled out
+    # as it was at this version, so later model changes cannot break the step.
+    jobs = table(
+        'workshop_jobs',
+        column('id', Integer), column('build_duration_days', Integer),
+        column('estimated_build_days', Integer), column('estimated_fitting_days', Integer),
+        column('build_start_date', Date), column('fitting_date', Date),
+        *[column(name, Date) for name in window_columns]
+    )
+    rows = connection.execute(db.select(
+        jobs.c.id, jobs.c.build_start_date, jobs.c.build_duration_days, jobs.c.estimated_build_days,
+        jobs.c.fitting_date, jobs.c.estimated_fitting_days
+    ).where(
+        db.or_(jobs.c.build_start_date.isnot(None), jobs.c.fitting_date.isnot(None)),
+        jobs.c.build_end_date.is_(None),
+        jobs.c.fit_start_date.is_(None)
+    )).all()
+    if rows:
+        connection.execute(
+            jobs.update().where(jobs.c.id == bindparam('job_id')).values(
+                {name: bindparam(f'new_{name}') for name in window_columns}
+            ),
+            [
+                dict(job_id=row.id, **{f'new_{name}': value for name, value in zip(window_columns, stage_windows_v1(*row[1:]))})
+                for row in rows
+            ]
+        )
+
+
+def add_hot_path_indexes(connection):
+    create_index(connection, 'ix_workshop_jobs_stage', 'workshop_jobs', 'stage')
+    create_index(connection, 'ix_workshop_jobs_client_needs_update', 'workshop_jobs', 'client_needs_update')
+    create_index(connection, 'ix_workshop_jobs_client_id', 'workshop_jobs', 'client_id')
+    create_index(connection, 'ix_payments_job_id', 'payments', 'job_id')
+    create_index(connection, 'ix_payments_due_date', 'payments', 'due_date')
+    create_index(connection, 'ix_payments_paid_date', 'payments', 'paid_date')
+    create_index(connection, 'ix_payments_status', 'payments', 'status')
+    create_index(connection, 'ix_job_assignments_user_id', 'job_assignments', 'user_id')
+    create_index(connection, 'ix_job_assignments_job_id', 'job_assignments', 'job_id')
+    create_index(connection, 'ix_staff_absences_user_dates', 'staff_absences', 'user_id', 'start_date', 'end_date')
+    create_index(connection, 'ix_quotes_status', 'quotes', 'status')
+
+
+def add_payment_rules(connection):
+    PaymentRule.__table__.create(connection, checkfirst=True)
+    if connection.execute(db.select(db.func.count()).select_from(PaymentRule.__table__)).scalar():
+        return
+    connection.execute(PaymentRule.__table__.insert(), [
+        {'cabinetry_type': cabinetry_type, 'position': position, 'type': type, 'share': share, 'due': due}
+        for cabinetry_type, rules in DEFAULT_PAYMENT_RULES.items()
+        for position, (type, share, due) in enumerate(rules)
+    ])
+
+
+def add_change_log(connection):
+    ChangeLog.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, 'Stored stage window columns on workshop_jobs', add_stage_windows),
+    (2, 'Indexes for the hot query paths', add_hot_path_indexes),
+    (3, 'Payment split rules by cabinetry type', add_payment_rules),
+    (4, 'Change log for the delta feed', add_change_log),
+]
+
+
+def applied_versions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    with db.engine.connect() as connection:
+        return {row[0] for row in connection.execute(db.select(SchemaMigration.version))}
+
+
+def pending_migrations(target=None):
+    applied = applied_versions()
+    return [
+        migration for migration in MIGRATIONS
+        if migration[0] not in applied and (target is None or migration[0] <= target)
+    ]
+
+
+def migrate(target=None):
+    """Apply pending migrations in order, each in its own transaction.
+
+    Returns the versions applied.
+    """
+    applied = []
+    for version, description, upgrade in pending_migrations(target):
+        with db.engine.begin() as connection:
+            upgrade(connection)
+            connection.execute(SchemaMigration.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+    return applied
+
+
+# Query plan report: the statements behind the hot paths, explained by the database
+
+def plan_probes():
+    window_start, window_end = date(2025, 1, 1), date(2025, 3, 31)
+    return [
+        ('jobs by stage', db.select(WorkshopJob.id).where(WorkshopJob.stage == 'Build')),
+        ('clients needing updates', db.select(WorkshopJob.id).where(WorkshopJob.client_needs_update.is_(True))),
+        ('jobs of a client', db.select(WorkshopJob.id).where(WorkshopJob.client_id == 1)),
+        ('build window overlap', db.select(WorkshopJob.id).where(WorkshopJob.build_overlaps(window_start, window_end))),
+        ('payments of a job', db.select(Payment.id).where(Payment.job_id == 1)),
+        ('due payments forecast', db.select(Payment.amount).where(
+            Payment.status == 'Due', Payment.due_date.between(window_start, window_end)
+        )),
+        ('income history', db.select(Payment.amount).where(
+            Payment.status == 'Paid', Payment.paid_date.between(window_start, window_end)
+        )),
+        ('assignments of a user', db.select(JobAssignment.id).where(JobAssignment.user_id == 1)),
+        ('assignments of a job', db.select(JobAssignment.id).where(JobAssignment.job_id == 1)),
+        ('absences overlapping dates', db.select(StaffAbsence.id).where(
+            StaffAbsence.user_id == 1,
+            StaffAbsence.start_date <= window_end,
+            StaffAbsence.end_date >= window_start
+        )),
+        ('pending quotes', db.select(Quote.id).where(Quote.status.in_(PENDING_STATUSES))),
+    ]
+
+
+def query_plans():
+    """{probe name: plan text} as reported by EXPLAIN on the current database"""
+    dialect = db.engine.dialect
+    explain = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    plans = {}
+    for name, statement in plan_probes():
+        sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+        # A connection per probe, as a failed statement aborts a PostgreSQL transaction
+        with db.engine.connect() as connection:
+            try:
+                rows = connection.exec_driver_sql(explain + sql).fetchall()
+            except DBAPIError:
+                plans[name] = 'not available (column added by a pending migration)'
+                continue
+        # SQLite rows are (id, parent, notused, detail); PostgreSQL rows are one line of text
+        plans[name] = '; '.join(str(row[-1]) for row in rows)
+    return plans
+
+
+def plan_report(before, after):
+    """Side by side text report of two query_plans() results"""
+    lines = []
+    for name in after:
+        lines.append(name)
+        lines.append(f'  before: {before.get(name, "-")}')
+        lines.append(f'  after:  {after[name]}')
+    return '\n'.join(lines)
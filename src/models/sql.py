@@ -0,0 +1,62 @@
+from sqlalchemy import Date, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+
+class date_diff(FunctionElement):
+    """Portable whole-day difference between two dates: date_diff(end, start)"""
+    type = Integer()
+    inherit_cache = True
+    name = 'date_diff'
+
+
+@compiles(date_diff)
+def _date_diff_default(element, compiler, **kw):
+    # PostgreSQL: date - date = integer
+    end_expr, start_expr = list(element.clauses)
+    return '(%s - %s)' % (compiler.process(end_expr, **kw), compiler.process(start_expr, **kw))
+
+
+@compiles(date_diff, 'sqlite')
+def _date_diff_sqlite(element, compiler, **kw):
+    end_expr, start_expr = list(element.clauses)
+    return 'CAST(julianday(%s) - julianday(%s) AS INTEGER)' % (
+        compiler.process(end_expr, **kw), compiler.process(start_expr, **kw)
+    )
+
+
+
+class month_start(FunctionElement):
+    """Portable first day of the month containing a date"""
+    type = Date()
+    inherit_cache = True
+    name = 'month_start'
+
+
+@compiles(month_start)
+def _month_start_default(element, compiler, **kw):
+    return "CAST(date_trunc('month', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, 'sqlite')
+def _month_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'start of month')" % compiler.process(element.clauses, **kw)
+
+
+class week_start(FunctionElement):
+    """Portable Monday of the week containing a date"""
+    type = Date()
+    inherit_cache = True
+    name = 'week_start'
+
+
+@compiles(week_start)
+def _week_start_default(element, compiler, **kw):
+    # PostgreSQL: date_trunc weeks are ISO weeks, starting on Monday
+    return "CAST(date_trunc('week', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start, 'sqlite')
+def _week_start_sqlite(element, compiler, **kw):
+    # 'weekday 0' moves forward to Sunday (or stays there), then back to Monday
+    return "date(%s, 'weekday 0', '-6 days')" % compiler.process(element.clauses, **kw)
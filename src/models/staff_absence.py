@@ -13,6 +13,10 @@ class StaffAbsence(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_staff_absences_user_dates', 'user_id', 'start_date', 'end_date'),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='absences')
     
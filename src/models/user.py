@@ -50,15 +50,15 @@ class User(db.Model, UserMixin):
     
     def is_available(self, start_date, end_date):
         """Check if user is available during the given date range"""
-        for absence in self.absences:
-            if absence.overlaps_with_dates(start_date, end_date):
-                return False
-        return True
+        from src.models.staff_absence import StaffAbsence
+        
+        return self.absences.filter(
+            StaffAbsence.start_date <= end_date,
+            StaffAbsence.end_date >= start_date
+        ).first() is None
     
     def get_current_workload(self):
         """Calculate current workload based on assigned jobs"""
-        active_assignments = 0
-        for assignment in self.job_assignments:
-            if assignment.job.stage not in ['Finished', 'Not Started']:
-                active_assignments += 1
-        return active_assignments
+        from src.services.workload import staff_workloads
+        
+        return staff_workloads(user_ids=[self.id]).get(self.id, {}).get('active_assignments', 0)
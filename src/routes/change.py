@@ -0,0 +1,131 @@
+import json
+import time
+from flask import Blueprint, Response, current_app, request, jsonify
+from src.models.changes import changes_since, latest_cursor, DEFAULT_LIMIT, MAX_LIMIT
+from src.services.events import STREAMED_TABLES
+from flask_login import login_required
+
+change_bp = Blueprint('change', __name__)
+
+# Seconds between keepalive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+# A stream ends after this long and the browser reconnects from its last event id
+STREAM_SECONDS = 600
+RETRY_MILLISECONDS = 2000
+# Seconds a client turned away by a full worker waits (polling /api/changes meanwhile)
+BUSY_RETRY_SECONDS = 30
+
+@change_bp.route('/api/changes', methods=['GET'])
+@login_required
+def get_changes():
+    """Jobs, payments, assignments, absences, quotes and clients changed since a cursor.
+    
+    ?since=<cursor>&limit=<n>. Without since only the current cursor is
+    returned: take it before loading the collections, then poll from it. A
+    cursor older than the retained log gets a 410 and the client reloads.
+    """
+    if 'since' not in request.args:
+        return jsonify({'cursor': latest_cursor(), 'changes': [], 'more': False})
+    
+    try:
+        since = int(request.args['since'])
+        limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    
+    result = changes_since(since, limit)
+    if result is None:
+        return jsonify({
+            'error': 'Cursor is older than the change log; reload all data',
+            'reset': True,
+            'cursor': latest_cursor()
+        }), 410
+    
+    changes, cursor, more = result
+    return jsonify({'cursor': cursor, 'changes': changes, 'more': more})
+
+def sse(event=None, data=None, id=None):
+    """One server-sent event; an event with only an id just moves the client's cursor"""
+    lines = []
+    if id is not None:
+        lines.append(f'id: {id}')
+    if event:
+        lines.append(f'event: {event}')
+    if data is not None:
+        lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+@change_bp.route('/api/changes/stream', methods=['GET'])
+@login_required
+def stream_changes():
+    """Server-sent events for changes to jobs, assignments, payments and absences.
+    
+    Each 'change' event carries an /api/changes entry, with the change log
+    cursor as its event id. A reconnecting EventSource sends Last-Event-ID
+    (or ?since=) and first gets what it missed from the change log. A
+    'reset' event means changes were lost and the client should reload. The
+    stream holds no database connection while it waits, and ends after
+    STREAM_SECONDS for the browser to reconnect. When the worker already
+    serves CHANGE_EVENTS_MAX_STREAMS streams the answer is a 503 with
+    Retry-After, and the client polls /api/changes until then.
+    """
+    change_events = current_app.extensions['change_events']
+    broker = change_events.broker
+    if broker is None:
+        return jsonify({'error': 'Change events are disabled'}), 404
+    
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID and since must be integers'}), 400
+    
+    if not change_events.streams.acquire(blocking=False):
+        return jsonify({
+            'error': 'Too many open change streams',
+            'retry': BUSY_RETRY_SECONDS
+        }), 503, {'Retry-After': str(BUSY_RETRY_SECONDS)}
+    try:
+        response = open_stream(broker, since)
+    except Exception:
+        change_events.streams.release()
+        raise
+    # Called once the server is done with the response, whether or not it was ever read
+    response.call_on_close(change_events.streams.release)
+    return response
+
+def open_stream(broker, since):
+    """Streaming response: the catch-up from since (if any), then live events"""
+    # Take the broker position first so nothing committed during the catch-up is lost
+    position = broker.position()
+    opening = [f'retry: {RETRY_MILLISECONDS}\n\n']
+    result = changes_since(since, MAX_LIMIT) if since is not None else None
+    if result and not result[2]:
+        changes, cursor, _ = result
+        opening.extend(sse('change', change) for change in changes if change['table'] in STREAMED_TABLES)
+    else:
+        # A cursor too old (or too far behind) to catch up from is reset
+        if since is not None:
+            opening.append(sse('reset', {'reset': True}))
+        cursor = latest_cursor()
+    opening.append(sse(id=cursor))
+    
+    def stream(position, catch_up_cursor):
+        yield ''.join(opening)
+        deadline = time.monotonic() + STREAM_SECONDS
+        while time.monotonic() < deadline:
+            position, events, missed = broker.wait(position, HEARTBEAT_SECONDS)
+            chunks = [sse('reset', {'reset': True})] if missed else []
+            for event in events:
+                # Skip what the catch-up already sent with newer data. Commits
+                # publish in no particular order, so later events can carry
+                # lower cursors and must not be compared with each other.
+                if event['cursor'] > catch_up_cursor:
+                    change = {key: event[key] for key in ('table', 'id', 'op', 'row')}
+                    chunks.append(sse('change', change, id=event['cursor']))
+            yield ''.join(chunks) or ': keepalive\n\n'
+    
+    return Response(stream(position, cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
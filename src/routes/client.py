@@ -1,24 +1,56 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
-from src.models.client import Client
+from src.models.client import Client, EMPTY_AGGREGATES
+from src.models.quote import Quote
+from src.models.job import WorkshopJob
+from src.models.etag import conditional_response, client_scopes, job_scopes, quote_scopes
+from src.models.pagination import paginate, paginated_response, apply_filters
 from flask_login import login_required, current_user
 from datetime import datetime
 
 client_bp = Blueprint('client', __name__)
 
+CLIENT_SORT_KEYS = {
+    'name': Client.name,
+    'created_at': Client.created_at,
+    'updated_at': Client.updated_at
+}
+
+CLIENT_FILTERS = {
+    # Case-insensitive name search
+    'q': lambda value: Client.name.ilike(f'%{value}%')
+}
+
 @client_bp.route('/api/clients', methods=['GET'])
 @login_required
 def get_clients():
-    """Get all clients"""
-    clients = Client.query.all()
-    return jsonify([client.to_dict() for client in clients])
+    """Get clients, filtered and paginated (?after=<id>&limit=&sort=)"""
+    try:
+        scope = apply_filters(Client.query, request.args, CLIENT_FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        try:
+            clients, next_cursor = paginate(Client.query, Client, request.args, CLIENT_SORT_KEYS, CLIENT_FILTERS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # One grouped query for the job aggregates of the whole page
+        aggregates = Client.job_aggregates([client.id for client in clients])
+        return paginated_response(
+            clients, next_cursor,
+            lambda client: client.to_dict(aggregates.get(client.id, EMPTY_AGGREGATES))
+        )
+    
+    return conditional_response(client_scopes(scope), build)
 
 @client_bp.route('/api/clients/<int:client_id>', methods=['GET'])
 @login_required
 def get_client(client_id):
     """Get a specific client"""
-    client = Client.query.get_or_404(client_id)
-    return jsonify(client.to_dict())
+    scope = Client.query.filter_by(id=client_id)
+    return conditional_response(client_scopes(scope), lambda: jsonify(scope.first_or_404().to_dict()))
 
 @client_bp.route('/api/clients', methods=['POST'])
 @login_required
@@ -35,7 +67,7 @@ def create_client():
     )
     
     db.session.add(client)
-    db.session.commit()
+    db.session.flush()
     return jsonify(client.to_dict()), 201
 
 @client_bp.route('/api/clients/<int:client_id>', methods=['PUT'])
@@ -58,7 +90,7 @@ def update_client(client_id):
     if 'xero_client_id' in data:
         client.xero_client_id = data['xero_client_id']
     
-    db.session.commit()
+    db.session.flush()
     return jsonify(client.to_dict())
 
 @client_bp.route('/api/clients/<int:client_id>', methods=['DELETE'])
@@ -72,22 +104,25 @@ def delete_client(client_id):
         return jsonify({'error': 'Cannot delete client with associated quotes or jobs'}), 400
     
     db.session.delete(client)
-    db.session.commit()
     return '', 204
 
 @client_bp.route('/api/clients/<int:client_id>/quotes', methods=['GET'])
 @login_required
 def get_client_quotes(client_id):
     """Get quotes for a client"""
-    client = Client.query.get_or_404(client_id)
-    return jsonify([quote.to_dict() for quote in client.quotes])
+    return conditional_response(
+        quote_scopes(Quote.query.filter_by(client_id=client_id)),
+        lambda: jsonify([quote.to_dict() for quote in Client.query.filter_by(id=client_id).first_or_404().quotes])
+    )
 
 @client_bp.route('/api/clients/<int:client_id>/jobs', methods=['GET'])
 @login_required
 def get_client_jobs(client_id):
     """Get jobs for a client"""
-    client = Client.query.get_or_404(client_id)
-    return jsonify([job.to_dict() for job in client.jobs])
+    return conditional_response(
+        job_scopes(WorkshopJob.query.filter_by(client_id=client_id)),
+        lambda: jsonify([job.to_dict() for job in Client.query.filter_by(id=client_id).first_or_404().jobs])
+    )
 
 @client_bp.route('/api/clients/<int:client_id>/create-in-xero', methods=['POST'])
 @login_required
@@ -98,7 +133,6 @@ def create_client_in_xero(client_id):
     # This would be implemented when Xero integration is added
     # For now, just update the xero_client_id field with a placeholder
     client.xero_client_id = f"XERO-{client_id}-{datetime.now().strftime('%Y%m%d')}"
-    db.session.commit()
     
     return jsonify({
         'message': 'Client created in Xero (simulated)',
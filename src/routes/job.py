@@ -1,27 +1,80 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, User
-from src.models.job import WorkshopJob
+from src.models.job import WorkshopJob, builders_for
 from src.models.job_assignment import JobAssignment
 from src.models.staff_absence import StaffAbsence
+from src.models.client import Client
+from src.models.loaders import with_profile
+from src.models.etag import conditional_response, job_scopes, calendar_scopes
+from src.services.staff_calendar import staff_calendar
+from src.services.workload import staff_workloads, workload_key
+from src.services.assignment_optimizer import AssignmentPlanner, apply_assignment_plan
+from src.services.slot_finder import SlotFinder, DEFAULT_HORIZON_DAYS
+from src.services.schedule_solver import ScheduleSolver, DEFAULT_TIME_BUDGET, MAX_TIME_BUDGET
+from src.services.reschedule import moved_copy, reschedule_conflicts, apply_reschedule, changed_rows
+from src.models.pagination import (
+    paginate, paginated_response, apply_filters, eq_filter, in_filter, from_filter, to_filter, bool_filter
+)
 from datetime import datetime, timedelta
 from flask_login import login_required, current_user
 import json
 
 job_bp = Blueprint('job', __name__)
 
+JOB_SORT_KEYS = {
+    'name': WorkshopJob.name,
+    'build_start_date': WorkshopJob.build_start_date,
+    'fitting_date': WorkshopJob.fitting_date,
+    'booking_date': WorkshopJob.booking_date,
+    'job_price': WorkshopJob.job_price,
+    'created_at': WorkshopJob.created_at,
+    'updated_at': WorkshopJob.updated_at
+}
+
+JOB_FILTERS = {
+    'stage': in_filter(WorkshopJob.stage),
+    'cabinetry_type': in_filter(WorkshopJob.cabinetry_type),
+    'client_id': eq_filter(WorkshopJob.client_id, int),
+    'fitting_date_status': in_filter(WorkshopJob.fitting_date_status),
+    'client_needs_update': bool_filter(WorkshopJob.client_needs_update),
+    'build_from': from_filter(WorkshopJob.build_start_date),
+    'build_to': to_filter(WorkshopJob.build_start_date),
+    'fitting_from': from_filter(WorkshopJob.fitting_date),
+    'fitting_to': to_filter(WorkshopJob.fitting_date),
+    # status depends on today's date, so build its expression per request
+    'status': lambda value: in_filter(WorkshopJob.status)(value)
+}
+
 @job_bp.route('/api/jobs', methods=['GET'])
 @login_required
 def get_jobs():
-    """Get all workshop jobs"""
-    jobs = WorkshopJob.query.all()
-    return jsonify([job.to_dict() for job in jobs])
+    """Get workshop jobs, filtered and paginated (?after=<id>&limit=&sort=)"""
+    try:
+        scope = apply_filters(WorkshopJob.query, request.args, JOB_FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        try:
+            jobs, next_cursor = paginate(
+                with_profile(WorkshopJob.query, 'job_list'), WorkshopJob, request.args,
+                JOB_SORT_KEYS, JOB_FILTERS
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return paginated_response(jobs, next_cursor)
+    
+    return conditional_response(job_scopes(scope), build)
 
 @job_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
 @login_required
 def get_job(job_id):
     """Get a specific workshop job"""
-    job = WorkshopJob.query.get_or_404(job_id)
-    return jsonify(job.to_dict())
+    scope = WorkshopJob.query.filter_by(id=job_id)
+    return conditional_response(
+        job_scopes(scope),
+        lambda: jsonify(with_profile(scope, 'job_detail').first_or_404().to_dict())
+    )
 
 @job_bp.route('/api/jobs', methods=['POST'])
 @login_required
@@ -44,12 +97,12 @@ def create_job():
     )
     
     db.session.add(job)
-    db.session.commit()
     
     # Generate payment schedule if job price is provided
     if job.job_price:
         job.generate_payment_schedule()
     
+    db.session.flush()
     return jsonify(job.to_dict()), 201
 
 @job_bp.route('/api/jobs/<int:job_id>', methods=['PUT'])
@@ -94,7 +147,7 @@ def update_job(job_id):
         if data['client_contacted']:
             job.client_needs_update = False
     
-    db.session.commit()
+    db.session.flush()
     return jsonify(job.to_dict())
 
 @job_bp.route('/api/jobs/<int:job_id>', methods=['DELETE'])
@@ -103,7 +156,6 @@ def delete_job(job_id):
     """Delete a workshop job"""
     job = WorkshopJob.query.get_or_404(job_id)
     db.session.delete(job)
-    db.session.commit()
     return '', 204
 
 @job_bp.route('/api/jobs/<int:job_id>/status', methods=['PUT'])
@@ -125,78 +177,67 @@ def update_job_status(job_id):
             for payment in job.payments:
                 if payment.type == 'Completion':
                     payment.due_date = datetime.now().date()
-                    db.session.commit()
     
-    db.session.commit()
+    db.session.flush()
     return jsonify(job.to_dict())
 
 @job_bp.route('/api/jobs/schedule', methods=['GET'])
 @login_required
 def get_job_schedule():
-    """Get job schedule data for Gantt view"""
-    jobs = WorkshopJob.query.filter(WorkshopJob.stage != 'Finished').all()
+    """Get job schedule data for Gantt view.
+    
+    Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD limits the result to jobs with a
+    stage overlapping the visible window; the overlap test runs in SQL.
+    """
+    query = WorkshopJob.query.filter(
+        WorkshopJob.stage != 'Finished',
+        WorkshopJob.build_start_date.isnot(None)
+    )
+    
+    if request.args.get('from') or request.args.get('to'):
+        try:
+            window_start = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+            window_end = datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'from and to must both be dates in YYYY-MM-DD format'}), 400
+        if window_end < window_start:
+            return jsonify({'error': 'to must not be before from'}), 400
+        query = query.filter(WorkshopJob.overlaps_window(window_start, window_end))
+    
+    return conditional_response([query, Client.query], lambda: jsonify(schedule_rows(query)))
+
+def schedule_rows(query):
+    """Gantt rows for the jobs of the query"""
+    jobs = with_profile(query, 'job_schedule').order_by(WorkshopJob.build_start_date, WorkshopJob.id).all()
     
-    schedule_data = []
+    # Progress of each stage: done once the job has moved past it
+    later_stages = {
+        'Build': ['Spray', 'Fit', 'Snag', 'Finished'],
+        'Spray': ['Fit', 'Snag', 'Finished'],
+        'Fit': ['Snag', 'Finished'],
+        'Snag': []
+    }
+    
+    rows = []
     for job in jobs:
-        if not job.build_start_date:
-            continue
-            
-        # Calculate dates for each stage
-        build_start = job.build_start_date
-        build_end = build_start + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-        
-        # Spray starts on the last day of build and lasts 5 days
-        spray_start = build_end - timedelta(days=1)
-        spray_end = spray_start + timedelta(days=5)
-        
-        # Fit starts after spray is complete
-        fit_start = job.fitting_date or (spray_end + timedelta(days=1))
-        fit_end = fit_start + timedelta(days=job.estimated_fitting_days or 3)
+        stages = []
+        for name, (start, end) in job.schedule_windows().items():
+            stages.append({
+                'name': name,
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'progress': 100 if job.stage in later_stages[name] else (
+                    50 if job.stage == name else 0
+                )
+            })
         
-        job_data = {
+        rows.append({
             'id': job.id,
             'name': job.name,
             'client': job.client.name if job.client else '',
-            'stages': [
-                {
-                    'name': 'Build',
-                    'start': build_start.isoformat(),
-                    'end': build_end.isoformat(),
-                    'progress': 100 if job.stage in ['Spray', 'Fit', 'Snag', 'Finished'] else (
-                        50 if job.stage == 'Build' else 0
-                    )
-                },
-                {
-                    'name': 'Spray',
-                    'start': spray_start.isoformat(),
-                    'end': spray_end.isoformat(),
-                    'progress': 100 if job.stage in ['Fit', 'Snag', 'Finished'] else (
-                        50 if job.stage == 'Spray' else 0
-                    )
-                },
-                {
-                    'name': 'Fit',
-                    'start': fit_start.isoformat(),
-                    'end': fit_end.isoformat(),
-                    'progress': 100 if job.stage in ['Snag', 'Finished'] else (
-                        50 if job.stage == 'Fit' else 0
-                    )
-                }
-            ]
-        }
-        
-        # Add snag stage if job is in snag
-        if job.stage == 'Snag':
-            job_data['stages'].append({
-                'name': 'Snag',
-                'start': fit_end.isoformat(),
-                'end': (fit_end + timedelta(days=2)).isoformat(),
-                'progress': 50
-            })
-        
-        schedule_data.append(job_data)
-    
-    return jsonify(schedule_data)
+            'stages': stages
+        })
+    return rows
 
 @job_bp.route('/api/jobs/<int:job_id>/reschedule', methods=['PUT'])
 @login_required
@@ -205,36 +246,78 @@ def reschedule_job(job_id):
     job = WorkshopJob.query.get_or_404(job_id)
     data = request.json
     
-    if 'build_start_date' in data:
-        job.build_start_date = datetime.strptime(data['build_start_date'], '%Y-%m-%d').date()
+    job.reschedule(
+        build_start_date=datetime.strptime(data['build_start_date'], '%Y-%m-%d').date() if 'build_start_date' in data else None,
+        fitting_date=datetime.strptime(data['fitting_date'], '%Y-%m-%d').date() if 'fitting_date' in data else None
+    )
     
-    if 'fitting_date' in data:
-        old_fitting_date = job.fitting_date
-        job.fitting_date = datetime.strptime(data['fitting_date'], '%Y-%m-%d').date()
-        
-        # Flag client for update if fitting date changed
-        if old_fitting_date != job.fitting_date:
-            job.client_needs_update = True
-            job.client_contacted = False
+    db.session.flush()
+    return jsonify(job.to_dict())
+
+@job_bp.route('/api/jobs/reschedule-batch', methods=['POST'])
+@login_required
+def reschedule_batch():
+    """Reschedule many jobs at once (dragging a group in the Gantt view).
     
-    db.session.commit()
+    Body: {"changes": [{"job_id", "build_start_date", "fitting_date"}]}, each
+    with at least one date. Every change is validated first, including staff
+    absences and double bookings against the new windows of all the moved
+    jobs together, and nothing is written unless all pass.
+    Jobs and payment due dates are then updated with set-based statements in
+    one transaction. Returns the changed jobs and payments.
+    """
+    data = request.json or {}
+    changes = data.get('changes')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'error': 'changes must be a non-empty list'}), 400
     
-    # Update payment due dates
-    for payment in job.payments:
-        if payment.type == 'Build Installment':
-            payment.due_date = job.build_start_date
-        elif payment.type in ['Fitting Installment', 'Completion']:
-            payment.due_date = job.fitting_date
+    if not all(isinstance(change, dict) and isinstance(change.get('job_id'), int) for change in changes):
+        return jsonify({'error': 'Each change needs an integer job_id'}), 400
     
-    db.session.commit()
-    return jsonify(job.to_dict())
+    job_ids = [change['job_id'] for change in changes]
+    if len(set(job_ids)) != len(job_ids):
+        return jsonify({'error': 'Each job can only be changed once per batch'}), 400
+    jobs = {job.id: job for job in WorkshopJob.query.filter(WorkshopJob.id.in_(job_ids))}
+    
+    moves = []
+    try:
+        for change in changes:
+            job = jobs.get(change['job_id'])
+            if not job:
+                raise ValueError(f"Unknown job {change['job_id']}")
+            build_start_date = datetime.strptime(change['build_start_date'], '%Y-%m-%d').date() if change.get('build_start_date') else None
+            fitting_date = datetime.strptime(change['fitting_date'], '%Y-%m-%d').date() if change.get('fitting_date') else None
+            if not build_start_date and not fitting_date:
+                raise ValueError(f'No new dates for {job.name}')
+            if job.fitting_date_status == 'Confirmed' and fitting_date and job.fitting_date and job.fitting_date != fitting_date:
+                raise ValueError(f'{job.name} has a confirmed fitting date')
+            moved = moved_copy(job, build_start_date, fitting_date)
+            if (moved.build_start_date, moved.fitting_date) != (job.build_start_date, job.fitting_date):
+                moves.append((job, moved))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Changes could not be applied: {e}'}), 400
+    
+    if not moves:
+        return jsonify({'jobs': [], 'payments': []})
+    
+    conflicts = reschedule_conflicts(moves)
+    if conflicts:
+        return jsonify({'error': 'Assigned staff are absent or already booked during the new dates', 'conflicts': conflicts}), 400
+    
+    # Read before the write, which expires the loaded jobs
+    moved_ids = [job.id for job, _ in moves]
+    apply_reschedule(moves)
+    return jsonify(changed_rows(moved_ids))
 
 @job_bp.route('/api/jobs/<int:job_id>/assignments', methods=['GET'])
 @login_required
 def get_job_assignments(job_id):
     """Get staff assignments for a job"""
-    job = WorkshopJob.query.get_or_404(job_id)
-    return jsonify([assignment.to_dict() for assignment in job.assignments])
+    scope = WorkshopJob.query.filter_by(id=job_id)
+    return conditional_response(
+        [scope, JobAssignment.query.filter_by(job_id=job_id), User.query],
+        lambda: jsonify([assignment.to_dict() for assignment in scope.first_or_404().assignments])
+    )
 
 @job_bp.route('/api/jobs/<int:job_id>/assignments', methods=['POST'])
 @login_required
@@ -247,13 +330,13 @@ def create_job_assignment(job_id):
     user = User.query.get_or_404(data['user_id'])
     
     if data['role'] == 'Build Team' and job.build_start_date:
-        build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-        if not user.is_available(job.build_start_date, build_end):
+        build_start, build_end = job.build_window()
+        if not staff_calendar(build_start, build_end).is_available(user.id, build_start, build_end):
             return jsonify({'error': 'User is not available during build dates'}), 400
     
     if data['role'] == 'Fit Team' and job.fitting_date:
-        fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
-        if not user.is_available(job.fitting_date, fit_end):
+        fit_start, fit_end = job.fit_window()
+        if not staff_calendar(fit_start, fit_end).is_available(user.id, fit_start, fit_end):
             return jsonify({'error': 'User is not available during fitting dates'}), 400
     
     assignment = JobAssignment(
@@ -263,7 +346,7 @@ def create_job_assignment(job_id):
     )
     
     db.session.add(assignment)
-    db.session.commit()
+    db.session.flush()
     return jsonify(assignment.to_dict()), 201
 
 @job_bp.route('/api/jobs/<int:job_id>/assignments/<int:assignment_id>', methods=['DELETE'])
@@ -275,69 +358,282 @@ def delete_job_assignment(job_id, assignment_id):
         return jsonify({'error': 'Assignment does not belong to this job'}), 400
     
     db.session.delete(assignment)
-    db.session.commit()
     return '', 204
 
 @job_bp.route('/api/jobs/<int:job_id>/auto-assign', methods=['POST'])
 @login_required
 def auto_assign_staff(job_id):
-    """Auto-assign staff to a job based on availability and workload"""
+    """Auto-assign staff to a job based on availability and workload.
+    
+    Pass ?weight=days to balance by days of assigned work remaining rather than
+    the number of active assignments.
+    """
     job = WorkshopJob.query.get_or_404(job_id)
     
-    # Clear existing assignments
-    for assignment in job.assignments:
-        db.session.delete(assignment)
+    # Clear existing assignments; delete-orphan removes them
+    job.assignments = []
+    db.session.flush()
+    
+    # Workload of every candidate in one query
+    workloads = staff_workloads(roles=['CabinetMaker', 'Fitter'])
+    by_workload = workload_key(workloads, weighted=request.args.get('weight') == 'days')
     
     # Find available staff for build team
     if job.build_start_date:
-        build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
+        build_start, build_end = job.build_window()
+        calendar = staff_calendar(build_start, build_end)
         
         # Get cabinet makers
-        cabinet_makers = User.query.filter_by(role='CabinetMaker').all()
+        cabinet_makers = [w['user'] for w in workloads.values() if w['user'].role == 'CabinetMaker']
         
         # Filter by availability and sort by workload
         available_builders = [
             cm for cm in cabinet_makers 
-            if cm.is_available(job.build_start_date, build_end)
+            if calendar.is_available(cm.id, build_start, build_end)
         ]
-        available_builders.sort(key=lambda cm: cm.get_current_workload())
+        available_builders.sort(key=by_workload)
         
         # Assign 1-2 builders based on job size
-        num_builders = 2 if (job.estimated_build_days or 0) > 10 else 1
+        num_builders = job.required_builders()
         for i in range(min(num_builders, len(available_builders))):
-            assignment = JobAssignment(
-                job_id=job_id,
+            job.assignments.append(JobAssignment(
                 user_id=available_builders[i].id,
                 role='Build Team'
-            )
-            db.session.add(assignment)
+            ))
     
     # Find available staff for fit team
     if job.fitting_date:
-        fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
+        fit_start, fit_end = job.fit_window()
+        calendar = staff_calendar(fit_start, fit_end)
         
         # Get fitters
-        fitters = User.query.filter(User.role.in_(['CabinetMaker', 'Fitter'])).all()
+        fitters = [w['user'] for w in workloads.values()]
         
         # Filter by availability and sort by workload
         available_fitters = [
             f for f in fitters 
-            if f.is_available(job.fitting_date, fit_end)
+            if calendar.is_available(f.id, fit_start, fit_end)
         ]
-        available_fitters.sort(key=lambda f: f.get_current_workload())
+        available_fitters.sort(key=by_workload)
         
         # Assign 1 fitter
         if available_fitters:
-            assignment = JobAssignment(
-                job_id=job_id,
+            job.assignments.append(JobAssignment(
                 user_id=available_fitters[0].id,
                 role='Fit Team'
-            )
-            db.session.add(assignment)
+            ))
     
-    db.session.commit()
+    db.session.flush()
     return jsonify([assignment.to_dict() for assignment in job.assignments])
 
+@job_bp.route('/api/jobs/assignment-plan', methods=['POST'])
+@login_required
+def propose_assignment_plan():
+    """Propose Build Team and Fit Team assignments for every job in a date horizon.
+    
+    Body: {"from": "YYYY-MM-DD", "to": "YYYY-MM-DD", "reassign": false}. Without
+    reassign only roles that nobody is assigned to yet are planned. Nothing is
+    written; POST the result to /api/jobs/assignment-plan/apply to accept it.
+    """
+    data = request.json or {}
+    try:
+        start_date = datetime.strptime(data['from'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data['to'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'from and to must both be dates in YYYY-MM-DD format'}), 400
+    if end_date < start_date:
+        return jsonify({'error': 'to must not be before from'}), 400
+    
+    planner = AssignmentPlanner(start_date, end_date, reassign=bool(data.get('reassign')))
+    return jsonify(planner.plan())
+
+@job_bp.route('/api/jobs/assignment-plan/apply', methods=['POST'])
+@login_required
+def apply_assignment_plan_route():
+    """Apply a proposed assignment plan atomically"""
+    data = request.json or {}
+    try:
+        assignments = apply_assignment_plan(data.get('assignments', []), reassign=bool(data.get('reassign')))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Plan could not be applied: {e}'}), 400
+    
+    db.session.flush()
+    return jsonify([assignment.to_dict() for assignment in assignments]), 201
+
+@job_bp.route('/api/jobs/available-slots', methods=['GET'])
+@login_required
+def get_available_slots():
+    """Earliest dates a new job could start with builders and a fitter free.
+    
+    Query: build_days, fitting_days (or quote_id to use a quote's estimates),
+    count (default 5), from (default today), horizon in days (default 365).
+    """
+    from src.models.quote import Quote
+    
+    try:
+        build_days = request.args.get('build_days', type=int)
+        fitting_days = request.args.get('fitting_days', type=int)
+        if request.args.get('quote_id'):
+            quote = Quote.query.get_or_404(int(request.args['quote_id']))
+            build_days = build_days or quote.estimated_build_days
+            fitting_days = fitting_days or quote.estimated_fitting_days
+        if any(days is not None and days < 1 for days in (build_days, fitting_days)):
+            raise ValueError('build_days and fitting_days must be at least 1')
+        start_date = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else datetime.now().date()
+        count = min(max(int(request.args.get('count', 5)), 1), 50)
+        horizon = min(max(int(request.args.get('horizon', DEFAULT_HORIZON_DAYS)), 1), 3 * DEFAULT_HORIZON_DAYS)
+    except ValueError:
+        return jsonify({'error': 'Invalid slot search parameters'}), 400
+    
+    finder = SlotFinder(start_date, horizon)
+    return jsonify(finder.find(build_days, fitting_days, builders=builders_for(build_days), count=count))
+
+@job_bp.route('/api/jobs/schedule-plan', methods=['POST'])
+@login_required
+def propose_schedule_plan():
+    """Propose build start and fitting dates that level weekly workshop load.
+    
+    Body (optional): {"time_budget": seconds, "seed": int}. Runs on an in-memory
+    snapshot and writes nothing; POST the chosen jobs to
+    /api/jobs/schedule-plan/apply to accept them.
+    """
+    data = request.json or {}
+    try:
+        time_budget = min(max(float(data.get('time_budget', DEFAULT_TIME_BUDGET)), 0.1), MAX_TIME_BUDGET)
+        seed = int(data.get('seed', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'time_budget and seed must be numbers'}), 400
+    
+    return jsonify(ScheduleSolver(seed=seed).solve(time_budget))
+
+@job_bp.route('/api/jobs/schedule-plan/apply', methods=['POST'])
+@login_required
+def apply_schedule_plan():
+    """Apply proposed dates: {"jobs": [{"job_id", "build_start_date", "fitting_date"}]}
+    
+    Checked like a reschedule batch, against staff absences and double
+    bookings, and nothing is written unless every job passes.
+    """
+    data = request.json or {}
+    items = data.get('jobs')
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'jobs must be a non-empty list of objects'}), 400
+    if not all(isinstance(item.get('job_id'), int) for item in items):
+        return jsonify({'error': 'Each job needs an integer job_id'}), 400
+    
+    job_ids = [item['job_id'] for item in items]
+    if len(set(job_ids)) != len(job_ids):
+        return jsonify({'error': 'Each job can only be changed once per plan'}), 400
+    jobs = {job.id: job for job in WorkshopJob.query.filter(WorkshopJob.id.in_(job_ids))}
+    
+    moves = []
+    try:
+        for item in items:
+            job = jobs.get(item['job_id'])
+            if not job:
+                raise ValueError(f"Unknown job {item['job_id']}")
+            build_start_date = datetime.strptime(item['build_start_date'], '%Y-%m-%d').date()
+            fitting_date = datetime.strptime(item['fitting_date'], '%Y-%m-%d').date()
+            if job.fitting_date_status == 'Confirmed' and job.fitting_date and job.fitting_date != fitting_date:
+                raise ValueError(f'{job.name} has a confirmed fitting date')
+            moves.append((job, moved_copy(job, build_start_date, fitting_date)))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Plan could not be applied: {e}'}), 400
+    
+    conflicts = reschedule_conflicts(moves)
+    if conflicts:
+        return jsonify({'error': 'Assigned staff are absent or already booked during the new dates', 'conflicts': conflicts}), 400
+    
+    for job, moved in moves:
+        job.reschedule(build_start_date=moved.build_start_date, fitting_date=moved.fitting_date)
+    db.session.flush()
+    return jsonify([jobs[job_id].to_dict() for job_id in job_ids])
+
+def calendar_intervals(jobs, start_date, end_date):
+    """Build, spray and fit intervals of each job, clipped to [start_date, end_date].
+    
+    Teams are resolved once per job. Fit is only shown once a fitting date is booked.
+    """
+    intervals = []
+    for job in jobs:
+        windows = job.schedule_windows()
+        client_name = job.client.name if job.client else ''
+        teams = {
+            'Build': [assignment.user.full_name for assignment in job.get_build_team()],
+            'Spray': [],  # Spray team not tracked in assignments
+            'Fit': [assignment.user.full_name for assignment in job.get_fit_team()]
+        }
+        
+        for stage in ['Build', 'Spray', 'Fit']:
+            if stage not in windows or (stage == 'Fit' and not job.fitting_date):
+                continue
+            stage_start, stage_end = windows[stage]
+            if stage_start > end_date or stage_end < start_date:
+                continue
+            
+            intervals.append({
+                'job_id': job.id,
+                'job_name': job.name,
+                'client_name': client_name,
+                'stage': stage,
+                'start': max(stage_start, start_date),
+                'end': min(stage_end, end_date),
+                'team': teams[stage]
+            })
+    return intervals
+
+def expand_intervals(intervals):
+    """Expand interval records into one record per day"""
+    days = []
+    for interval in intervals:
+        current_date = interval['start']
+        while current_date <= interval['end']:
+            days.append({
+                'job_id': interval['job_id'],
+                'job_name': interval['job_name'],
+                'client_name': interval['client_name'],
+                'date': current_date.isoformat(),
+                'stage': interval['stage'],
+                'team': interval['team']
+            })
+            current_date += timedelta(days=1)
+    return days
+
+def calendar_jobs(start_date, end_date):
+    """Jobs with a stage overlapping the range, with clients and teams preloaded"""
+    return with_profile(WorkshopJob.query, 'job_calendar').filter(
+        WorkshopJob.overlaps_window(start_date, end_date)
+    ).order_by(WorkshopJob.build_start_date, WorkshopJob.id).all()
+
+@job_bp.route('/api/jobs/calendar', methods=['GET'])
+@login_required
+def get_calendar():
+    """Get calendar data for any date range (?from=YYYY-MM-DD&to=YYYY-MM-DD).
+    
+    Returns one record per job and stage with its start and end dates clipped to
+    the range. Pass ?expand=days for one record per day instead.
+    """
+    try:
+        start_date = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return jsonify({'error': 'from and to must both be dates in YYYY-MM-DD format'}), 400
+    if end_date < start_date:
+        return jsonify({'error': 'to must not be before from'}), 400
+    
+    def build():
+        intervals = calendar_intervals(calendar_jobs(start_date, end_date), start_date, end_date)
+        
+        if request.args.get('expand') == 'days':
+            return jsonify(expand_intervals(intervals))
+        
+        for interval in intervals:
+            interval['start'] = interval['start'].isoformat()
+            interval['end'] = interval['end'].isoformat()
+        return jsonify(intervals)
+    
+    return conditional_response(calendar_scopes(start_date, end_date), build)
+
 @job_bp.route('/api/jobs/weekly-calendar', methods=['GET'])
 @login_required
 def get_weekly_calendar():
@@ -347,74 +643,12 @@ def get_weekly_calendar():
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
     
-    # Get jobs that overlap with this week
-    jobs = WorkshopJob.query.filter(
-        (WorkshopJob.build_start_date <= end_of_week) & 
-        ((WorkshopJob.fitting_date >= start_of_week) | (WorkshopJob.build_start_date >= start_of_week))
-    ).all()
-    
-    calendar_data = []
-    for job in jobs:
-        # Add build events
-        if job.build_start_date:
-            build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-            
-            # For each day in the build period that falls within this week
-            current_date = max(job.build_start_date, start_of_week)
-            end_date = min(build_end, end_of_week)
-            
-            while current_date <= end_date:
-                calendar_data.append({
-                    'job_id': job.id,
-                    'job_name': job.name,
-                    'client_name': job.client.name if job.client else '',
-                    'date': current_date.isoformat(),
-                    'stage': 'Build',
-                    'team': [assignment.user.full_name for assignment in job.get_build_team()]
-                })
-                current_date += timedelta(days=1)
-        
-        # Add spray events
-        if job.build_start_date:
-            build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-            spray_start = build_end - timedelta(days=1)
-            spray_end = spray_start + timedelta(days=5)
-            
-            # For each day in the spray period that falls within this week
-            current_date = max(spray_start, start_of_week)
-            end_date = min(spray_end, end_of_week)
-            
-            while current_date <= end_date:
-                calendar_data.append({
-                    'job_id': job.id,
-                    'job_name': job.name,
-                    'client_name': job.client.name if job.client else '',
-                    'date': current_date.isoformat(),
-                    'stage': 'Spray',
-                    'team': []  # Spray team not tracked in assignments
-                })
-                current_date += timedelta(days=1)
-        
-        # Add fit events
-        if job.fitting_date:
-            fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
-            
-            # For each day in the fit period that falls within this week
-            current_date = max(job.fitting_date, start_of_week)
-            end_date = min(fit_end, end_of_week)
-            
-            while current_date <= end_date:
-                calendar_data.append({
-                    'job_id': job.id,
-                    'job_name': job.name,
-                    'client_name': job.client.name if job.client else '',
-                    'date': current_date.isoformat(),
-                    'stage': 'Fit',
-                    'team': [assignment.user.full_name for assignment in job.get_fit_team()]
-                })
-                current_date += timedelta(days=1)
-    
-    return jsonify(calendar_data)
+    return conditional_response(
+        calendar_scopes(start_of_week, end_of_week),
+        lambda: jsonify(expand_intervals(
+            calendar_intervals(calendar_jobs(start_of_week, end_of_week), start_of_week, end_of_week)
+        ))
+    )
 
 @job_bp.route('/api/jobs/clients-needing-updates', methods=['GET'])
 @login_required
@@ -1,26 +1,144 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
-from src.models.payment import Payment
+from src.models.payment import Payment, PaymentRule, ANY_TYPE, DUE_FIELDS
 from src.models.job import WorkshopJob
-from datetime import datetime, timedelta
+from src.models.loaders import with_profile
+from src.models.etag import conditional_response, payment_scopes
+from src.models.pagination import (
+    paginate, paginated_response, apply_filters, eq_filter, in_filter, from_filter, to_filter
+)
+from src.models.sql import month_start, week_start
+from datetime import date, datetime, timedelta
 from flask_login import login_required, current_user
+from src.services.cache import response_cache
+from src.services.payment_schedule import load_rules, regenerate_schedules
 import calendar
 
 payment_bp = Blueprint('payment', __name__)
 
+PAYMENT_SORT_KEYS = {
+    'due_date': Payment.due_date,
+    'paid_date': Payment.paid_date,
+    'amount': Payment.amount,
+    'created_at': Payment.created_at,
+    'updated_at': Payment.updated_at
+}
+
+PAYMENT_FILTERS = {
+    'job_id': eq_filter(Payment.job_id, int),
+    'status': in_filter(Payment.status),
+    'type': in_filter(Payment.type),
+    'due_from': from_filter(Payment.due_date),
+    'due_to': to_filter(Payment.due_date),
+    'paid_from': from_filter(Payment.paid_date),
+    'paid_to': to_filter(Payment.paid_date)
+}
+
+PAYMENT_TYPE_KEYS = {
+    'Deposit': 'deposit',
+    'Build Installment': 'build',
+    'Fitting Installment': 'fit',
+    'Completion': 'completion'
+}
+
+PERIOD_STARTS = {'month': month_start, 'week': week_start}
+DEFAULT_FORECAST_MONTHS = 7  # Current month + 6 future months
+DEFAULT_HISTORY_MONTHS = 3
+MAX_REPORT_MONTHS = 120
+
+def add_months(day, months):
+    """First day of the month `months` after the month containing day"""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def report_period_args(default_months):
+    """Parse ?months= and ?granularity= for the cashflow reports"""
+    try:
+        months = int(request.args.get('months', default_months))
+    except ValueError:
+        raise ValueError('months must be an integer')
+    if not 1 <= months <= MAX_REPORT_MONTHS:
+        raise ValueError(f'months must be between 1 and {MAX_REPORT_MONTHS}')
+    
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in PERIOD_STARTS:
+        raise ValueError('granularity must be month or week')
+    return months, granularity
+
+def payment_periods(date_column, status, start_date, end_date, granularity):
+    """Payment totals per period and type between the dates, from one GROUP BY query.
+    
+    Weekly periods run Monday to Sunday, so the range is widened to whole weeks.
+    """
+    periods = []
+    if granularity == 'week':
+        start_date -= timedelta(days=start_date.weekday())
+        end_date += timedelta(days=6 - end_date.weekday())
+    period_start = start_date
+    while period_start <= end_date:
+        if granularity == 'week':
+            next_start = period_start + timedelta(days=7)
+            label = {'week': period_start.strftime('Week of %d %B %Y')}
+        else:
+            next_start = add_months(period_start, 1)
+            label = {'month': period_start.strftime('%B %Y')}
+        periods.append(dict(label, **{
+            'start_date': period_start,
+            'end_date': next_start - timedelta(days=1),
+            'total': 0,
+            'deposit': 0,
+            'build': 0,
+            'fit': 0,
+            'completion': 0
+        }))
+        period_start = next_start
+    
+    bucket = PERIOD_STARTS[granularity](date_column)
+    totals = db.session.query(bucket, Payment.type, db.func.sum(Payment.amount)).filter(
+        date_column >= start_date,
+        date_column <= end_date,
+        Payment.status == status
+    ).group_by(bucket, Payment.type)
+    
+    by_start = {period['start_date']: period for period in periods}
+    for period_start, payment_type, amount in totals:
+        period = by_start[period_start]
+        period['total'] += amount
+        if payment_type in PAYMENT_TYPE_KEYS:
+            period[PAYMENT_TYPE_KEYS[payment_type]] += amount
+    
+    for period in periods:
+        period['start_date'] = period['start_date'].isoformat()
+        period['end_date'] = period['end_date'].isoformat()
+    return periods
+
 @payment_bp.route('/api/payments', methods=['GET'])
 @login_required
 def get_payments():
-    """Get all payments"""
-    payments = Payment.query.all()
-    return jsonify([payment.to_dict() for payment in payments])
+    """Get payments, filtered and paginated (?after=<id>&limit=&sort=)"""
+    try:
+        scope = apply_filters(Payment.query, request.args, PAYMENT_FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        try:
+            payments, next_cursor = paginate(
+                with_profile(Payment.query, 'payment_list'), Payment, request.args,
+                PAYMENT_SORT_KEYS, PAYMENT_FILTERS
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return paginated_response(payments, next_cursor)
+    
+    return conditional_response(payment_scopes(scope), build)
 
 @payment_bp.route('/api/payments/<int:payment_id>', methods=['GET'])
 @login_required
 def get_payment(payment_id):
     """Get a specific payment"""
-    payment = Payment.query.get_or_404(payment_id)
-    return jsonify(payment.to_dict())
+    scope = Payment.query.filter_by(id=payment_id)
+    return conditional_response(payment_scopes(scope), lambda: jsonify(scope.first_or_404().to_dict()))
 
 @payment_bp.route('/api/payments', methods=['POST'])
 @login_required
@@ -38,7 +156,7 @@ def create_payment():
     )
     
     db.session.add(payment)
-    db.session.commit()
+    db.session.flush()
     return jsonify(payment.to_dict()), 201
 
 @payment_bp.route('/api/payments/<int:payment_id>/status', methods=['PUT'])
@@ -60,7 +178,7 @@ def update_payment_status(payment_id):
         if payment.paid_date and payment.status == 'Due':
             payment.status = 'Paid'
     
-    db.session.commit()
+    db.session.flush()
     return jsonify(payment.to_dict())
 
 @payment_bp.route('/api/payments/<int:payment_id>/create-in-xero', methods=['POST'])
@@ -72,122 +190,114 @@ def create_payment_in_xero(payment_id):
     # This would be implemented when Xero integration is added
     # For now, just update the xero_invoice_id field with a placeholder
     payment.xero_invoice_id = f"XERO-INV-{payment_id}-{datetime.now().strftime('%Y%m%d')}"
-    db.session.commit()
     
     return jsonify({
         'message': 'Invoice created in Xero (simulated)',
         'xero_invoice_id': payment.xero_invoice_id
     })
 
+@payment_bp.route('/api/payments/rules', methods=['GET'])
+@login_required
+def get_payment_rules():
+    """Payment split rules by cabinetry type ('*' applies to every other type)"""
+    return jsonify({
+        cabinetry_type: [{'type': type, 'share': share, 'due': due} for type, share, due in rules]
+        for cabinetry_type, rules in load_rules().items()
+    })
+
+@payment_bp.route('/api/payments/rules/<cabinetry_type>', methods=['PUT'])
+@login_required
+def set_payment_rules(cabinetry_type):
+    """Replace the rules of a cabinetry type: {"rules": [{"type", "share", "due"}]}.
+    
+    Existing schedules are kept; POST /api/payments/schedules/regenerate to apply.
+    """
+    data = request.json or {}
+    cabinetry_type = cabinetry_type.lower()
+    try:
+        rules = [
+            PaymentRule(
+                cabinetry_type=cabinetry_type,
+                position=position,
+                type=str(item['type']),
+                share=float(item['share']),
+                due=item['due']
+            )
+            for position, item in enumerate(data['rules'])
+        ]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'rules must be a list of {type, share, due}'}), 400
+    
+    if any(rule.due not in DUE_FIELDS for rule in rules):
+        return jsonify({'error': f'due must be one of {", ".join(DUE_FIELDS)}'}), 400
+    if rules and (any(rule.share <= 0 for rule in rules) or abs(sum(rule.share for rule in rules) - 1) > 1e-6):
+        return jsonify({'error': 'shares must be positive and add up to 1'}), 400
+    # An empty list drops the type's own rules, so the * rules apply to it
+    if not rules and cabinetry_type == ANY_TYPE:
+        return jsonify({'error': f'the {ANY_TYPE} rules cannot be removed'}), 400
+    
+    if not PaymentRule.query.first():
+        # Still on the built-in defaults: store them before changing one type
+        db.session.add_all([
+            PaymentRule(cabinetry_type=key, position=position, type=type, share=share, due=due)
+            for key, defaults in load_rules().items()
+            for position, (type, share, due) in enumerate(defaults)
+        ])
+    PaymentRule.query.filter_by(cabinetry_type=cabinetry_type).delete(synchronize_session='fetch')
+    db.session.add_all(rules)
+    db.session.flush()
+    return jsonify([rule.to_dict() for rule in rules])
+
+@payment_bp.route('/api/payments/schedules/regenerate', methods=['POST'])
+@login_required
+def regenerate_payment_schedules():
+    """Re-derive payment schedules from the rules in one transaction.
+    
+    Body (optional): {"job_ids": [...], "include_paid": false}. Without job_ids
+    every priced job that is not finished is covered. Jobs whose payments
+    already match are skipped, as are jobs with a paid payment unless
+    include_paid.
+    """
+    data = request.json or {}
+    job_ids = data.get('job_ids')
+    if job_ids is not None and not (
+        isinstance(job_ids, list) and all(isinstance(job_id, int) for job_id in job_ids)
+    ):
+        return jsonify({'error': 'job_ids must be a list of job ids'}), 400
+    
+    return jsonify(regenerate_schedules(job_ids, include_paid=bool(data.get('include_paid'))))
+
 @payment_bp.route('/api/reports/financial-forecast', methods=['GET'])
 @login_required
+@response_cache.cached('payments')
 def get_financial_forecast():
-    """Get financial forecast for the next 6 months"""
-    # Get current date and calculate start/end of current month
-    today = datetime.now().date()
-    current_month_start = today.replace(day=1)
-    
-    # Calculate the next 6 months
-    months = []
-    for i in range(7):  # Current month + 6 future months
-        month_start = (current_month_start + timedelta(days=32 * i)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        months.append({
-            'month': month_start.strftime('%B %Y'),
-            'start_date': month_start.isoformat(),
-            'end_date': month_end.isoformat(),
-            'total': 0,
-            'deposit': 0,
-            'build': 0,
-            'fit': 0,
-            'completion': 0
-        })
-    
-    # Get all payments with due dates in the next 6 months
-    end_date = months[-1]['end_date']
-    payments = Payment.query.filter(
-        Payment.due_date >= current_month_start,
-        Payment.due_date <= end_date,
-        Payment.status == 'Due'
-    ).all()
-    
-    # Add payments to the appropriate month
-    for payment in payments:
-        for month in months:
-            month_start = datetime.strptime(month['start_date'], '%Y-%m-%d').date()
-            month_end = datetime.strptime(month['end_date'], '%Y-%m-%d').date()
-            
-            if month_start <= payment.due_date <= month_end:
-                month['total'] += payment.amount
-                
-                if payment.type == 'Deposit':
-                    month['deposit'] += payment.amount
-                elif payment.type == 'Build Installment':
-                    month['build'] += payment.amount
-                elif payment.type == 'Fitting Installment':
-                    month['fit'] += payment.amount
-                elif payment.type == 'Completion':
-                    month['completion'] += payment.amount
-                
-                break
-    
-    return jsonify(months)
+    """Get due payments per month from this month on (?months=7&granularity=month|week)"""
+    try:
+        months, granularity = report_period_args(DEFAULT_FORECAST_MONTHS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    current_month_start = datetime.now().date().replace(day=1)
+    end_date = add_months(current_month_start, months) - timedelta(days=1)
+    
+    periods = payment_periods(Payment.due_date, 'Due', current_month_start, end_date, granularity)
+    return jsonify(periods)
 
 @payment_bp.route('/api/reports/income-history', methods=['GET'])
 @login_required
+@response_cache.cached('payments')
 def get_income_history():
-    """Get income history for the past 3 months"""
-    # Get current date and calculate start of 3 months ago
-    today = datetime.now().date()
-    three_months_ago = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
-    three_months_ago = (three_months_ago - timedelta(days=1)).replace(day=1)
-    
-    # Calculate the past 3 months
-    months = []
-    for i in range(3):
-        month_start = (three_months_ago + timedelta(days=32 * i)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        months.append({
-            'month': month_start.strftime('%B %Y'),
-            'start_date': month_start.isoformat(),
-            'end_date': month_end.isoformat(),
-            'total': 0,
-            'deposit': 0,
-            'build': 0,
-            'fit': 0,
-            'completion': 0
-        })
-    
-    # Get all payments with paid dates in the past 3 months
-    start_date = months[0]['start_date']
-    end_date = months[-1]['end_date']
-    payments = Payment.query.filter(
-        Payment.paid_date >= start_date,
-        Payment.paid_date <= end_date,
-        Payment.status == 'Paid'
-    ).all()
-    
-    # Add payments to the appropriate month
-    for payment in payments:
-        for month in months:
-            month_start = datetime.strptime(month['start_date'], '%Y-%m-%d').date()
-            month_end = datetime.strptime(month['end_date'], '%Y-%m-%d').date()
-            
-            if month_start <= payment.paid_date <= month_end:
-                month['total'] += payment.amount
-                
-                if payment.type == 'Deposit':
-                    month['deposit'] += payment.amount
-                elif payment.type == 'Build Installment':
-                    month['build'] += payment.amount
-                elif payment.type == 'Fitting Installment':
-                    month['fit'] += payment.amount
-                elif payment.type == 'Completion':
-                    month['completion'] += payment.amount
-                
-                break
+    """Get paid income per month up to this month (?months=3&granularity=month|week)"""
+    try:
+        months, granularity = report_period_args(DEFAULT_HISTORY_MONTHS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    current_month_start = datetime.now().date().replace(day=1)
+    start_date = add_months(current_month_start, 1 - months)
+    end_date = add_months(current_month_start, 1) - timedelta(days=1)
+    
+    months = payment_periods(Payment.paid_date, 'Paid', start_date, end_date, granularity)
     
     # Calculate totals and percentages
     total_income = sum(month['total'] for month in months)
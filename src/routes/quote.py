@@ -1,25 +1,54 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, User
-from src.models.quote import Quote, QuoteExtra
+from src.models.quote import Quote, QuoteExtra, ACCEPTED_STATUSES, PENDING_STATUSES
+from src.models.rollup import load_rollups, rollup_sum
 from src.models.job import WorkshopJob
+from src.models.etag import conditional_response, quote_scopes
+from src.models.loaders import with_profile
+from src.models.pagination import paginate, paginated_response, apply_filters, eq_filter, in_filter
 from datetime import datetime
 from flask_login import login_required, current_user
 
 quote_bp = Blueprint('quote', __name__)
 
+QUOTE_SORT_KEYS = {
+    'name': Quote.name,
+    'initial_quote_amount': Quote.initial_quote_amount,
+    'final_quote_amount': Quote.final_quote_amount,
+    'created_at': Quote.created_at,
+    'updated_at': Quote.updated_at
+}
+
+QUOTE_FILTERS = {
+    'status': in_filter(Quote.status),
+    'cabinetry_type': in_filter(Quote.cabinetry_type),
+    'client_id': eq_filter(Quote.client_id, int)
+}
+
 @quote_bp.route('/api/quotes', methods=['GET'])
 @login_required
 def get_quotes():
-    """Get all quotes"""
-    quotes = Quote.query.all()
-    return jsonify([quote.to_dict() for quote in quotes])
+    """Get quotes, filtered and paginated (?after=<id>&limit=&sort=)"""
+    try:
+        scope = apply_filters(Quote.query, request.args, QUOTE_FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        try:
+            quotes, next_cursor = paginate(with_profile(Quote.query, 'quote_list'), Quote, request.args, QUOTE_SORT_KEYS, QUOTE_FILTERS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return paginated_response(quotes, next_cursor)
+    
+    return conditional_response(quote_scopes(scope), build)
 
 @quote_bp.route('/api/quotes/<int:quote_id>', methods=['GET'])
 @login_required
 def get_quote(quote_id):
     """Get a specific quote"""
-    quote = Quote.query.get_or_404(quote_id)
-    return jsonify(quote.to_dict())
+    scope = Quote.query.filter_by(id=quote_id)
+    return conditional_response(quote_scopes(scope), lambda: jsonify(scope.first_or_404().to_dict()))
 
 @quote_bp.route('/api/quotes', methods=['POST'])
 @login_required
@@ -42,19 +71,15 @@ def create_quote():
         created_by=current_user.id
     )
     
-    db.session.add(quote)
-    db.session.commit()
-    
     # Add extras if provided
     if 'extras' in data:
-        for extra_data in data['extras']:
-            extra = QuoteExtra(
-                quote_id=quote.id,
-                description=extra_data['description'],
-                price=extra_data['price']
-            )
-            db.session.add(extra)
-        db.session.commit()
+        quote.extras = [
+            QuoteExtra(description=extra_data['description'], price=extra_data['price'])
+            for extra_data in data['extras']
+        ]
+    
+    db.session.add(quote)
+    db.session.flush()
     
     return jsonify(quote.to_dict()), 201
 
@@ -87,24 +112,14 @@ def update_quote(quote_id):
     if 'estimated_fitting_days' in data:
         quote.estimated_fitting_days = data['estimated_fitting_days']
     
-    db.session.commit()
-    
-    # Update extras if provided
+    # Replace extras if provided; delete-orphan removes the old ones
     if 'extras' in data:
-        # Delete existing extras
-        for extra in quote.extras:
-            db.session.delete(extra)
-        
-        # Add new extras
-        for extra_data in data['extras']:
-            extra = QuoteExtra(
-                quote_id=quote.id,
-                description=extra_data['description'],
-                price=extra_data['price']
-            )
-            db.session.add(extra)
-        
-        db.session.commit()
+        quote.extras = [
+            QuoteExtra(description=extra_data['description'], price=extra_data['price'])
+            for extra_data in data['extras']
+        ]
+    
+    db.session.flush()
     
     return jsonify(quote.to_dict())
 
@@ -119,7 +134,6 @@ def delete_quote(quote_id):
         return jsonify({'error': 'Cannot delete quote that has been converted to job'}), 400
     
     db.session.delete(quote)
-    db.session.commit()
     return '', 204
 
 @quote_bp.route('/api/quotes/<int:quote_id>/convert-to-job', methods=['POST'])
@@ -141,6 +155,7 @@ def convert_quote_to_job(quote_id):
     
     # Generate payment schedule
     job.generate_payment_schedule()
+    db.session.flush()
     
     return jsonify(job.to_dict()), 201
 
@@ -148,8 +163,11 @@ def convert_quote_to_job(quote_id):
 @login_required
 def get_quote_extras(quote_id):
     """Get extras for a quote"""
-    quote = Quote.query.get_or_404(quote_id)
-    return jsonify([extra.to_dict() for extra in quote.extras])
+    scope = Quote.query.filter_by(id=quote_id)
+    return conditional_response(
+        [QuoteExtra.query.filter_by(quote_id=quote_id), scope],
+        lambda: jsonify([extra.to_dict() for extra in scope.first_or_404().extras])
+    )
 
 @quote_bp.route('/api/quotes/<int:quote_id>/extras', methods=['POST'])
 @login_required
@@ -165,7 +183,7 @@ def add_quote_extra(quote_id):
     )
     
     db.session.add(extra)
-    db.session.commit()
+    db.session.flush()
     return jsonify(extra.to_dict()), 201
 
 @quote_bp.route('/api/quotes/<int:quote_id>/extras/<int:extra_id>', methods=['PUT'])
@@ -183,7 +201,7 @@ def update_quote_extra(quote_id, extra_id):
     if 'price' in data:
         extra.price = data['price']
     
-    db.session.commit()
+    db.session.flush()
     return jsonify(extra.to_dict())
 
 @quote_bp.route('/api/quotes/<int:quote_id>/extras/<int:extra_id>', methods=['DELETE'])
@@ -195,17 +213,17 @@ def delete_quote_extra(quote_id, extra_id):
         return jsonify({'error': 'Extra does not belong to this quote'}), 400
     
     db.session.delete(extra)
-    db.session.commit()
     return '', 204
 
 @quote_bp.route('/api/quotes/stats', methods=['GET'])
 @login_required
 def get_quote_stats():
     """Get quote statistics"""
-    total_quotes = Quote.query.count()
-    accepted_quotes = Quote.query.filter(Quote.status.in_(['Accepted', 'Accepted-Negotiated'])).count()
-    rejected_quotes = Quote.query.filter_by(status='Rejected').count()
-    pending_quotes = Quote.query.filter(Quote.status.in_(['Not Sent', 'Sent', 'Negotiating'])).count()
+    statuses = load_rollups('quote_status')['quote_status']
+    total_quotes = rollup_sum(statuses)[0]
+    accepted_quotes = rollup_sum(statuses, ACCEPTED_STATUSES)[0]
+    rejected_quotes = rollup_sum(statuses, ['Rejected'])[0]
+    pending_quotes = rollup_sum(statuses, PENDING_STATUSES)[0]
     
     conversion_rate = (accepted_quotes / total_quotes) * 100 if total_quotes > 0 else 0
     
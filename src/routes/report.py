@@ -1,39 +1,48 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.job import WorkshopJob
-from src.models.quote import Quote
+from src.models.quote import ACCEPTED_STATUSES, PENDING_STATUSES
+from src.models.rollup import load_rollups, monthly_rollups, rollup_sum
 from src.models.client import Client
 from src.models.payment import Payment
+from src.services.workload import staff_workloads
 from datetime import datetime, timedelta
 from flask_login import login_required, current_user
+from src.services.cache import response_cache
 
 report_bp = Blueprint('report', __name__)
 
 @report_bp.route('/api/reports/dashboard-summary', methods=['GET'])
 @login_required
+@response_cache.cached('workshop_jobs', 'quotes', 'payments')
 def get_dashboard_summary():
     """Get summary data for dashboard"""
+    rollups = load_rollups('job_stage', 'quote_status', 'job_needs_update')
+    
     # Count active jobs
-    active_jobs = WorkshopJob.query.filter(WorkshopJob.stage != 'Finished').count()
+    active_jobs = rollup_sum(rollups['job_stage'])[0] - rollup_sum(rollups['job_stage'], ['Finished'])[0]
     
     # Count pending quotes
-    pending_quotes = Quote.query.filter(Quote.status.in_(['Not Sent', 'Sent', 'Negotiating'])).count()
+    pending_quotes = rollup_sum(rollups['quote_status'], PENDING_STATUSES)[0]
     
     # Calculate upcoming payments (next 30 days)
     today = datetime.now().date()
     thirty_days = today + timedelta(days=30)
-    upcoming_payments = Payment.query.filter(
+    upcoming_payment_total = db.session.query(db.func.coalesce(db.func.sum(Payment.amount), 0)).filter(
         Payment.due_date >= today,
         Payment.due_date <= thirty_days,
         Payment.status == 'Due'
-    ).all()
-    upcoming_payment_total = sum(payment.amount for payment in upcoming_payments)
+    ).scalar()
     
     # Count clients needing updates
-    clients_needing_updates = WorkshopJob.query.filter_by(client_needs_update=True).count()
+    clients_needing_updates = rollup_sum(rollups['job_needs_update'])[0]
+    
+    # Count delayed jobs (depends on today's date, so not rolled up)
+    delayed_jobs = WorkshopJob.query.filter(WorkshopJob.status == 'Delayed').count()
     
     return jsonify({
         'active_jobs': active_jobs,
+        'delayed_jobs': delayed_jobs,
         'pending_quotes': pending_quotes,
         'upcoming_payment_total': upcoming_payment_total,
         'clients_needing_updates': clients_needing_updates
@@ -41,29 +50,37 @@ def get_dashboard_summary():
 
 @report_bp.route('/api/reports/quote-conversion', methods=['GET'])
 @login_required
+@response_cache.cached('quotes')
 def get_quote_conversion():
     """Get quote conversion statistics"""
-    # Get all quotes
-    quotes = Quote.query.all()
+    rollups = load_rollups('quote_status', 'quote_discount')
     
     # Count by status
-    total = len(quotes)
-    accepted = sum(1 for q in quotes if q.status in ['Accepted', 'Accepted-Negotiated'])
-    rejected = sum(1 for q in quotes if q.status == 'Rejected')
-    pending = sum(1 for q in quotes if q.status in ['Not Sent', 'Sent', 'Negotiating'])
+    total, total_value = rollup_sum(rollups['quote_status'])
+    accepted = rollup_sum(rollups['quote_status'], ACCEPTED_STATUSES)[0]
+    rejected = rollup_sum(rollups['quote_status'], ['Rejected'])[0]
+    pending = rollup_sum(rollups['quote_status'], PENDING_STATUSES)[0]
     
     # Calculate conversion rate
     conversion_rate = (accepted / total * 100) if total > 0 else 0
     
     # Calculate average quote value
-    avg_quote_value = sum(q.initial_quote_amount for q in quotes) / total if total > 0 else 0
+    avg_quote_value = total_value / total if total > 0 else 0
     
     # Calculate average negotiation discount
-    negotiated_quotes = [q for q in quotes if q.status == 'Accepted-Negotiated' and q.final_quote_amount]
-    avg_discount = 0
-    if negotiated_quotes:
-        discounts = [(q.initial_quote_amount - q.final_quote_amount) / q.initial_quote_amount * 100 for q in negotiated_quotes]
-        avg_discount = sum(discounts) / len(discounts)
+    negotiated, total_discount = rollup_sum(rollups['quote_discount'])
+    avg_discount = total_discount / negotiated if negotiated else 0
+    
+    # Quotes created per month
+    monthly = []
+    for period, statuses in monthly_rollups('quote_status').items():
+        count, value = rollup_sum(statuses)
+        monthly.append({
+            'month': period,
+            'total_quotes': count,
+            'accepted_quotes': rollup_sum(statuses, ACCEPTED_STATUSES)[0],
+            'total_value': value
+        })
     
     return jsonify({
         'total_quotes': total,
@@ -72,48 +89,36 @@ def get_quote_conversion():
         'pending_quotes': pending,
         'conversion_rate': conversion_rate,
         'avg_quote_value': avg_quote_value,
-        'avg_discount': avg_discount
+        'avg_discount': avg_discount,
+        'monthly': monthly
     })
 
 @report_bp.route('/api/reports/job-performance', methods=['GET'])
 @login_required
+@response_cache.cached('workshop_jobs')
 def get_job_performance():
     """Get job performance statistics"""
-    # Get completed jobs
-    completed_jobs = WorkshopJob.query.filter_by(stage='Finished').all()
+    rollups = load_rollups('job_stage', 'job_build_variance', 'job_fit_variance', 'job_type', 'job_type_priced')
     
-    # Calculate average build time variance
-    build_variances = []
-    for job in completed_jobs:
-        if job.estimated_build_days and job.actual_build_days:
-            variance = (job.actual_build_days - job.estimated_build_days) / job.estimated_build_days * 100
-            build_variances.append(variance)
+    # Count completed jobs
+    completed_jobs = rollup_sum(rollups['job_stage'], ['Finished'])[0]
     
-    avg_build_variance = sum(build_variances) / len(build_variances) if build_variances else 0
+    # Calculate average build time variance
+    count, total_variance = rollup_sum(rollups['job_build_variance'])
+    avg_build_variance = total_variance / count if count else 0
     
     # Calculate average fitting time variance
-    fitting_variances = []
-    for job in completed_jobs:
-        if job.estimated_fitting_days and job.actual_fitting_days:
-            variance = (job.actual_fitting_days - job.estimated_fitting_days) / job.estimated_fitting_days * 100
-            fitting_variances.append(variance)
-    
-    avg_fitting_variance = sum(fitting_variances) / len(fitting_variances) if fitting_variances else 0
+    count, total_variance = rollup_sum(rollups['job_fit_variance'])
+    avg_fitting_variance = total_variance / count if count else 0
     
     # Calculate average job price by type
-    job_types = {}
-    for job in WorkshopJob.query.all():
-        if job.cabinetry_type not in job_types:
-            job_types[job.cabinetry_type] = []
-        if job.job_price:
-            job_types[job.cabinetry_type].append(job.job_price)
-    
     avg_prices = {}
-    for job_type, prices in job_types.items():
-        avg_prices[job_type] = sum(prices) / len(prices) if prices else 0
+    for job_type in rollups['job_type']:
+        count, total_price = rollups['job_type_priced'].get(job_type, (0, 0))
+        avg_prices[job_type] = total_price / count if count else 0
     
     return jsonify({
-        'completed_jobs': len(completed_jobs),
+        'completed_jobs': completed_jobs,
         'avg_build_variance': avg_build_variance,
         'avg_fitting_variance': avg_fitting_variance,
         'avg_prices_by_type': avg_prices
@@ -121,37 +126,23 @@ def get_job_performance():
 
 @report_bp.route('/api/reports/staff-workload', methods=['GET'])
 @login_required
+@response_cache.cached('users', 'job_assignments', 'workshop_jobs', 'staff_absences')
 def get_staff_workload():
     """Get staff workload statistics"""
-    from src.models.user import User
-    
-    # Get all cabinet makers
-    staff = User.query.filter(User.role.in_(['CabinetMaker', 'Manager'])).all()
-    
-    workloads = []
-    for user in staff:
-        # Count active job assignments
-        active_assignments = 0
-        for assignment in user.job_assignments:
-            if assignment.job and assignment.job.stage not in ['Finished', 'Not Started']:
-                active_assignments += 1
-        
-        # Count upcoming absences
-        today = datetime.now().date()
-        upcoming_absences = sum(1 for absence in user.absences if absence.end_date >= today)
-        
-        workloads.append({
-            'user_id': user.id,
-            'name': user.full_name,
-            'role': user.role,
-            'active_assignments': active_assignments,
-            'upcoming_absences': upcoming_absences
-        })
-    
-    return jsonify(workloads)
+    workloads = staff_workloads(roles=['CabinetMaker', 'Manager'])
+    
+    return jsonify([{
+        'user_id': user_id,
+        'name': workload['user'].full_name,
+        'role': workload['user'].role,
+        'active_assignments': workload['active_assignments'],
+        'remaining_days': workload['remaining_days'],
+        'upcoming_absences': workload['upcoming_absences']
+    } for user_id, workload in workloads.items()])
 
 @report_bp.route('/api/reports/clients-needing-updates', methods=['GET'])
 @login_required
+@response_cache.cached('workshop_jobs', 'clients')
 def get_clients_needing_updates():
     """Get list of clients that need updates"""
     jobs = WorkshopJob.query.filter_by(client_needs_update=True).all()
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, User
 from src.models.staff_absence import StaffAbsence
+from src.models.etag import conditional_response
+from src.services.staff_calendar import StaffCalendar, staff_calendar
+from src.services.conflicts import find_staff_conflicts
 from datetime import datetime, timedelta
 from flask_login import login_required, current_user
 
@@ -10,15 +13,15 @@ staff_bp = Blueprint('staff', __name__)
 @login_required
 def get_staff():
     """Get all staff members"""
-    staff = User.query.filter(User.role.in_(['CabinetMaker', 'Manager'])).all()
-    return jsonify([user.to_dict() for user in staff])
+    scope = User.query.filter(User.role.in_(['CabinetMaker', 'Manager']))
+    return conditional_response([scope], lambda: jsonify([user.to_dict() for user in scope.all()]))
 
 @staff_bp.route('/api/staff/<int:user_id>', methods=['GET'])
 @login_required
 def get_staff_member(user_id):
     """Get a specific staff member"""
-    user = User.query.get_or_404(user_id)
-    return jsonify(user.to_dict())
+    scope = User.query.filter_by(id=user_id)
+    return conditional_response([scope], lambda: jsonify(scope.first_or_404().to_dict()))
 
 @staff_bp.route('/api/staff/<int:user_id>/schedule', methods=['GET'])
 @login_required
@@ -30,55 +33,32 @@ def get_staff_schedule(user_id):
     today = datetime.now().date()
     end_date = today + timedelta(days=30)
     
-    # Get all job assignments for this user
+    calendar = StaffCalendar.load(today, end_date, user_ids=[user.id])
+    
+    # Job assignments whose build or fit period overlaps the next 30 days
     assignments = []
-    for assignment in user.job_assignments:
+    for assignment, start, end in calendar.assignments(user.id, today, end_date):
         job = assignment.job
-        if not job:
-            continue
-            
-        if assignment.role == 'Build Team' and job.build_start_date:
-            build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-            
-            # Only include if build period overlaps with next 30 days
-            if job.build_start_date <= end_date and build_end >= today:
-                assignments.append({
-                    'job_id': job.id,
-                    'job_name': job.name,
-                    'client_name': job.client.name if job.client else '',
-                    'start_date': job.build_start_date.isoformat(),
-                    'end_date': build_end.isoformat(),
-                    'role': 'Build Team',
-                    'stage': 'Build'
-                })
-                
-        if assignment.role == 'Fit Team' and job.fitting_date:
-            fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
-            
-            # Only include if fitting period overlaps with next 30 days
-            if job.fitting_date <= end_date and fit_end >= today:
-                assignments.append({
-                    'job_id': job.id,
-                    'job_name': job.name,
-                    'client_name': job.client.name if job.client else '',
-                    'start_date': job.fitting_date.isoformat(),
-                    'end_date': fit_end.isoformat(),
-                    'role': 'Fit Team',
-                    'stage': 'Fit'
-                })
+        assignments.append({
+            'job_id': job.id,
+            'job_name': job.name,
+            'client_name': job.client.name if job.client else '',
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'role': assignment.role,
+            'stage': 'Build' if assignment.role == 'Build Team' else 'Fit'
+        })
     
-    # Get all absences for this user
+    # Absences overlapping the next 30 days
     absences = []
-    for absence in user.absences:
-        # Only include if absence period overlaps with next 30 days
-        if absence.start_date <= end_date and absence.end_date >= today:
-            absences.append({
-                'id': absence.id,
-                'start_date': absence.start_date.isoformat(),
-                'end_date': absence.end_date.isoformat(),
-                'type': absence.type,
-                'notes': absence.notes
-            })
+    for absence in calendar.absences(user.id, today, end_date):
+        absences.append({
+            'id': absence.id,
+            'start_date': absence.start_date.isoformat(),
+            'end_date': absence.end_date.isoformat(),
+            'type': absence.type,
+            'notes': absence.notes
+        })
     
     return jsonify({
         'assignments': assignments,
@@ -89,8 +69,33 @@ def get_staff_schedule(user_id):
 @login_required
 def get_staff_absences(user_id):
     """Get absences for a staff member"""
-    user = User.query.get_or_404(user_id)
-    return jsonify([absence.to_dict() for absence in user.absences])
+    scope = User.query.filter_by(id=user_id)
+    return conditional_response(
+        [StaffAbsence.query.filter_by(user_id=user_id), scope],
+        lambda: jsonify([absence.to_dict() for absence in scope.first_or_404().absences])
+    )
+
+def conflict_response(conflicts):
+    """400 response listing every conflict; the first one is also described at the top level"""
+    first = conflicts[0]
+    if first['type'] == 'absence':
+        response = {'error': 'Absence overlaps with existing absence'}
+    elif first['role'] == 'Build Team':
+        response = {
+            'error': 'Staff member is assigned to build team during this period',
+            'job_name': first['job_name'],
+            'build_start': first['start_date'],
+            'build_end': first['end_date']
+        }
+    else:
+        response = {
+            'error': 'Staff member is assigned to fit team during this period',
+            'job_name': first['job_name'],
+            'fit_start': first['start_date'],
+            'fit_end': first['end_date']
+        }
+    response['conflicts'] = conflicts
+    return jsonify(response), 400
 
 @staff_bp.route('/api/staff/<int:user_id>/absences', methods=['POST'])
 @login_required
@@ -102,38 +107,9 @@ def create_staff_absence(user_id):
     start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
     end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
     
-    # Check for overlapping absences
-    for absence in user.absences:
-        if absence.overlaps_with_dates(start_date, end_date):
-            return jsonify({'error': 'Absence overlaps with existing absence'}), 400
-    
-    # Check for job assignments during this period
-    for assignment in user.job_assignments:
-        job = assignment.job
-        if not job:
-            continue
-            
-        if assignment.role == 'Build Team' and job.build_start_date:
-            build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-            
-            if job.build_start_date <= end_date and build_end >= start_date:
-                return jsonify({
-                    'error': 'Staff member is assigned to build team during this period',
-                    'job_name': job.name,
-                    'build_start': job.build_start_date.isoformat(),
-                    'build_end': build_end.isoformat()
-                }), 400
-                
-        if assignment.role == 'Fit Team' and job.fitting_date:
-            fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
-            
-            if job.fitting_date <= end_date and fit_end >= start_date:
-                return jsonify({
-                    'error': 'Staff member is assigned to fit team during this period',
-                    'job_name': job.name,
-                    'fit_start': job.fitting_date.isoformat(),
-                    'fit_end': fit_end.isoformat()
-                }), 400
+    conflicts = find_staff_conflicts(user.id, start_date, end_date)
+    if conflicts:
+        return conflict_response(conflicts)
     
     absence = StaffAbsence(
         user_id=user_id,
@@ -144,7 +120,7 @@ def create_staff_absence(user_id):
     )
     
     db.session.add(absence)
-    db.session.commit()
+    db.session.flush()
     return jsonify(absence.to_dict()), 201
 
 @staff_bp.route('/api/staff/<int:user_id>/absences/<int:absence_id>', methods=['PUT'])
@@ -161,38 +137,9 @@ def update_staff_absence(user_id, absence_id):
         start_date = datetime.strptime(data.get('start_date', absence.start_date.isoformat()), '%Y-%m-%d').date()
         end_date = datetime.strptime(data.get('end_date', absence.end_date.isoformat()), '%Y-%m-%d').date()
         
-        # Check for overlapping absences (excluding this one)
-        for other_absence in absence.user.absences:
-            if other_absence.id != absence.id and other_absence.overlaps_with_dates(start_date, end_date):
-                return jsonify({'error': 'Absence overlaps with existing absence'}), 400
-        
-        # Check for job assignments during this period
-        for assignment in absence.user.job_assignments:
-            job = assignment.job
-            if not job:
-                continue
-                
-            if assignment.role == 'Build Team' and job.build_start_date:
-                build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-                
-                if job.build_start_date <= end_date and build_end >= start_date:
-                    return jsonify({
-                        'error': 'Staff member is assigned to build team during this period',
-                        'job_name': job.name,
-                        'build_start': job.build_start_date.isoformat(),
-                        'build_end': build_end.isoformat()
-                    }), 400
-                    
-            if assignment.role == 'Fit Team' and job.fitting_date:
-                fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
-                
-                if job.fitting_date <= end_date and fit_end >= start_date:
-                    return jsonify({
-                        'error': 'Staff member is assigned to fit team during this period',
-                        'job_name': job.name,
-                        'fit_start': job.fitting_date.isoformat(),
-                        'fit_end': fit_end.isoformat()
-                    }), 400
+        conflicts = find_staff_conflicts(user_id, start_date, end_date, exclude_absence_id=absence.id)
+        if conflicts:
+            return conflict_response(conflicts)
         
         absence.start_date = start_date
         absence.end_date = end_date
@@ -202,7 +149,7 @@ def update_staff_absence(user_id, absence_id):
     if 'notes' in data:
         absence.notes = data['notes']
     
-    db.session.commit()
+    db.session.flush()
     return jsonify(absence.to_dict())
 
 @staff_bp.route('/api/staff/<int:user_id>/absences/<int:absence_id>', methods=['DELETE'])
@@ -214,7 +161,6 @@ def delete_staff_absence(user_id, absence_id):
         return jsonify({'error': 'Absence does not belong to this staff member'}), 400
     
     db.session.delete(absence)
-    db.session.commit()
     return '', 204
 
 @staff_bp.route('/api/staff/availability', methods=['GET'])
@@ -234,51 +180,26 @@ def get_staff_availability():
     # Get all staff members
     staff = User.query.filter(User.role.in_(['CabinetMaker', 'Manager'])).all()
     
+    calendar = staff_calendar(start_date, end_date)
+    
     availability = []
     for user in staff:
-        # Check if user has any absences during this period
-        has_absence = False
-        for absence in user.absences:
-            if absence.overlaps_with_dates(start_date, end_date):
-                has_absence = True
-                break
-        
-        # Check if user has any job assignments during this period
+        # Job assignments whose build or fit period overlaps the dates
         assignments = []
-        for assignment in user.job_assignments:
-            job = assignment.job
-            if not job:
-                continue
-                
-            if assignment.role == 'Build Team' and job.build_start_date:
-                build_end = job.build_start_date + timedelta(days=job.build_duration_days or job.estimated_build_days or 7)
-                
-                if job.build_start_date <= end_date and build_end >= start_date:
-                    assignments.append({
-                        'job_id': job.id,
-                        'job_name': job.name,
-                        'start_date': job.build_start_date.isoformat(),
-                        'end_date': build_end.isoformat(),
-                        'role': 'Build Team'
-                    })
-                    
-            if assignment.role == 'Fit Team' and job.fitting_date:
-                fit_end = job.fitting_date + timedelta(days=job.estimated_fitting_days or 3)
-                
-                if job.fitting_date <= end_date and fit_end >= start_date:
-                    assignments.append({
-                        'job_id': job.id,
-                        'job_name': job.name,
-                        'start_date': job.fitting_date.isoformat(),
-                        'end_date': fit_end.isoformat(),
-                        'role': 'Fit Team'
-                    })
+        for assignment, start, end in calendar.assignments(user.id, start_date, end_date):
+            assignments.append({
+                'job_id': assignment.job.id,
+                'job_name': assignment.job.name,
+                'start_date': start.isoformat(),
+                'end_date': end.isoformat(),
+                'role': assignment.role
+            })
         
         availability.append({
             'user_id': user.id,
             'name': user.full_name,
             'role': user.role,
-            'available': not has_absence,
+            'available': calendar.is_available(user.id, start_date, end_date),
             'assignments': assignments,
             'workload': len(assignments)
         })
@@ -1,11 +1,24 @@
 from flask import Blueprint, request, jsonify
 from src.models import db
 from src.models.user import User
+from src.models.etag import conditional_response
+from src.models.pagination import paginate, paginated_response, apply_filters, in_filter
+from src.services.identity import identity_cache
 from flask_login import login_required, current_user, login_user, logout_user
 from werkzeug.security import generate_password_hash
 
 user_bp = Blueprint('user', __name__)
 
+USER_SORT_KEYS = {
+    'username': User.username,
+    'last_name': User.last_name,
+    'created_at': User.created_at
+}
+
+USER_FILTERS = {
+    'role': in_filter(User.role)
+}
+
 @user_bp.route('/health', methods=['GET'])
 @login_required
 def health_check():
@@ -47,12 +60,23 @@ def logout():
 @user_bp.route('/', methods=['GET'])
 @login_required
 def get_users():
-    """Get all users (requires admin privileges)"""
+    """Get users, filtered and paginated (requires admin privileges)"""
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized access'}), 403
         
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    try:
+        scope = apply_filters(User.query, request.args, USER_FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        try:
+            users, next_cursor = paginate(User.query, User, request.args, USER_SORT_KEYS, USER_FILTERS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return paginated_response(users, next_cursor)
+    
+    return conditional_response([scope], build)
 
 @user_bp.route('/<int:user_id>', methods=['GET'])
 @login_required
@@ -62,8 +86,8 @@ def get_user(user_id):
     if current_user.id != user_id and current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized access'}), 403
         
-    user = User.query.get_or_404(user_id)
-    return jsonify(user.to_dict())
+    scope = User.query.filter_by(id=user_id)
+    return conditional_response([scope], lambda: jsonify(scope.first_or_404().to_dict()))
 
 @user_bp.route('/', methods=['POST'])
 @login_required
@@ -98,7 +122,7 @@ def create_user():
     new_user.set_password(data['password'])
     
     db.session.add(new_user)
-    db.session.commit()
+    db.session.flush()
     
     return jsonify(new_user.to_dict()), 201
 
@@ -135,7 +159,8 @@ def update_user(user_id):
     if 'password' in data:
         user.set_password(data['password'])
     
-    db.session.commit()
+    db.session.flush()
+    identity_cache.forget(user_id)
     return jsonify(user.to_dict())
 
 @user_bp.route('/<int:user_id>', methods=['DELETE'])
@@ -152,6 +177,6 @@ def delete_user(user_id):
         return jsonify({'error': 'Cannot delete the last admin user'}), 400
     
     db.session.delete(user)
-    db.session.commit()
+    identity_cache.forget(user_id)
     
     return jsonify({'message': 'User deleted successfully'})
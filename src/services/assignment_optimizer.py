@@ -0,0 +1,291 @@
+from src.models import db
+from src.models.changes import record_changes, DELETE
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.user import User
+from src.services.staff_calendar import StaffCalendar
+
+BUILD_ROLES = ['CabinetMaker']
+FIT_ROLES = ['CabinetMaker', 'Fitter']
+
+# Assignment costs. Raising someone's peak concurrent load dominates, then the
+# total days of work they carry; leaving a slot unfilled is worse than any
+# feasible assignment, and assigning an absent person is worse still.
+PEAK_WEIGHT = 1000
+UNFILLED_COST = 10 ** 7
+INFEASIBLE_COST = 10 ** 9
+
+
+def hungarian(cost):
+    """Minimum-cost assignment of rows to distinct columns.
+
+    cost is an n x m matrix (list of lists) with n <= m. Returns a list giving
+    the column assigned to each row. O(n^2 m).
+    """
+    n = len(cost)
+    if n == 0:
+        return []
+    m = len(cost[0])
+    inf = float('inf')
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    p = [0] * (m + 1)  # p[j]: row matched to column j (1-based, 0 = none)
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def peak_overlap(intervals, start_date, end_date):
+    """Maximum number of the intervals in force on any one day of [start_date, end_date]"""
+    events = []
+    for interval_start, interval_end in intervals:
+        if interval_start <= end_date and interval_end >= start_date:
+            events.append((max(interval_start, start_date), 0))
+            events.append((min(interval_end, end_date), 1))
+    # Starts sort before ends on the same day, since windows are inclusive
+    events.sort()
+    peak = current = 0
+    for _, is_end in events:
+        if is_end:
+            current -= 1
+        else:
+            current += 1
+            peak = max(peak, current)
+    return peak
+
+
+class AssignmentPlanner:
+    """Proposes Build Team and Fit Team assignments for every job in a horizon.
+
+    Each job contributes slots: required_builders() Build slots over its build
+    window and one Fit slot over its fit window. Slots are swept in start date
+    order; all slots starting on the same day overlap, so each person can take
+    at most one of them and the group is solved exactly as a min-cost bipartite
+    matching. The cost of giving a slot to someone grows with the peak number
+    of jobs they would be working on at once and with their total assigned
+    days, which levels load across the team. Absent staff are never assigned.
+    """
+
+    def __init__(self, start_date, end_date, reassign=False):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.reassign = reassign
+
+    def load_jobs(self):
+        return WorkshopJob.query.filter(
+            WorkshopJob.stage != 'Finished',
+            db.or_(
+                WorkshopJob.build_overlaps(self.start_date, self.end_date),
+                WorkshopJob.fit_overlaps(self.start_date, self.end_date)
+            )
+        ).order_by(WorkshopJob.id).all()
+
+    def slots_for(self, job, assigned_roles):
+        slots = []
+        build_window = job.build_window()
+        if build_window and (self.reassign or 'Build Team' not in assigned_roles):
+            for _ in range(job.required_builders()):
+                slots.append({'job': job, 'role': 'Build Team', 'start': build_window[0], 'end': build_window[1]})
+        fit_window = job.fit_window()
+        if fit_window and (self.reassign or 'Fit Team' not in assigned_roles):
+            slots.append({'job': job, 'role': 'Fit Team', 'start': fit_window[0], 'end': fit_window[1]})
+        return slots
+
+    def plan(self):
+        jobs = self.load_jobs()
+        assigned_roles = {}
+        if jobs:
+            for job_id, role in db.session.query(JobAssignment.job_id, JobAssignment.role).filter(
+                JobAssignment.job_id.in_([job.id for job in jobs])
+            ):
+                assigned_roles.setdefault(job_id, set()).add(role)
+
+        slots = []
+        for job in jobs:
+            slots.extend(self.slots_for(job, assigned_roles.get(job.id, set())))
+        slots.sort(key=lambda slot: (slot['start'], slot['job'].id, slot['role']))
+
+        staff = User.query.filter(User.role.in_(set(BUILD_ROLES + FIT_ROLES))).order_by(User.id).all()
+        if not slots:
+            return self.result([], [], staff, {})
+
+        span_start = min(slot['start'] for slot in slots)
+        span_end = max(slot['end'] for slot in slots)
+        calendar = StaffCalendar.load(span_start, span_end, user_ids=[user.id for user in staff])
+
+        # Existing commitments, minus the ones this plan replaces
+        replanned = {(slot['job'].id, slot['role']) for slot in slots}
+        busy = {}
+        for user in staff:
+            busy[user.id] = [
+                (start, end) for assignment, start, end in calendar.assignments(user.id, span_start, span_end)
+                if (assignment.job_id, assignment.role) not in replanned
+            ]
+        assigned_days = {user.id: sum((end - start).days + 1 for start, end in busy[user.id]) for user in staff}
+
+        proposed = []
+        unfilled = []
+        index = 0
+        while index < len(slots):
+            group_end = index
+            while group_end < len(slots) and slots[group_end]['start'] == slots[index]['start']:
+                group_end += 1
+            group = slots[index:group_end]
+            index = group_end
+
+            cost = []
+            for slot in group:
+                eligible_roles = BUILD_ROLES if slot['role'] == 'Build Team' else FIT_ROLES
+                days = (slot['end'] - slot['start']).days + 1
+                row = []
+                for user in staff:
+                    if user.role not in eligible_roles or not calendar.is_available(user.id, slot['start'], slot['end']):
+                        row.append(INFEASIBLE_COST)
+                        continue
+                    peak = peak_overlap(busy[user.id], slot['start'], slot['end'])
+                    load = assigned_days[user.id]
+                    row.append(PEAK_WEIGHT * (2 * peak + 1) + (2 * load * days + days * days) // 100)
+                # One dummy column per slot means "leave unfilled"
+                row.extend([UNFILLED_COST] * len(group))
+                cost.append(row)
+
+            for row, column in enumerate(hungarian(cost)):
+                slot = group[row]
+                if column >= len(staff) or cost[row][column] >= INFEASIBLE_COST:
+                    unfilled.append(slot)
+                    continue
+                user = staff[column]
+                busy[user.id].append((slot['start'], slot['end']))
+                assigned_days[user.id] += (slot['end'] - slot['start']).days + 1
+                proposed.append(dict(slot, user=user))
+
+        return self.result(proposed, unfilled, staff, busy)
+
+    def result(self, proposed, unfilled, staff, busy):
+        peaks = {}
+        for user in staff:
+            intervals = busy.get(user.id, [])
+            peaks[user.id] = peak_overlap(intervals, self.start_date, self.end_date) if intervals else 0
+        return {
+            'from': self.start_date.isoformat(),
+            'to': self.end_date.isoformat(),
+            'reassign': self.reassign,
+            'assignments': [{
+                'job_id': slot['job'].id,
+                'job_name': slot['job'].name,
+                'role': slot['role'],
+                'user_id': slot['user'].id,
+                'user_name': slot['user'].full_name,
+                'start_date': slot['start'].isoformat(),
+                'end_date': slot['end'].isoformat()
+            } for slot in proposed],
+            'unfilled': [{
+                'job_id': slot['job'].id,
+                'job_name': slot['job'].name,
+                'role': slot['role'],
+                'start_date': slot['start'].isoformat(),
+                'end_date': slot['end'].isoformat()
+            } for slot in unfilled],
+            'peak_load': {str(user_id): peak for user_id, peak in peaks.items()},
+            'max_peak_load': max(peaks.values()) if peaks else 0
+        }
+
+
+def apply_assignment_plan(assignments, reassign=False):
+    """Write planned assignments in one transaction.
+
+    Re-checks absences and role eligibility first and raises ValueError, writing
+    nothing, if anything changed since the plan was made. With reassign, the
+    existing assignments for each planned (job, role) are replaced.
+    """
+    if not assignments:
+        return []
+
+    job_ids = {item['job_id'] for item in assignments}
+    user_ids = {item['user_id'] for item in assignments}
+    jobs = {job.id: job for job in WorkshopJob.query.filter(WorkshopJob.id.in_(job_ids))}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+
+    windows = []
+    for item in assignments:
+        job = jobs.get(item['job_id'])
+        user = users.get(item['user_id'])
+        if not job or not user:
+            raise ValueError(f"Unknown job {item['job_id']} or user {item['user_id']}")
+        if item['role'] not in ['Build Team', 'Fit Team']:
+            raise ValueError(f"Invalid role: {item['role']}")
+        eligible_roles = BUILD_ROLES if item['role'] == 'Build Team' else FIT_ROLES
+        if user.role not in eligible_roles:
+            raise ValueError(f'{user.full_name} cannot join the {item["role"]}')
+        window = job.build_window() if item['role'] == 'Build Team' else job.fit_window()
+        if not window:
+            raise ValueError(f'{job.name} has no dates for the {item["role"]}')
+        windows.append((item, job, user, window))
+
+    calendar = StaffCalendar.load(
+        min(window[0] for _, _, _, window in windows),
+        max(window[1] for _, _, _, window in windows),
+        user_ids=list(user_ids)
+    )
+    for item, job, user, window in windows:
+        if not calendar.is_available(user.id, window[0], window[1]):
+            raise ValueError(f'{user.full_name} is not available for {job.name} ({item["role"]})')
+
+    existing = set()
+    if reassign:
+        for job_id, role in {(item['job_id'], item['role']) for item in assignments}:
+            replaced = JobAssignment.query.filter_by(job_id=job_id, role=role)
+            record_changes('job_assignments', [assignment_id for assignment_id, in replaced.with_entities(JobAssignment.id)], DELETE)
+            replaced.delete(synchronize_session=False)
+    else:
+        existing = set(db.session.query(
+            JobAssignment.job_id, JobAssignment.user_id, JobAssignment.role
+        ).filter(JobAssignment.job_id.in_(job_ids)))
+
+    created = []
+    for item, job, user, window in windows:
+        key = (job.id, user.id, item['role'])
+        if key in existing:
+            continue
+        existing.add(key)
+        assignment = JobAssignment(job_id=job.id, user_id=user.id, role=item['role'])
+        db.session.add(assignment)
+        created.append(assignment)
+    return created
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from flask import current_app, has_app_context, request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+DEFAULT_TTL = 300
+DEFAULT_SIZE = 256
+PRUNE_EVERY = 100
+
+
+class LRUCache:
+    """Thread-safe in-process LRU of (value, expires_at), plus table generation counters"""
+
+    def __init__(self, max_entries=DEFAULT_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def generation(self, table):
+        return self._generations.get(table, 0)
+
+    def bump(self, table):
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+
+
+class FileCache:
+    """Cache shared by every worker on the host through a directory.
+
+    Stand-in for a networked store such as Redis, with the same get/set/
+    generation/bump interface. Entries are JSON files replaced atomically;
+    a table's generation is the length of an append-only file, so bumping it
+    from several processes at once needs no locking.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'generations'), exist_ok=True)
+        self._sets = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] < time.time():
+            return None
+        return entry['value']
+
+    def set(self, key, value, ttl):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'expires_at': time.time() + ttl, 'value': value}, f)
+        os.replace(temp_path, self._path(key))
+
+        self._sets += 1
+        if self._sets % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired entries"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    expired = json.load(f)['expires_at'] < now
+                if expired:
+                    os.remove(path)
+            except (OSError, ValueError):
+                continue
+
+    def generation(self, table):
+        try:
+            return os.stat(os.path.join(self.directory, 'generations', table)).st_size
+        except OSError:
+            return 0
+
+    def bump(self, table):
+        with open(os.path.join(self.directory, 'generations', table), 'a') as f:
+            f.write('.')
+
+
+class ResponseCache:
+    """Caches JSON GET responses until a commit changes one of the tables they read.
+
+    Each cached view names the tables it depends on. The cache key includes
+    the request path and query string, today's date and the current
+    generation of each table, and every commit that wrote to a table bumps
+    its generation, so stale entries are never read again and simply age out.
+
+    Configured with RESPONSE_CACHE_BACKEND: 'memory' (per-process LRU, the
+    default), 'file' (LRU in front of a FileCache in RESPONSE_CACHE_DIR,
+    shared by all workers) or 'none'. RESPONSE_CACHE_TTL bounds how long an
+    entry lives and RESPONSE_CACHE_SIZE the number of LRU entries.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        self.enabled = backend != 'none'
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+        self.local = LRUCache(app.config.get('RESPONSE_CACHE_SIZE', DEFAULT_SIZE))
+        self.shared = None
+        if backend == 'file':
+            directory = app.config.get('RESPONSE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'response_cache')
+            self.shared = FileCache(directory)
+        elif backend not in ('memory', 'none'):
+            raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {backend}')
+        app.extensions['response_cache'] = self
+
+    @property
+    def generations(self):
+        return self.shared or self.local
+
+    def invalidate(self, tables):
+        for table in tables:
+            self.generations.bump(table)
+
+    def key_for(self, tables):
+        generations = ','.join(f'{table}:{self.generations.generation(table)}' for table in tables)
+        return f'{request.full_path}|{datetime.now().date().isoformat()}|{generations}'
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value, self.ttl)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value, self.ttl)
+        if self.shared:
+            self.shared.set(key, value, self.ttl)
+
+    def cached(self, *tables):
+        """Decorator for GET views returning JSON that only read the given tables"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                key = self.key_for(tables)
+                value = self.get(key)
+                if value is not None:
+                    response = Response(value, mimetype='application/json')
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.is_json:
+                    self.set(key, response.get_data(as_text=True))
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
+
+
+# Track the tables each transaction writes to, and invalidate them once it commits
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def record_flushed_tables(session, flush_context):
+    tables = _changed_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            tables.add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def record_bulk_tables(orm_execute_state):
+    # Query.update()/delete() and bulk inserts do not go through the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _changed_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_tables(session):
+    tables = session.info.pop('changed_tables', None)
+    if tables and has_app_context():
+        cache = current_app.extensions.get('response_cache')
+        if cache and cache.enabled:
+            cache.invalidate(tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_rolled_back_tables(session):
+    session.info.pop('changed_tables', None)
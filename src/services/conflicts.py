@@ -0,0 +1,55 @@
+from sqlalchemy.orm import contains_eager
+from src.models import db
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.staff_absence import StaffAbsence
+
+
+def find_staff_conflicts(user_id, start_date, end_date, exclude_absence_id=None):
+    """Every absence and assignment window of the user overlapping [start_date, end_date].
+
+    Both checks are range queries in SQL, so the cost depends on the rows near
+    the window rather than on the user's whole history. Returns a list of
+    conflict dicts, absences first, each group ordered by start date.
+    """
+    absence_query = StaffAbsence.query.filter(
+        StaffAbsence.user_id == user_id,
+        StaffAbsence.start_date <= end_date,
+        StaffAbsence.end_date >= start_date
+    )
+    if exclude_absence_id is not None:
+        absence_query = absence_query.filter(StaffAbsence.id != exclude_absence_id)
+
+    conflicts = [{
+        'type': 'absence',
+        'absence_id': absence.id,
+        'absence_type': absence.type,
+        'start_date': absence.start_date.isoformat(),
+        'end_date': absence.end_date.isoformat()
+    } for absence in absence_query.order_by(StaffAbsence.start_date)]
+
+    assignments = JobAssignment.query.join(JobAssignment.job).options(
+        contains_eager(JobAssignment.job)
+    ).filter(
+        JobAssignment.user_id == user_id,
+        db.or_(
+            db.and_(JobAssignment.role == 'Build Team', WorkshopJob.build_overlaps(start_date, end_date)),
+            db.and_(JobAssignment.role == 'Fit Team', WorkshopJob.fit_overlaps(start_date, end_date))
+        )
+    ).all()
+
+    assignment_conflicts = []
+    for assignment in assignments:
+        window_start, window_end = assignment.window()
+        assignment_conflicts.append({
+            'type': 'assignment',
+            'assignment_id': assignment.id,
+            'job_id': assignment.job_id,
+            'job_name': assignment.job.name,
+            'role': assignment.role,
+            'start_date': window_start.isoformat(),
+            'end_date': window_end.isoformat()
+        })
+    assignment_conflicts.sort(key=lambda conflict: (conflict['start_date'], conflict['job_id']))
+
+    return conflicts + assignment_conflicts
@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from itertools import islice
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.models import db
+from src.models.changes import TRACKED_MODELS, UPSERT, DELETE, payload_value
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the memory broker is available
+    fcntl = None
+
+# Tables whose committed changes are pushed to /api/changes/stream
+STREAMED_TABLES = ['workshop_jobs', 'job_assignments', 'payments', 'staff_absences']
+DEFAULT_BACKLOG = 2000
+# Open streams per worker; each holds a worker thread while it waits
+DEFAULT_MAX_STREAMS = 8
+# Rows loaded per SELECT when building the events of a commit
+LOAD_BATCH_SIZE = 500
+POLL_SECONDS = 0.25
+MAX_FILE_BYTES = 5 * 1024 * 1024
+KEEP_SEGMENTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBroker:
+    """Fan-out to the change streams of this process.
+
+    Published events are numbered and kept in a bounded backlog that every
+    stream reads from at its own position, so publishing costs the same however
+    many streams are open, and an idle stream is a thread blocked on one
+    shared condition.
+    """
+
+    def __init__(self, backlog=DEFAULT_BACKLOG):
+        self._backlog = deque(maxlen=backlog)
+        self._position = 0
+        self._condition = threading.Condition()
+
+    def publish(self, events):
+        with self._condition:
+            self._backlog.extend(events)
+            self._position += len(events)
+            self._condition.notify_all()
+
+    def position(self):
+        return self._position
+
+    def lose(self):
+        """Tell every stream that events were lost, so their clients reload"""
+        with self._condition:
+            self._backlog.clear()
+            self._position += 1
+            self._condition.notify_all()
+
+    def wait(self, position, timeout):
+        """(new position, events after position, missed), waiting up to timeout for events.
+
+        missed is True when the stream fell so far behind that some events
+        already left the backlog.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._position > position, timeout)
+            oldest = self._position - len(self._backlog)
+            missed = position < oldest
+            events = list(islice(self._backlog, max(position - oldest, 0), None))
+            return self._position, events, missed
+
+
+class FileBroker:
+    """Fan-out to every worker on the host through append-only files.
+
+    Stand-in for a networked broker such as Redis pub/sub, with the same
+    publish/position/wait interface. Events are appended as JSON lines to
+    numbered segment files, each batch in a single write to an O_APPEND
+    descriptor so batches from several processes never interleave. In each
+    process a single tailer thread reads new lines and hands them to a
+    MemoryBroker that the process's streams wait on.
+
+    Past MAX_FILE_BYTES a segment is closed by creating the next one, and only
+    the newest KEEP_SEGMENTS are kept. Writers hold a shared lock on a lock
+    file and rotation an exclusive one, so a closed segment is never written
+    again and tailers finish it before moving on; only a tailer more than
+    KEEP_SEGMENTS segments behind loses events.
+    """
+
+    def __init__(self, directory, backlog=DEFAULT_BACKLOG, poll=POLL_SECONDS):
+        if fcntl is None:
+            raise RuntimeError('The file change events broker needs fcntl (Unix)')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock_path = os.path.join(directory, 'events.lock')
+        self.backlog = backlog
+        self.poll = poll
+        self._local = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f'events.{segment}.jsonl')
+
+    def _segments(self):
+        """Numbers of the segment files, oldest first"""
+        segments = []
+        for name in os.listdir(self.directory):
+            parts = name.split('.')
+            if len(parts) == 3 and parts[0] == 'events' and parts[2] == 'jsonl' and parts[1].isdigit():
+                segments.append(int(parts[1]))
+        return sorted(segments)
+
+    def publish(self, events):
+        data = ''.join(json.dumps(event) + '\n' for event in events).encode()
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            segment = (self._segments() or [0])[-1]
+            fd = os.open(self._path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                full = os.fstat(fd).st_size > MAX_FILE_BYTES
+            finally:
+                os.close(fd)
+        if full:
+            self._rotate(segment)
+
+    def _rotate(self, segment):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            segments = self._segments()
+            # Another process may have rotated while this one waited for the lock
+            if segments and segments[-1] != segment:
+                return
+            os.close(os.open(self._path(segment + 1), os.O_WRONLY | os.O_CREAT, 0o644))
+            for old in segments[:-KEEP_SEGMENTS + 1]:
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+    @property
+    def local(self):
+        # Threads do not survive a fork, so each worker starts its own tailer
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._local = MemoryBroker(self.backlog)
+                threading.Thread(target=self._tail, args=(self._local,), daemon=True).start()
+            return self._local
+
+    def position(self):
+        return self.local.position()
+
+    def wait(self, position, timeout):
+        return self.local.wait(position, timeout)
+
+    def _tail(self, local):
+        f, segment, pending = None, None, b''
+        segments = self._segments()
+        if segments:
+            segment = segments[-1]
+            try:
+                f = open(self._path(segment), 'rb')
+                f.seek(0, os.SEEK_END)
+            except OSError:
+                f = None
+        while True:
+            chunk = f.read() if f else b''
+            if chunk:
+                *lines, pending = (pending + chunk).split(b'\n')
+                events = _parse_lines(lines)
+                if events:
+                    local.publish(events)
+                continue
+
+            # Caught up: move on once a newer segment exists, as this one is then complete
+            newer = [number for number in self._segments() if segment is None or number > segment]
+            if not newer:
+                time.sleep(self.poll)
+                continue
+            if f:
+                f.close()
+            if segment is not None and newer[0] != segment + 1:
+                logger.warning('Change event segments were removed before this worker read them')
+                local.lose()
+            segment, pending = newer[0], b''
+            try:
+                f = open(self._path(segment), 'rb')
+            except OSError:
+                f = None
+
+
+def _parse_lines(lines):
+    """Events of JSON lines; a damaged line is logged and skipped rather than stopping the tailer"""
+    events = []
+    for line in lines:
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            logger.warning('Skipping a malformed change event line')
+    return events
+
+
+class ChangeEvents:
+    """Pushes committed changes to jobs, assignments, payments and absences to open streams.
+
+    After a commit that wrote any of STREAMED_TABLES, the changed rows are
+    loaded once and published to the broker as events shaped like the
+    /api/changes entries plus their change log cursor; every open
+    /api/changes/stream forwards them.
+
+    Configured with CHANGE_EVENTS_BROKER: 'memory' (streams of this worker
+    only, the default), 'file' (every worker on the host, through
+    CHANGE_EVENTS_DIR), 'none', or a broker object with the publish/position/
+    wait methods of MemoryBroker, e.g. one backed by Redis for several hosts.
+    CHANGE_EVENTS_MAX_STREAMS caps the streams a worker serves at once, so
+    they can never take every thread from the rest of the API.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CHANGE_EVENTS_BROKER', 'memory')
+        self.broker = None
+        if not isinstance(backend, str):
+            self.broker = backend
+        elif backend == 'memory':
+            self.broker = MemoryBroker()
+        elif backend == 'file':
+            directory = app.config.get('CHANGE_EVENTS_DIR') or os.path.join(tempfile.gettempdir(), 'change_events')
+            self.broker = FileBroker(directory)
+        elif backend != 'none':
+            raise ValueError(f'Unknown CHANGE_EVENTS_BROKER: {backend}')
+        self.streams = threading.BoundedSemaphore(app.config.get('CHANGE_EVENTS_MAX_STREAMS', DEFAULT_MAX_STREAMS))
+        app.extensions['change_events'] = self
+
+    @property
+    def enabled(self):
+        return self.broker is not None
+
+    def events_for(self, recorded, deleted_rows):
+        """Events of a committed transaction's change log entries, one per row, in cursor order"""
+        latest = {}
+        for change_id, table_name, row_id, op in sorted(recorded):
+            if table_name in STREAMED_TABLES:
+                latest.pop((table_name, row_id), None)
+                latest[(table_name, row_id)] = (change_id, op)
+
+        rows = {}
+        with db.engine.connect() as connection:
+            for table_name in STREAMED_TABLES:
+                table = TRACKED_MODELS[table_name].__table__
+                ids = [row_id for (name, row_id), (_, op) in latest.items() if name == table_name and op == UPSERT]
+                for start in range(0, len(ids), LOAD_BATCH_SIZE):
+                    for row in connection.execute(table.select().where(table.c.id.in_(ids[start:start + LOAD_BATCH_SIZE]))):
+                        rows[(table_name, row.id)] = {key: payload_value(value) for key, value in row._mapping.items()}
+
+        events = []
+        for (table_name, row_id), (change_id, op) in latest.items():
+            row = rows.get((table_name, row_id)) if op == UPSERT else None
+            events.append({
+                'cursor': change_id,
+                'table': table_name,
+                'id': row_id,
+                'op': UPSERT if row is not None else DELETE,
+                'row': row if row is not None else deleted_rows.get((table_name, row_id))
+            })
+        return events
+
+    def publish(self, recorded, deleted_rows):
+        if any(table_name in STREAMED_TABLES for _, table_name, _, _ in recorded):
+            events = self.events_for(recorded, deleted_rows)
+            if events:
+                self.broker.publish(events)
+
+
+change_events = ChangeEvents()
+
+
+# Keep the last state of deleted rows, and publish each transaction's changes once it commits
+
+@event.listens_for(Session, 'after_flush')
+def remember_deleted_rows(session, flush_context):
+    for obj in session.deleted:
+        table_name = getattr(obj, '__tablename__', None)
+        if table_name in STREAMED_TABLES:
+            # Only what is loaded: the row is gone, so nothing more can be fetched
+            state = inspect(obj)
+            session.info.setdefault('deleted_rows', {})[(table_name, obj.id)] = {
+                attr.key: payload_value(state.dict[attr.key])
+                for attr in state.mapper.column_attrs if attr.key in state.dict
+            }
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_committed_changes(session):
+    recorded = session.info.pop('recorded_changes', None)
+    deleted_rows = session.info.pop('deleted_rows', {})
+    if recorded and has_app_context():
+        events = current_app.extensions.get('change_events')
+        if events and events.enabled:
+            # The transaction is already committed, so neither loading the rows
+            # nor the broker may fail the request
+            try:
+                events.publish(recorded, deleted_rows)
+            except Exception:
+                current_app.logger.exception('Publishing change events failed')
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_deleted_rows(session):
+    session.info.pop('deleted_rows', None)
@@ -0,0 +1,85 @@
+from flask import current_app, g, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from src.models import db
+from src.models.user import User
+from src.services.cache import LRUCache
+
+DEFAULT_TTL = 60
+DEFAULT_SIZE = 1024
+
+
+class IdentityCache:
+    """Users for the flask-login user_loader, without a query per request.
+
+    Each user is memoized on flask.g for the request, and its column values
+    are kept per process for IDENTITY_CACHE_TTL seconds (0 disables this).
+    A cached user is attached to the session as if it had just been loaded,
+    so relationships and writes behave as usual. update_user and delete_user
+    forget the user in their own process once the change commits; other
+    workers pick the change up when their entry expires.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL)
+        self.entries = LRUCache(app.config.get('IDENTITY_CACHE_SIZE', DEFAULT_SIZE))
+        app.extensions['identity_cache'] = self
+
+    def load(self, user_id):
+        """User with this id, or None"""
+        users = g.setdefault('identities', {})
+        if user_id in users:
+            return users[user_id]
+
+        values = self.entries.get(user_id) if self.ttl else None
+        if values is None:
+            user = db.session.get(User, user_id)
+            if user is not None and self.ttl:
+                self.entries.set(user_id, _column_values(user), self.ttl)
+        else:
+            user = _attach(values)
+
+        users[user_id] = user
+        return user
+
+    def forget(self, user_id):
+        """Drop the user when the current transaction commits.
+
+        Dropping it earlier would let a concurrent request cache the old row
+        again before the change is visible.
+        """
+        db.session.info.setdefault('forgotten_users', set()).add(user_id)
+        g.get('identities', {}).pop(user_id, None)
+
+
+def _column_values(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def _attach(values):
+    """Persistent User in the current session built from cached column values"""
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+identity_cache = IdentityCache()
+
+
+@event.listens_for(Session, 'after_commit')
+def forget_committed_users(session):
+    user_ids = session.info.pop('forgotten_users', None)
+    if user_ids and has_app_context():
+        cache = current_app.extensions.get('identity_cache')
+        if cache:
+            for user_id in user_ids:
+                cache.entries.delete(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def keep_rolled_back_users(session):
+    session.info.pop('forgotten_users', None)
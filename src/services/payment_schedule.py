@@ -0,0 +1,126 @@
+from collections import Counter
+from src.models import db
+from src.models.changes import record_changes, DELETE
+from src.models.job import WorkshopJob
+from src.models.payment import Payment, PaymentRule, ANY_TYPE, DEFAULT_PAYMENT_RULES
+
+# Jobs handled per round trip by regenerate_schedules, well inside the bound
+# parameter limits of SQLite and PostgreSQL
+BATCH_SIZE = 500
+
+JOB_COLUMNS = [
+    WorkshopJob.id, WorkshopJob.job_price, WorkshopJob.cabinetry_type,
+    WorkshopJob.booking_date, WorkshopJob.build_start_date, WorkshopJob.fitting_date
+]
+PAYMENT_COLUMNS = [Payment.job_id, Payment.type, Payment.amount, Payment.due_date, Payment.status]
+
+
+def load_rules():
+    """{cabinetry_type: [(type, share, due)]} from payment_rules, in payment order"""
+    rules = {}
+    for rule in PaymentRule.query.order_by(PaymentRule.cabinetry_type, PaymentRule.position, PaymentRule.id):
+        rules.setdefault(rule.cabinetry_type, []).append((rule.type, rule.share, rule.due))
+    return rules or DEFAULT_PAYMENT_RULES
+
+
+def rules_for(rules, cabinetry_type):
+    return rules.get((cabinetry_type or '').lower(), rules.get(ANY_TYPE, []))
+
+
+def planned_payments(job, rules):
+    """(type, amount, due_date) of each payment the rules give a job (or a job row)"""
+    return [
+        (type, job.job_price * share, getattr(job, due))
+        for type, share, due in rules_for(rules, job.cabinetry_type)
+    ]
+
+
+def _matches(current, planned):
+    """Whether the existing payments are exactly the planned ones, whatever their status"""
+    def key(payments):
+        return Counter((type, round(amount, 6), due_date) for type, amount, due_date in payments)
+    return key((payment.type, payment.amount, payment.due_date) for payment in current) == key(planned)
+
+
+def write_schedules(job_ids, planned):
+    """Replace the payments of the jobs with {job_id: planned payments}.
+
+    One bulk DELETE and one INSERT; the ids on either side go to the change log.
+    """
+    if not job_ids:
+        return
+    payments = Payment.query.filter(Payment.job_id.in_(job_ids))
+    record_changes('payments', [payment_id for payment_id, in payments.with_entities(Payment.id)], DELETE)
+    payments.delete(synchronize_session='fetch')
+    rows = [
+        {'job_id': job_id, 'type': type, 'amount': amount, 'due_date': due_date, 'status': 'Due'}
+        for job_id in job_ids
+        for type, amount, due_date in planned[job_id]
+    ]
+    if rows:
+        db.session.execute(db.insert(Payment), rows)
+        record_changes('payments', [payment_id for payment_id, in payments.with_entities(Payment.id)])
+
+
+def regenerate_job_schedule(job, rules=None):
+    """Give one job the payment schedule of the rules.
+
+    Does nothing for a job without a price or whose payments already match,
+    so editing a job without changing its price or dates writes nothing.
+    Returns whether the payments were replaced.
+    """
+    if not job.job_price:
+        return False
+    if job.id is None:
+        db.session.flush()  # The payments need the new job's id
+
+    planned = planned_payments(job, rules or load_rules())
+    current = db.session.query(*PAYMENT_COLUMNS).filter(Payment.job_id == job.id).all()
+    if _matches(current, planned):
+        return False
+
+    write_schedules([job.id], {job.id: planned})
+    db.session.expire(job, ['payments'])
+    return True
+
+
+def regenerate_schedules(job_ids=None, include_paid=False):
+    """Re-derive the payment schedules of many jobs from the rules, e.g. after a rule change.
+
+    Covers every priced job that is not finished, or the given jobs. Jobs
+    whose payments already match are skipped, and so are jobs with a paid
+    payment unless include_paid, as regenerating would discard the payment
+    record. Works BATCH_SIZE jobs at a time with one SELECT of their payments
+    and one bulk DELETE and INSERT; the caller commits, so a whole run is a
+    single transaction.
+    """
+    rules = load_rules()
+    query = db.session.query(*JOB_COLUMNS).filter(WorkshopJob.job_price > 0)
+    if job_ids is None:
+        query = query.filter(WorkshopJob.stage != 'Finished')
+    else:
+        query = query.filter(WorkshopJob.id.in_(job_ids))
+    jobs = query.order_by(WorkshopJob.id).all()
+
+    counts = {'jobs': len(jobs), 'regenerated': 0, 'unchanged': 0, 'skipped_paid': 0}
+    for start in range(0, len(jobs), BATCH_SIZE):
+        batch = jobs[start:start + BATCH_SIZE]
+        current = {}
+        for payment in db.session.query(*PAYMENT_COLUMNS).filter(Payment.job_id.in_([job.id for job in batch])):
+            current.setdefault(payment.job_id, []).append(payment)
+
+        planned = {}
+        for job in batch:
+            payments = current.get(job.id, [])
+            if not include_paid and any(payment.status == 'Paid' for payment in payments):
+                counts['skipped_paid'] += 1
+                continue
+            schedule = planned_payments(job, rules)
+            if _matches(payments, schedule):
+                counts['unchanged'] += 1
+                continue
+            planned[job.id] = schedule
+
+        write_schedules(list(planned), planned)
+        counts['regenerated'] += len(planned)
+    return counts
@@ -0,0 +1,212 @@
+from datetime import datetime
+from src.models import db
+from src.models.changes import record_changes
+from src.models.job import WorkshopJob, RESCHEDULED_PAYMENTS
+from src.models.job_assignment import JobAssignment
+from src.models.payment import Payment
+from src.models.rollup import JOB_COLUMNS, apply_bulk_changes
+from src.services.staff_calendar import StaffCalendar, invalidate_staff_calendar
+
+# Jobs per UPDATE statement; each job adds a few bound parameters per column
+BATCH_SIZE = 500
+
+# Columns that decide a job's stage windows
+SCHEDULE_COLUMNS = [
+    'id', 'stage', 'build_start_date', 'build_duration_days',
+    'estimated_build_days', 'fitting_date', 'estimated_fitting_days'
+]
+# Columns a reschedule writes, stage windows included
+DATE_COLUMNS = [
+    'build_start_date', 'fitting_date',
+    'build_end_date', 'spray_start_date', 'spray_end_date', 'fit_start_date', 'fit_end_date'
+]
+
+
+def moved_copy(job, build_start_date=None, fitting_date=None):
+    """Transient copy of the job with the new dates and its stage windows recomputed"""
+    moved = WorkshopJob(**{column: getattr(job, column) for column in SCHEDULE_COLUMNS})
+    moved.build_start_date = build_start_date or job.build_start_date
+    moved.fitting_date = fitting_date or job.fitting_date
+    moved.update_stage_windows()
+    return moved
+
+
+def reschedule_conflicts(moves):
+    """Staff conflicts of the new windows of every moved job, checked together.
+
+    moves is [(job, moved copy)]. Each assigned Build Team and Fit Team member
+    is checked for absences, for the stored windows of their jobs that are not
+    moving, and for the new windows of their other moved jobs, all against a
+    single calendar load.
+    """
+    windows = {}
+    for job, moved in moves:
+        windows[job.id] = {'Build Team': moved.build_window(), 'Fit Team': moved.fit_window()}
+
+    assignments = JobAssignment.query.filter(
+        JobAssignment.job_id.in_(list(windows)),
+        JobAssignment.role.in_(['Build Team', 'Fit Team'])
+    ).all()
+    checks = [
+        (assignment, windows[assignment.job_id][assignment.role])
+        for assignment in assignments if windows[assignment.job_id][assignment.role]
+    ]
+    if not checks:
+        return []
+
+    calendar = StaffCalendar.load(
+        min(window[0] for _, window in checks),
+        max(window[1] for _, window in checks),
+        user_ids=list({assignment.user_id for assignment, _ in checks})
+    )
+    conflicts = []
+    for assignment, (start_date, end_date) in checks:
+        conflict = _moved_assignment(assignment, start_date, end_date)
+        for absence in calendar.absences(assignment.user_id, start_date, end_date):
+            conflicts.append(dict(
+                conflict,
+                type='absence',
+                absence_id=absence.id,
+                absence_type=absence.type,
+                absence_start_date=absence.start_date.isoformat(),
+                absence_end_date=absence.end_date.isoformat()
+            ))
+        # Stored windows only hold for jobs that stay where they are
+        for other, other_start, other_end in calendar.assignments(assignment.user_id, start_date, end_date):
+            if other.job_id not in windows:
+                conflicts.append(dict(
+                    conflict, type='assignment', **_other_assignment(other, other_start, other_end)
+                ))
+
+    # Moved jobs against each other, by their new windows
+    by_user = {}
+    for assignment, window in checks:
+        by_user.setdefault(assignment.user_id, []).append((window, assignment))
+    for user_checks in by_user.values():
+        user_checks.sort(key=lambda check: (check[0], check[1].id))
+        for i, ((start_date, end_date), assignment) in enumerate(user_checks):
+            for (other_start, other_end), other in user_checks[i + 1:]:
+                if other_start > end_date:
+                    break
+                if other.job_id != assignment.job_id:
+                    conflicts.append(dict(
+                        _moved_assignment(assignment, start_date, end_date),
+                        type='assignment', **_other_assignment(other, other_start, other_end)
+                    ))
+
+    conflicts.sort(key=lambda conflict: (conflict['job_id'], conflict['start_date'], conflict['user_id']))
+    return conflicts
+
+
+def _moved_assignment(assignment, start_date, end_date):
+    """Conflict fields describing an assignment of a moved job and its new window"""
+    return {
+        'job_id': assignment.job_id,
+        'user_id': assignment.user_id,
+        'role': assignment.role,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat()
+    }
+
+
+def _other_assignment(assignment, start_date, end_date):
+    """Conflict fields describing the assignment a new window collides with"""
+    return {
+        'assignment_id': assignment.id,
+        'assignment_job_id': assignment.job_id,
+        'assignment_role': assignment.role,
+        'assignment_start_date': start_date.isoformat(),
+        'assignment_end_date': end_date.isoformat()
+    }
+
+
+def _by_job(column, values):
+    """CASE job id WHEN ... THEN value, typed like the column it is written to"""
+    return db.case(
+        {job_id: db.literal(value, column.type) for job_id, value in values.items()},
+        value=WorkshopJob.id
+    )
+
+
+def apply_reschedule(moves):
+    """Write the new dates of [(job, moved copy)] with set-based UPDATEs.
+
+    Per batch, one UPDATE sets every job's dates, stage windows and client
+    update flags, and one UPDATE per job date realigns the payments in
+    RESCHEDULED_PAYMENTS. Bulk UPDATEs skip the ORM events, so the stage
+    windows come from the moved copies and the rollups are adjusted here.
+    """
+    now = datetime.utcnow()
+    rollup_changes = []
+    for start in range(0, len(moves), BATCH_SIZE):
+        batch = moves[start:start + BATCH_SIZE]
+        job_ids = [job.id for job, _ in batch]
+
+        # A changed fitting date flags the client for an update, as in WorkshopJob.reschedule
+        flagged = [job.id for job, moved in batch if moved.fitting_date != job.fitting_date]
+        values = {
+            column: _by_job(getattr(WorkshopJob, column), {job.id: getattr(moved, column) for job, moved in batch})
+            for column in DATE_COLUMNS
+        }
+        if flagged:
+            values['client_needs_update'] = db.case(
+                (WorkshopJob.id.in_(flagged), db.true()), else_=WorkshopJob.client_needs_update
+            )
+            values['client_contacted'] = db.case(
+                (WorkshopJob.id.in_(flagged), db.false()), else_=WorkshopJob.client_contacted
+            )
+        db.session.execute(
+            db.update(WorkshopJob).where(WorkshopJob.id.in_(job_ids)).values(updated_at=now, **values),
+            execution_options={'synchronize_session': False}
+        )
+        record_changes('workshop_jobs', job_ids)
+
+        for date_column in set(RESCHEDULED_PAYMENTS.values()):
+            types = [type for type, column in RESCHEDULED_PAYMENTS.items() if column == date_column]
+            due_dates = {job.id: getattr(moved, date_column) for job, moved in batch}
+            db.session.execute(
+                db.update(Payment).where(Payment.job_id.in_(job_ids), Payment.type.in_(types)).values(
+                    due_date=db.case(
+                        {job_id: db.literal(due_date, Payment.due_date.type) for job_id, due_date in due_dates.items()},
+                        value=Payment.job_id
+                    ),
+                    updated_at=now
+                ),
+                execution_options={'synchronize_session': False}
+            )
+        record_changes('payments', [payment_id for payment_id, in db.session.query(Payment.id).filter(
+            Payment.job_id.in_(job_ids), Payment.type.in_(list(RESCHEDULED_PAYMENTS))
+        )])
+
+        for job, moved in batch:
+            if job.id in flagged and not job.client_needs_update:
+                before = {column: getattr(job, column) for column in JOB_COLUMNS}
+                rollup_changes.append((before, dict(before, client_needs_update=True)))
+
+    apply_bulk_changes(WorkshopJob, rollup_changes)
+    # The loaded jobs and payments no longer match the database
+    db.session.expire_all()
+    invalidate_staff_calendar()
+
+
+def changed_rows(job_ids):
+    """The rescheduled jobs and their realigned payments, as written"""
+    jobs = db.session.query(
+        WorkshopJob.id, WorkshopJob.name, WorkshopJob.client_needs_update, WorkshopJob.client_contacted,
+        WorkshopJob.updated_at, *[getattr(WorkshopJob, column) for column in DATE_COLUMNS]
+    ).filter(WorkshopJob.id.in_(job_ids)).order_by(WorkshopJob.id)
+    payments = db.session.query(
+        Payment.id, Payment.job_id, Payment.type, Payment.due_date, Payment.status
+    ).filter(
+        Payment.job_id.in_(job_ids), Payment.type.in_(list(RESCHEDULED_PAYMENTS))
+    ).order_by(Payment.job_id, Payment.id)
+
+    def serialize(row):
+        return {
+            key: value.isoformat() if hasattr(value, 'isoformat') else value
+            for key, value in row._asdict().items()
+        }
+    return {
+        'jobs': [serialize(row) for row in jobs],
+        'payments': [serialize(row) for row in payments]
+    }
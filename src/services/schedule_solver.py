@@ -0,0 +1,330 @@
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from src.models.job import WorkshopJob, SPRAY_DAYS, DEFAULT_BUILD_DAYS, DEFAULT_FITTING_DAYS
+from src.models.job_assignment import JobAssignment
+from src.models.user import User
+from src.services.assignment_optimizer import BUILD_ROLES, FIT_ROLES
+from src.services.staff_calendar import StaffCalendar
+
+# Cost weights. Every crew-day in a week adds to that week's squared load, so
+# moving work from a heavy week to a light one always pays; load above the
+# week's staff capacity is penalised much harder. Each day a fit lands after
+# the date booked with the client costs LATENESS_WEIGHT, and moving a job at
+# all costs a little so stable plans are preferred.
+OVERLOAD_WEIGHT = 100
+LATENESS_WEIGHT = 50
+MOVE_WEIGHT = 1
+CONFLICT_WEIGHT = 10 ** 6  # build not finished in time for a confirmed fit
+
+SHIFTS = [-14, -7, -5, -3, -2, -1, 1, 2, 3, 5, 7, 14]
+DEFAULT_TIME_BUDGET = 2.0
+MAX_TIME_BUDGET = 10.0
+STALL_ITERATIONS = 20000
+HORIZON_SLACK_DAYS = 90
+
+
+class PlannedJob:
+    """In-memory copy of a job's scheduling fields; dates are day offsets from today"""
+
+    def __init__(self, job, today):
+        self.id = job.id
+        self.name = job.name
+        self.build_days = job.build_duration_days or job.estimated_build_days or DEFAULT_BUILD_DAYS
+        self.fitting_days = job.estimated_fitting_days or DEFAULT_FITTING_DAYS
+        self.builders = job.required_builders()
+        self.current_build_start = job.build_start_date
+        self.current_fitting_date = job.fitting_date
+        self.booked_fit = (job.fitting_date - today).days if job.fitting_date else None
+        self.fit_fixed = job.fitting_date_status == 'Confirmed' and job.fitting_date is not None
+        # Only jobs that have not started yet can be moved
+        self.movable = job.stage in ['Not Started', 'Planned'] and (
+            job.build_start_date is None or job.build_start_date > today
+        )
+
+        if job.build_start_date:
+            self.start = (job.build_start_date - today).days
+        elif self.booked_fit is not None:
+            self.start = max(1, self.booked_fit - self.build_days - SPRAY_DAYS)
+        else:
+            self.start = 1
+        self.original_start = self.start
+        self.fit = self.booked_fit if self.booked_fit is not None else self.earliest_fit(self.start)
+        self.team = []  # (user_id, role) of the assigned Build Team and Fit Team
+
+    def earliest_fit(self, start):
+        # Fit starts the day after spray, see WorkshopJob.schedule_windows
+        return start + self.build_days + SPRAY_DAYS
+
+    def team_windows(self, start, fit):
+        """Day spans each assigned role occupies, as JobAssignment.window would once applied.
+
+        A movable job gets both dates written when its plan is applied; other
+        jobs only occupy the dates they already have.
+        """
+        return {
+            'Build Team': (start, start + self.build_days) if self.movable or self.current_build_start else None,
+            'Fit Team': (fit, fit + self.fitting_days) if self.movable or self.booked_fit is not None else None
+        }
+
+    def crew_days(self, start, fit):
+        """(day, crew) spans this job occupies: builders over the build, one fitter over the fit"""
+        return [
+            (start, start + self.build_days, self.builders),
+            (fit, fit + self.fitting_days, 1)
+        ]
+
+    def own_cost(self, start, fit):
+        """Cost terms that only depend on this job"""
+        cost = MOVE_WEIGHT * abs(start - self.original_start)
+        if self.booked_fit is not None and fit > self.booked_fit:
+            cost += LATENESS_WEIGHT * (fit - self.booked_fit)
+        if fit < self.earliest_fit(start):
+            cost += CONFLICT_WEIGHT * (self.earliest_fit(start) - fit)
+        return cost
+
+
+class ScheduleSolver:
+    """What-if scheduler that levels weekly workshop load across open jobs.
+
+    Works on a snapshot of every unfinished job and never writes to the
+    database. Jobs that have not started are moved by local search (simulated
+    annealing) over build start and fitting dates: confirmed fitting dates stay
+    put, other fits move with their build or on their own. Weekly capacity is
+    the number of staff-days not lost to absences, and no move puts a job's
+    assigned staff into an absence or onto another of their jobs, so a plan
+    passes the conflict checks of apply. The search stops at the time budget
+    and returns the best plan found so far.
+    """
+
+    def __init__(self, today=None, seed=0):
+        self.today = today or datetime.now().date()
+        self.random = random.Random(seed)
+
+        jobs = WorkshopJob.query.filter(WorkshopJob.stage != 'Finished').order_by(WorkshopJob.id).all()
+        self.jobs = [PlannedJob(job, self.today) for job in jobs]
+        self.movable = [job for job in self.jobs if job.movable]
+
+        by_id = {job.id: job for job in self.jobs}
+        self.staff_jobs = {}  # user_id: [(planned job, role)]
+        assignments = JobAssignment.query.with_entities(
+            JobAssignment.job_id, JobAssignment.user_id, JobAssignment.role
+        ).filter(
+            JobAssignment.job_id.in_(list(by_id)),
+            JobAssignment.role.in_(['Build Team', 'Fit Team'])
+        )
+        for job_id, user_id, role in assignments:
+            by_id[job_id].team.append((user_id, role))
+            self.staff_jobs.setdefault(user_id, []).append((by_id[job_id], role))
+
+        last_day = max([job.fit + job.fitting_days for job in self.jobs] + [0])
+        self.horizon = last_day + HORIZON_SLACK_DAYS
+        self.week_offset = self.today.weekday()  # weeks run Monday to Sunday
+        weeks = self.week_of(self.horizon) + 1
+
+        self.capacity = self.load_capacity(weeks)
+        self.load = [0] * weeks
+        for job in self.jobs:
+            for week, crew_days in self.week_contributions(job, job.start, job.fit).items():
+                self.load[week] += crew_days
+
+    def week_of(self, day):
+        return (day + self.week_offset) // 7
+
+    def load_capacity(self, weeks):
+        """Staff-days available per week after absences.
+
+        Also keeps the absence calendar, of the assigned staff too, for the
+        moves to be checked against.
+        """
+        end_date = self.today + timedelta(days=self.horizon)
+        staff = User.query.filter(User.role.in_(set(BUILD_ROLES + FIT_ROLES))).all()
+        self.calendar = calendar = StaffCalendar.load(
+            self.today, end_date, user_ids=list({user.id for user in staff} | set(self.staff_jobs))
+        )
+
+        daily = [len(staff)] * (self.horizon + 1)
+        for user in staff:
+            absent_days = set()
+            for absence in calendar.absences(user.id, self.today, end_date):
+                first_day = max((absence.start_date - self.today).days, 0)
+                last_day = min((absence.end_date - self.today).days, self.horizon)
+                absent_days.update(range(first_day, last_day + 1))
+            for day in absent_days:
+                daily[day] -= 1
+
+        capacity = [0] * weeks
+        for day, available in enumerate(daily):
+            capacity[self.week_of(day)] += available
+        return capacity
+
+    def week_contributions(self, job, start, fit):
+        """Crew-days the job adds to each week inside the horizon"""
+        weeks = {}
+        for first_day, last_day, crew in job.crew_days(start, fit):
+            for day in range(max(first_day, 0), min(last_day, self.horizon) + 1):
+                week = self.week_of(day)
+                weeks[week] = weeks.get(week, 0) + crew
+        return weeks
+
+    def week_cost(self, week, load):
+        overload = max(0, load - self.capacity[week])
+        return load * load + OVERLOAD_WEIGHT * overload * overload
+
+    def total_cost(self):
+        return (
+            sum(self.week_cost(week, load) for week, load in enumerate(self.load))
+            + sum(job.own_cost(job.start, job.fit) for job in self.jobs)
+        )
+
+    def move_delta(self, job, start, fit):
+        """Change in total cost if the job moved to (start, fit), with the per-week load changes"""
+        changes = {}
+        for week, crew_days in self.week_contributions(job, job.start, job.fit).items():
+            changes[week] = changes.get(week, 0) - crew_days
+        for week, crew_days in self.week_contributions(job, start, fit).items():
+            changes[week] = changes.get(week, 0) + crew_days
+
+        delta = job.own_cost(start, fit) - job.own_cost(job.start, job.fit)
+        for week, change in changes.items():
+            if change:
+                delta += self.week_cost(week, self.load[week] + change) - self.week_cost(week, self.load[week])
+        return delta, changes
+
+    def propose_move(self, job):
+        """Random neighbouring (start, fit) for the job, or None if the move is not allowed"""
+        shift = self.random.choice(SHIFTS)
+        if job.fit_fixed:
+            # Only the build can move, and it must stay finished before the fit
+            start, fit = job.start + shift, job.fit
+            if start > fit - job.build_days - SPRAY_DAYS and shift > 0:
+                return None
+        elif job.booked_fit is not None and self.random.random() < 0.3:
+            # Move the fit on its own
+            start, fit = job.start, max(job.fit + shift, job.earliest_fit(job.start))
+        else:
+            start, fit = job.start + shift, job.fit + shift
+            fit = max(fit, job.earliest_fit(start))
+        if start < 1 or fit + job.fitting_days > self.horizon or (start, fit) == (job.start, job.fit):
+            return None
+        if self.staff_conflict(job, start, fit):
+            return None
+        return start, fit
+
+    def staff_conflict(self, job, start, fit):
+        """Whether at (start, fit) an assigned staff member would be absent or on another job at once"""
+        windows = job.team_windows(start, fit)
+        for user_id, role in job.team:
+            window = windows[role]
+            if not window:
+                continue
+            if self.calendar.absences(user_id, self.date_of(window[0]), self.date_of(window[1])):
+                return True
+            for other, other_role in self.staff_jobs[user_id]:
+                if other is job:
+                    continue
+                other_window = other.team_windows(other.start, other.fit)[other_role]
+                if other_window and other_window[0] <= window[1] and window[0] <= other_window[1]:
+                    return True
+        return False
+
+    def pick_job(self):
+        """Random movable job, biased towards ones working in the most loaded week"""
+        busiest = max(range(len(self.load)), key=lambda week: self.load[week] - self.capacity[week])
+        candidates = [self.random.choice(self.movable) for _ in range(8)]
+        for job in candidates:
+            if busiest in self.week_contributions(job, job.start, job.fit):
+                return job
+        return candidates[0]
+
+    def solve(self, time_budget=DEFAULT_TIME_BUDGET):
+        started = time.monotonic()
+        deadline = started + time_budget
+        before = self.metrics()
+
+        cost = self.total_cost()
+        best_cost = cost
+        best = {job.id: (job.start, job.fit) for job in self.movable}
+        temperature = 50.0
+        iterations = 0
+        since_improvement = 0
+        timed_out = False
+
+        while self.movable and since_improvement < STALL_ITERATIONS:
+            if iterations % 100 == 0 and time.monotonic() >= deadline:
+                timed_out = True
+                break
+            iterations += 1
+            since_improvement += 1
+            temperature = max(temperature * 0.9995, 0.01)
+
+            job = self.pick_job()
+            move = self.propose_move(job)
+            if not move:
+                continue
+            delta, changes = self.move_delta(job, *move)
+            if delta < 0 or self.random.random() < math.exp(-delta / temperature):
+                for week, change in changes.items():
+                    self.load[week] += change
+                job.start, job.fit = move
+                cost += delta
+                if cost < best_cost:
+                    best_cost = cost
+                    best = {job.id: (job.start, job.fit) for job in self.movable}
+                    since_improvement = 0
+
+        # Restore the best plan found
+        for job in self.movable:
+            for week, crew_days in self.week_contributions(job, job.start, job.fit).items():
+                self.load[week] -= crew_days
+            job.start, job.fit = best[job.id]
+            for week, crew_days in self.week_contributions(job, job.start, job.fit).items():
+                self.load[week] += crew_days
+
+        return {
+            'jobs': self.proposals(),
+            'before': before,
+            'after': self.metrics(),
+            'iterations': iterations,
+            'elapsed_seconds': round(time.monotonic() - started, 3),
+            'timed_out': timed_out
+        }
+
+    def date_of(self, day):
+        return self.today + timedelta(days=day)
+
+    def proposals(self):
+        proposals = []
+        for job in self.movable:
+            build_start = self.date_of(job.start)
+            fitting_date = self.date_of(job.fit)
+            if build_start == job.current_build_start and fitting_date == job.current_fitting_date:
+                continue
+            # Moves never add conflicts, but a job left where it was can already
+            # have some, and would only be listed for the dates it lacks
+            if self.staff_conflict(job, job.start, job.fit):
+                continue
+            proposals.append({
+                'job_id': job.id,
+                'job_name': job.name,
+                'current_build_start_date': job.current_build_start.isoformat() if job.current_build_start else None,
+                'proposed_build_start_date': build_start.isoformat(),
+                'current_fitting_date': job.current_fitting_date.isoformat() if job.current_fitting_date else None,
+                'proposed_fitting_date': fitting_date.isoformat(),
+                'days_late': max(0, job.fit - job.booked_fit) if job.booked_fit is not None else 0
+            })
+        return proposals
+
+    def metrics(self):
+        utilisation = [
+            load / capacity for load, capacity in zip(self.load, self.capacity) if capacity
+        ]
+        return {
+            'peak_weekly_load': max(self.load) if self.load else 0,
+            'peak_weekly_utilisation': round(max(utilisation), 3) if utilisation else 0,
+            'overloaded_crew_days': sum(max(0, load - capacity) for load, capacity in zip(self.load, self.capacity)),
+            'total_days_late': sum(
+                max(0, job.fit - job.booked_fit) for job in self.jobs if job.booked_fit is not None
+            )
+        }
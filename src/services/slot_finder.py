@@ -0,0 +1,125 @@
+from datetime import timedelta
+from src.models.job import DEFAULT_BUILD_DAYS, DEFAULT_FITTING_DAYS, SPRAY_DAYS
+from src.models.user import User
+from src.services.assignment_optimizer import BUILD_ROLES, FIT_ROLES
+from src.services.staff_calendar import StaffCalendar
+from src.services.workload import staff_workloads, workload_key
+
+DEFAULT_HORIZON_DAYS = 365
+
+
+def day_bits(first_day, last_day):
+    """Bitset with bits first_day..last_day set"""
+    return ((1 << (last_day - first_day + 1)) - 1) << first_day
+
+
+def run_mask(free, length):
+    """Bit d is set if days d .. d+length-1 are all set in free"""
+    result = free
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        result &= result >> step
+        covered += step
+    return result
+
+
+def at_least(masks, count):
+    """Bits set in at least `count` of the masks (bit-parallel counting up to count)"""
+    # levels[k] holds bits seen in at least k+1 masks so far
+    levels = [0] * count
+    for mask in masks:
+        for k in range(count - 1, 0, -1):
+            levels[k] |= levels[k - 1] & mask
+        levels[0] |= mask
+    return levels[count - 1] if count else -1
+
+
+def set_bits(mask, limit):
+    """Indexes of the lowest `limit` set bits"""
+    bits = []
+    while mask and len(bits) < limit:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
+
+
+class SlotFinder:
+    """Finds the earliest dates a new job could start with a full team free.
+
+    Each staff member's availability over the horizon is a day-indexed bitset
+    (bit d = free on start_date + d), cleared for absences and existing
+    assignment windows. A job needs its builders free for the whole build
+    window and a fitter free for the fit window, which starts SPRAY_DAYS after
+    the build ends, as in WorkshopJob.schedule_windows.
+    """
+
+    def __init__(self, start_date, horizon_days=DEFAULT_HORIZON_DAYS):
+        self.start_date = start_date
+        self.horizon_days = horizon_days
+        end_date = start_date + timedelta(days=horizon_days - 1)
+
+        self.staff = User.query.filter(User.role.in_(set(BUILD_ROLES + FIT_ROLES))).order_by(User.id).all()
+        calendar = StaffCalendar.load(start_date, end_date, user_ids=[user.id for user in self.staff])
+
+        full = day_bits(0, horizon_days - 1)
+        self.free = {}
+        for user in self.staff:
+            busy = 0
+            for absence in calendar.absences(user.id, start_date, end_date):
+                busy |= self.bits_for(absence.start_date, absence.end_date)
+            for _, start, end in calendar.assignments(user.id, start_date, end_date):
+                busy |= self.bits_for(start, end)
+            self.free[user.id] = full & ~busy
+
+    def bits_for(self, start, end):
+        first_day = max((start - self.start_date).days, 0)
+        last_day = min((end - self.start_date).days, self.horizon_days - 1)
+        return day_bits(first_day, last_day) if first_day <= last_day else 0
+
+    def find(self, build_days=None, fitting_days=None, builders=1, count=5):
+        """Earliest `count` feasible build start dates with candidate teams"""
+        build_days = build_days or DEFAULT_BUILD_DAYS
+        fitting_days = fitting_days or DEFAULT_FITTING_DAYS
+        fit_offset = build_days + SPRAY_DAYS
+
+        # Windows are inclusive of both ends, as in build_window()/fit_window()
+        build_runs = {
+            user.id: run_mask(self.free[user.id], build_days + 1)
+            for user in self.staff if user.role in BUILD_ROLES
+        }
+        fit_runs = {
+            user.id: run_mask(self.free[user.id], fitting_days + 1) >> fit_offset
+            for user in self.staff if user.role in FIT_ROLES
+        }
+
+        feasible = at_least(build_runs.values(), builders) & at_least(fit_runs.values(), 1)
+        days = set_bits(feasible, count)
+        if not days:
+            return []
+
+        workloads = staff_workloads(roles=list(set(BUILD_ROLES + FIT_ROLES)))
+        by_workload = workload_key(workloads)
+
+        slots = []
+        for day in days:
+            build_start = self.start_date + timedelta(days=day)
+            fitting_date = build_start + timedelta(days=fit_offset)
+            build_team = sorted(
+                (user for user in self.staff if build_runs.get(user.id, 0) >> day & 1), key=by_workload
+            )
+            fit_team = sorted(
+                (user for user in self.staff if fit_runs.get(user.id, 0) >> day & 1), key=by_workload
+            )
+            slots.append({
+                'build_start_date': build_start.isoformat(),
+                'build_end_date': (build_start + timedelta(days=build_days)).isoformat(),
+                'fitting_date': fitting_date.isoformat(),
+                'fitting_end_date': (fitting_date + timedelta(days=fitting_days)).isoformat(),
+                'build_team_candidates': [{'user_id': user.id, 'name': user.full_name} for user in build_team],
+                'fit_team_candidates': [{'user_id': user.id, 'name': user.full_name} for user in fit_team],
+                'suggested_build_team': [user.id for user in build_team[:builders]],
+                'suggested_fit_team': [user.id for user in fit_team[:1]]
+            })
+        return slots
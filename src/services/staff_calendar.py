@@ -0,0 +1,145 @@
+from flask import g
+from sqlalchemy.orm import contains_eager
+from src.models import db
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.staff_absence import StaffAbsence
+
+
+class IntervalIndex:
+    """Static index of closed date intervals answering overlap queries.
+
+    Intervals are sorted by start and treated as an implicit balanced binary
+    tree (the middle element of each range is its root), where each node also
+    stores the latest end date in its subtree. Queries skip subtrees that end
+    before the query starts or begin after it ends, so an overlap query costs
+    O(log n + k) for k matches instead of a scan of every interval.
+    """
+
+    def __init__(self, intervals):
+        # intervals: iterable of (start, end, payload)
+        self._items = sorted(intervals, key=lambda item: (item[0], item[1]))
+        self._max_end = [None] * len(self._items)
+        self._build(0, len(self._items) - 1)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _build(self, lo, hi):
+        if lo > hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._items[mid][1]
+        for child_end in (self._build(lo, mid - 1), self._build(mid + 1, hi)):
+            if child_end is not None and child_end > max_end:
+                max_end = child_end
+        self._max_end[mid] = max_end
+        return max_end
+
+    def overlapping(self, start, end):
+        """Return (start, end, payload) for every interval overlapping [start, end], by start"""
+        result = []
+        self._query(0, len(self._items) - 1, start, end, result)
+        return result
+
+    def any_overlapping(self, start, end):
+        return bool(self.overlapping(start, end))
+
+    def _query(self, lo, hi, start, end, result):
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if self._max_end[mid] < start:
+                return
+            self._query(lo, mid - 1, start, end, result)
+            item = self._items[mid]
+            if item[0] > end:
+                # Everything to the right starts even later
+                return
+            if item[1] >= start:
+                result.append(item)
+            lo = mid + 1
+
+
+EMPTY_INDEX = IntervalIndex([])
+
+
+class StaffCalendar:
+    """Per-staff interval indexes of absences and assignment windows.
+
+    Load with StaffCalendar.load(), optionally restricted to a date window; a
+    windowed calendar only answers queries that fall inside that window.
+    """
+
+    def __init__(self, absences, assignments):
+        absence_intervals = {}
+        for absence in absences:
+            absence_intervals.setdefault(absence.user_id, []).append(
+                (absence.start_date, absence.end_date, absence)
+            )
+
+        assignment_intervals = {}
+        for assignment in assignments:
+            window = assignment.window()
+            if window:
+                assignment_intervals.setdefault(assignment.user_id, []).append(
+                    (window[0], window[1], assignment)
+                )
+
+        self._absences = {
+            user_id: IntervalIndex(intervals) for user_id, intervals in absence_intervals.items()
+        }
+        self._assignments = {
+            user_id: IntervalIndex(intervals) for user_id, intervals in assignment_intervals.items()
+        }
+
+    @classmethod
+    def load(cls, start_date=None, end_date=None, user_ids=None):
+        """Load absences and assignments (with their jobs) in two queries"""
+        absence_query = StaffAbsence.query
+        assignment_query = JobAssignment.query.join(JobAssignment.job).options(
+            contains_eager(JobAssignment.job).joinedload(WorkshopJob.client)
+        )
+
+        if start_date and end_date:
+            absence_query = absence_query.filter(
+                StaffAbsence.start_date <= end_date,
+                StaffAbsence.end_date >= start_date
+            )
+            assignment_query = assignment_query.filter(db.or_(
+                db.and_(JobAssignment.role == 'Build Team', WorkshopJob.build_overlaps(start_date, end_date)),
+                db.and_(JobAssignment.role == 'Fit Team', WorkshopJob.fit_overlaps(start_date, end_date))
+            ))
+
+        if user_ids is not None:
+            absence_query = absence_query.filter(StaffAbsence.user_id.in_(user_ids))
+            assignment_query = assignment_query.filter(JobAssignment.user_id.in_(user_ids))
+
+        return cls(absence_query.all(), assignment_query.all())
+
+    def absences(self, user_id, start_date, end_date):
+        """Absences of the user overlapping the dates"""
+        index = self._absences.get(user_id, EMPTY_INDEX)
+        return [absence for _, _, absence in index.overlapping(start_date, end_date)]
+
+    def assignments(self, user_id, start_date, end_date):
+        """(assignment, start, end) for assignment windows of the user overlapping the dates"""
+        index = self._assignments.get(user_id, EMPTY_INDEX)
+        return [(assignment, start, end) for start, end, assignment in index.overlapping(start_date, end_date)]
+
+    def is_available(self, user_id, start_date, end_date):
+        """True if the user has no absence overlapping the dates"""
+        return not self._absences.get(user_id, EMPTY_INDEX).any_overlapping(start_date, end_date)
+
+
+def staff_calendar(start_date=None, end_date=None):
+    """StaffCalendar for the window, built once per request"""
+    calendars = g.setdefault('staff_calendars', {})
+    key = (start_date, end_date)
+    if key not in calendars:
+        calendars[key] = StaffCalendar.load(start_date, end_date)
+    return calendars[key]
+
+
+def invalidate_staff_calendar():
+    """Drop calendars built earlier in this request, e.g. after a write"""
+    g.pop('staff_calendars', None)
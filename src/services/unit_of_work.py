@@ -0,0 +1,35 @@
+from src.models import db
+
+
+class UnitOfWork:
+    """One database transaction per request.
+
+    Views stage their changes in db.session and only flush when they need
+    generated ids or column defaults for the response. After the view
+    returns, everything is committed at once if the response is a success,
+    and rolled back if it is an error (4xx/5xx, including an exception turned
+    into a 500). A commit that fails is rolled back and the request ends in a
+    500 rather than a success that was never stored.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.finish)
+        app.extensions['unit_of_work'] = self
+
+    def finish(self, response):
+        if response.status_code >= 400:
+            db.session.rollback()
+            return response
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return response
+
+
+unit_of_work = UnitOfWork()
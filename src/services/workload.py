@@ -0,0 +1,86 @@
+from datetime import datetime
+from src.models import db
+from src.models.job import WorkshopJob
+from src.models.job_assignment import JobAssignment
+from src.models.staff_absence import StaffAbsence
+from src.models.sql import date_diff
+from src.models.user import User
+
+# Stages in which an assignment does not count towards workload
+INACTIVE_STAGES = ['Finished', 'Not Started']
+
+
+def assignment_end_date():
+    """SQL expression: last day of the window a JobAssignment occupies (see JobAssignment.window)"""
+    return db.case(
+        (JobAssignment.role == 'Build Team', WorkshopJob.build_end_date),
+        (db.and_(JobAssignment.role == 'Fit Team', WorkshopJob.fitting_date.isnot(None)), WorkshopJob.fit_end_date),
+        else_=None
+    )
+
+
+def staff_workloads(roles=None, today=None, user_ids=None):
+    """Workload of every staff member, computed in a single grouped query.
+
+    Returns {user_id: {'user', 'active_assignments', 'remaining_days', 'upcoming_absences'}}
+    in user id order. active_assignments counts assignments on jobs that are in
+    progress; remaining_days sums the days left until each of those assignment
+    windows ends, for weighting workload by how much work is still ahead.
+    user_ids limits the result (and the aggregates) to the given staff.
+    """
+    today = today or datetime.now().date()
+
+    days_left = date_diff(assignment_end_date(), today)
+    remaining_days = db.case((days_left > 0, days_left), else_=0)
+    assignments = db.session.query(
+        JobAssignment.user_id.label('user_id'),
+        db.func.count(JobAssignment.id).label('active_assignments'),
+        db.func.sum(remaining_days).label('remaining_days')
+    ).join(
+        WorkshopJob, JobAssignment.job_id == WorkshopJob.id
+    ).filter(
+        WorkshopJob.stage.notin_(INACTIVE_STAGES)
+    )
+
+    absences = db.session.query(
+        StaffAbsence.user_id.label('user_id'),
+        db.func.count(StaffAbsence.id).label('upcoming_absences')
+    ).filter(
+        StaffAbsence.end_date >= today
+    )
+    if user_ids is not None:
+        assignments = assignments.filter(JobAssignment.user_id.in_(user_ids))
+        absences = absences.filter(StaffAbsence.user_id.in_(user_ids))
+    assignments = assignments.group_by(JobAssignment.user_id).subquery()
+    absences = absences.group_by(StaffAbsence.user_id).subquery()
+
+    query = db.session.query(
+        User,
+        db.func.coalesce(assignments.c.active_assignments, 0),
+        db.func.coalesce(assignments.c.remaining_days, 0),
+        db.func.coalesce(absences.c.upcoming_absences, 0)
+    ).outerjoin(
+        assignments, assignments.c.user_id == User.id
+    ).outerjoin(
+        absences, absences.c.user_id == User.id
+    )
+    if roles is not None:
+        query = query.filter(User.role.in_(roles))
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+
+    return {
+        user.id: {
+            'user': user,
+            'active_assignments': active_assignments,
+            'remaining_days': remaining,
+            'upcoming_absences': upcoming_absences
+        }
+        for user, active_assignments, remaining, upcoming_absences in query.order_by(User.id)
+    }
+
+
+def workload_key(workloads, weighted=False):
+    """Sort key for staff by workload; weighted uses days remaining instead of job count"""
+    field = 'remaining_days' if weighted else 'active_assignments'
+    return lambda user: workloads[user.id][field] if user.id in workloads else 0